@@ -0,0 +1,37 @@
+"""Delta-encoded ASN snapshots
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Snapshots existentes continuam como "full" (conjunto completo de prefixos)
+    op.add_column(
+        'asn_snapshots',
+        sa.Column('snapshot_type', sa.String(length=16), nullable=False, server_default='full')
+    )
+    op.add_column('asn_snapshots', sa.Column('added_prefixes', sa.JSON(), nullable=True))
+    op.add_column('asn_snapshots', sa.Column('removed_prefixes', sa.JSON(), nullable=True))
+    
+    # Snapshots "delta" não armazenam a lista completa
+    op.alter_column('asn_snapshots', 'announced_prefixes', existing_type=sa.JSON(), nullable=True)
+
+
+def downgrade() -> None:
+    # Deltas não podem ser representados no formato antigo sem reconstrução
+    op.execute("DELETE FROM asn_snapshots WHERE snapshot_type = 'delta'")
+    op.alter_column('asn_snapshots', 'announced_prefixes', existing_type=sa.JSON(), nullable=False)
+    op.drop_column('asn_snapshots', 'removed_prefixes')
+    op.drop_column('asn_snapshots', 'added_prefixes')
+    op.drop_column('asn_snapshots', 'snapshot_type')
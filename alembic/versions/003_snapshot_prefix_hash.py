@@ -0,0 +1,41 @@
+"""Prefix set hash for snapshot deduplication
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('asn_snapshots', sa.Column('prefix_hash', sa.String(length=64), nullable=True))
+    op.create_index('idx_asn_prefix_hash', 'asn_snapshots', ['asn', 'prefix_hash'], unique=False)
+    
+    # Preencher o hash dos snapshots completos existentes
+    # Mesmo formato de compute_prefix_hash: prefixos distintos, ordenados, separados por \n
+    op.execute("""
+        UPDATE asn_snapshots s
+        SET prefix_hash = encode(sha256(convert_to(coalesce((
+            SELECT string_agg(d.p, E'\\n' ORDER BY d.p)
+            FROM (
+                SELECT DISTINCT p COLLATE "C" AS p
+                FROM json_array_elements_text(s.announced_prefixes) AS p
+            ) d
+        ), ''), 'UTF8')), 'hex')
+        WHERE s.snapshot_type = 'full' AND s.announced_prefixes IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    # Heartbeats não têm dados de prefixos no formato antigo
+    op.execute("DELETE FROM asn_snapshots WHERE snapshot_type = 'heartbeat'")
+    op.drop_index('idx_asn_prefix_hash', table_name='asn_snapshots')
+    op.drop_column('asn_snapshots', 'prefix_hash')
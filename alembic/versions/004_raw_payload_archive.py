@@ -0,0 +1,122 @@
+"""Compressed raw payload archive
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import gzip
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional; gzip é usado como alternativa
+    zstandard = None
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+COMPRESSION_LEVEL = 3
+
+
+# Codificação copiada de app.utils.payload_codec na data desta revisão, para que
+# a migração não dependa do código da aplicação
+def encode_payload(data):
+    """Retorna (hash do JSON canônico, codificação, bytes comprimidos, tamanho original)"""
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    content_hash = hashlib.sha256(raw).hexdigest()
+    if zstandard is not None:
+        return content_hash, "zstd", zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(raw), len(raw)
+    return content_hash, "gzip", gzip.compress(raw, compresslevel=COMPRESSION_LEVEL), len(raw)
+
+
+def decode_payload(encoding, payload):
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to decode zstd payloads")
+        # decompressobj: frames gravados em streaming não informam o tamanho original
+        return json.loads(zstandard.ZstdDecompressor().decompressobj().decompress(payload))
+    if encoding == "gzip":
+        return json.loads(gzip.decompress(payload))
+    raise ValueError(f"Unknown payload encoding: {encoding}")
+
+
+def upgrade() -> None:
+    op.create_table(
+        'raw_payloads',
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('encoding', sa.String(length=16), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=False),
+        sa.Column('compressed_bytes', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('content_hash')
+    )
+    op.add_column('asn_snapshots', sa.Column('raw_payload_hash', sa.String(length=64), nullable=True))
+
+    # Migrar os payloads inline existentes para o arquivo comprimido, em lotes
+    bind = op.get_bind()
+    raw_payloads = sa.table(
+        'raw_payloads',
+        sa.column('content_hash', sa.String), sa.column('encoding', sa.String),
+        sa.column('payload', sa.LargeBinary), sa.column('size_bytes', sa.Integer),
+        sa.column('compressed_bytes', sa.Integer)
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT id, raw_data FROM asn_snapshots "
+            "WHERE id > :last_id AND raw_data IS NOT NULL ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+
+        for row in rows:
+            content_hash, encoding, payload, size = encode_payload(row.raw_data)
+            bind.execute(
+                postgresql.insert(raw_payloads).values(
+                    content_hash=content_hash, encoding=encoding, payload=payload,
+                    size_bytes=size, compressed_bytes=len(payload)
+                ).on_conflict_do_nothing(index_elements=['content_hash'])
+            )
+            bind.execute(
+                sa.text("UPDATE asn_snapshots SET raw_payload_hash = :hash WHERE id = :id"),
+                {"hash": content_hash, "id": row.id}
+            )
+        last_id = rows[-1].id
+
+    op.drop_column('asn_snapshots', 'raw_data')
+
+
+def downgrade() -> None:
+    op.add_column('asn_snapshots', sa.Column('raw_data', sa.JSON(), nullable=True))
+
+    # Restaurar os payloads inline a partir do arquivo, em lotes por content_hash
+    bind = op.get_bind()
+    last_hash = ""
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT content_hash, encoding, payload FROM raw_payloads "
+            "WHERE content_hash > :last_hash ORDER BY content_hash LIMIT :limit"
+        ), {"last_hash": last_hash, "limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+
+        for row in rows:
+            bind.execute(
+                sa.text("UPDATE asn_snapshots SET raw_data = CAST(:data AS JSON) WHERE raw_payload_hash = :hash"),
+                {"data": json.dumps(decode_payload(row.encoding, row.payload)), "hash": row.content_hash}
+            )
+        last_hash = rows[-1].content_hash
+
+    op.drop_column('asn_snapshots', 'raw_payload_hash')
+    op.drop_table('raw_payloads')
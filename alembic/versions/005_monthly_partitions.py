@@ -0,0 +1,110 @@
+"""Monthly range partitions for historical tables
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+PARTITIONED_TABLES = ('asn_snapshots', 'prefix_history', 'bgp_alerts')
+MONTHS_AHEAD = 3
+
+
+# Funções copiadas de app.database.partitions na data desta revisão, para que
+# a migração não dependa do código da aplicação
+def month_start(value):
+    """Primeiro instante do mês do valor informado"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    """Soma meses a um início de mês"""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    """Nome da partição mensal, ex.: asn_snapshots_y2026m10"""
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def _secondary_indexes(bind, table):
+    """Definições dos índices (exceto a chave primária) para recriação na nova tabela"""
+    return bind.execute(sa.text(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = :table AND indexname <> :pkey"
+    ), {"table": table, "pkey": f"{table}_pkey"}).scalars().all()
+
+
+def _swap_table(bind, table, create_sql, primary_key, after_create=None):
+    """
+    Recria a tabela com a definição informada, preservando dados, sequência do id
+    e índices secundários
+    """
+    indexes = _secondary_indexes(bind, table)
+    legacy = f"{table}_legacy"
+
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    op.execute(create_sql.format(table=table, legacy=legacy))
+    if after_create:
+        after_create()
+
+    op.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+
+    # A sequência do id pertence à tabela antiga; transferir antes de removê-la
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(f"DROP TABLE {legacy}")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({primary_key})")
+    for indexdef in indexes:
+        op.execute(indexdef)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    current = month_start(datetime.now())
+
+    for table in PARTITIONED_TABLES:
+        bounds = bind.execute(sa.text(f"SELECT min(timestamp), max(timestamp) FROM {table}")).first()
+        first = month_start(bounds[0]) if bounds[0] else current
+        last = max(month_start(bounds[1]) if bounds[1] else current, add_months(current, MONTHS_AHEAD))
+
+        def create_partitions(table=table, first=first, last=last):
+            # Partições de todos os meses com dados existentes e dos próximos meses
+            month = first
+            while month <= last:
+                op.execute(
+                    f"CREATE TABLE {partition_name(table, month)} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                )
+                month = add_months(month, 1)
+
+        # A chave primária de uma tabela particionada precisa incluir a coluna de partição
+        _swap_table(
+            bind, table,
+            "CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)",
+            "id, timestamp",
+            create_partitions
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    for table in PARTITIONED_TABLES:
+        # DROP da tabela particionada remove também as partições
+        _swap_table(
+            bind, table,
+            "CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS)",
+            "id"
+        )
@@ -0,0 +1,60 @@
+"""Hourly and daily prefix-count rollups
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = (('asn_stats_hourly', 'hour'), ('asn_stats_daily', 'day'))
+
+
+def upgrade() -> None:
+    for table, unit in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column('asn', sa.Integer(), nullable=False),
+            sa.Column('bucket', sa.DateTime(), nullable=False),
+            sa.Column('snapshot_count', sa.Integer(), nullable=False),
+            sa.Column('prefix_count_sum', sa.BigInteger(), nullable=False),
+            sa.Column('prefix_count_sum_sq', sa.BigInteger(), nullable=False),
+            sa.Column('prefix_count_min', sa.Integer(), nullable=False),
+            sa.Column('prefix_count_max', sa.Integer(), nullable=False),
+            sa.Column('first_timestamp', sa.DateTime(), nullable=False),
+            sa.Column('first_prefix_count', sa.Integer(), nullable=False),
+            sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+            sa.Column('last_prefix_count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('asn', 'bucket')
+        )
+
+        # Popular os rollups com os snapshots existentes
+        op.execute(f"""
+            INSERT INTO {table}
+            SELECT
+                asn,
+                date_trunc('{unit}', timestamp) AS bucket,
+                count(*),
+                sum(prefix_count),
+                sum(prefix_count::bigint * prefix_count),
+                min(prefix_count),
+                max(prefix_count),
+                min(timestamp),
+                (array_agg(prefix_count ORDER BY timestamp))[1],
+                max(timestamp),
+                (array_agg(prefix_count ORDER BY timestamp DESC))[1]
+            FROM asn_snapshots
+            GROUP BY asn, bucket
+        """)
+
+
+def downgrade() -> None:
+    for table, _ in reversed(ROLLUP_TABLES):
+        op.drop_table(table)
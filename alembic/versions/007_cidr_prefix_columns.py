@@ -0,0 +1,37 @@
+"""Native cidr prefix columns with GiST indexes
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+PREFIX_TABLES = ('prefix_history', 'bgp_alerts')
+
+
+def upgrade() -> None:
+    for table in PREFIX_TABLES:
+        # network() zera bits de host eventualmente presentes no texto antigo
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN prefix TYPE cidr USING network(prefix::inet)")
+        op.create_index(
+            f'idx_{table}_prefix_gist', table, ['prefix'],
+            postgresql_using='gist', postgresql_ops={'prefix': 'inet_ops'}
+        )
+
+
+def downgrade() -> None:
+    for table in PREFIX_TABLES:
+        op.drop_index(f'idx_{table}_prefix_gist', table_name=table)
+        op.alter_column(
+            table, 'prefix',
+            type_=sa.String(length=43),
+            postgresql_using='prefix::text'
+        )
@@ -0,0 +1,44 @@
+"""JSONB snapshot prefix arrays with GIN indexes
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+JSONB_COLUMNS = ('announced_prefixes', 'added_prefixes', 'removed_prefixes', 'peer_data')
+GIN_INDEXES = (
+    ('idx_asn_snapshots_announced_gin', 'announced_prefixes'),
+    ('idx_asn_snapshots_added_gin', 'added_prefixes'),
+)
+
+
+def upgrade() -> None:
+    # Uma única reescrita da tabela (e das partições) para todas as colunas
+    op.execute(
+        "ALTER TABLE asn_snapshots " + ", ".join(
+            f"ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb" for column in JSONB_COLUMNS
+        )
+    )
+    for index_name, column in GIN_INDEXES:
+        op.create_index(
+            index_name, 'asn_snapshots', [column],
+            postgresql_using='gin', postgresql_ops={column: 'jsonb_path_ops'}
+        )
+
+
+def downgrade() -> None:
+    for index_name, _ in GIN_INDEXES:
+        op.drop_index(index_name, table_name='asn_snapshots')
+    op.execute(
+        "ALTER TABLE asn_snapshots " + ", ".join(
+            f"ALTER COLUMN {column} TYPE json USING {column}::json" for column in JSONB_COLUMNS
+        )
+    )
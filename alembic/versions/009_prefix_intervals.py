@@ -0,0 +1,60 @@
+"""Prefix presence intervals
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'prefix_intervals',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('asn', sa.Integer(), nullable=False),
+        sa.Column('prefix', postgresql.CIDR(), nullable=False),
+        sa.Column('announced_from', sa.DateTime(), nullable=False),
+        sa.Column('announced_until', sa.DateTime(), nullable=True),
+        sa.Column('data_source', sa.String(length=50), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_prefix_intervals_asn_from', 'prefix_intervals', ['asn', 'announced_from'], unique=False)
+    op.create_index('idx_prefix_intervals_asn_prefix_from', 'prefix_intervals',
+                    ['asn', 'prefix', 'announced_from'], unique=False)
+    op.create_index('uq_prefix_intervals_open', 'prefix_intervals', ['asn', 'prefix'], unique=True,
+                    postgresql_where=sa.text('announced_until IS NULL'))
+
+    # Popular a partir dos eventos já registrados: cada anúncio (após uma
+    # retirada ou sem evento anterior) abre um intervalo até a próxima retirada
+    op.execute("""
+        INSERT INTO prefix_intervals (asn, prefix, announced_from, announced_until, data_source)
+        WITH transitions AS (
+            SELECT asn, prefix, timestamp, is_announced,
+                   lag(is_announced) OVER (PARTITION BY asn, prefix ORDER BY timestamp) AS previous
+            FROM prefix_history
+        ), changes AS (
+            SELECT asn, prefix, timestamp, is_announced,
+                   lead(timestamp) OVER (PARTITION BY asn, prefix ORDER BY timestamp) AS next_change
+            FROM transitions
+            WHERE previous IS DISTINCT FROM is_announced
+        )
+        SELECT asn, prefix, timestamp, next_change, 'ripe'
+        FROM changes
+        WHERE is_announced
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_prefix_intervals_open', table_name='prefix_intervals')
+    op.drop_index('idx_prefix_intervals_asn_prefix_from', table_name='prefix_intervals')
+    op.drop_index('idx_prefix_intervals_asn_from', table_name='prefix_intervals')
+    op.drop_table('prefix_intervals')
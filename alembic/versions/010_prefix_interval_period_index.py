@@ -0,0 +1,27 @@
+"""GiST index on prefix interval periods
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # btree_gist permite combinar a igualdade em asn com a faixa tsrange no mesmo índice GiST
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute("""
+        CREATE INDEX idx_prefix_intervals_asn_period ON prefix_intervals
+        USING gist (asn, tsrange(announced_from, announced_until, '[)'))
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_prefix_intervals_asn_period', table_name='prefix_intervals')
@@ -0,0 +1,52 @@
+"""BRIN timestamp indexes on append-only history tables
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+# Índices B-tree redundantes por tabela: (nome, colunas)
+# - ix_*_timestamp / idx_timestamp_asn: faixas de tempo passam a usar BRIN
+# - ix_*_asn / ix_prefix_history_prefix: prefixo de um índice composto existente
+REDUNDANT_INDEXES = {
+    'asn_snapshots': [
+        ('idx_timestamp_asn', ['timestamp', 'asn']),
+        ('ix_asn_snapshots_timestamp', ['timestamp']),
+        ('ix_asn_snapshots_asn', ['asn']),
+    ],
+    'prefix_history': [
+        ('ix_prefix_history_timestamp', ['timestamp']),
+        ('ix_prefix_history_asn', ['asn']),
+        ('ix_prefix_history_prefix', ['prefix']),
+    ],
+    'bgp_alerts': [
+        ('ix_bgp_alerts_timestamp', ['timestamp']),
+        ('ix_bgp_alerts_asn', ['asn']),
+    ],
+    'system_metrics': [
+        ('ix_system_metrics_timestamp', ['timestamp']),
+    ],
+}
+
+
+def upgrade() -> None:
+    for table, indexes in REDUNDANT_INDEXES.items():
+        for name, _ in indexes:
+            op.execute(f"DROP INDEX IF EXISTS {name}")
+        op.create_index(f'idx_{table}_timestamp_brin', table, ['timestamp'], postgresql_using='brin',
+                        postgresql_with={'pages_per_range': 32, 'autosummarize': 'on'})
+
+
+def downgrade() -> None:
+    for table, indexes in REDUNDANT_INDEXES.items():
+        op.drop_index(f'idx_{table}_timestamp_brin', table_name=table)
+        for name, columns in indexes:
+            op.create_index(name, table, columns, unique=False)
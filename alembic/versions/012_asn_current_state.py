@@ -0,0 +1,83 @@
+"""Latest state per ASN
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'asn_current_state',
+        sa.Column('asn', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('last_snapshot_id', sa.Integer(), nullable=True),
+        sa.Column('last_snapshot_type', sa.String(length=16), nullable=False),
+        sa.Column('prefix_hash', sa.String(length=64), nullable=True),
+        sa.Column('prefix_count', sa.Integer(), nullable=False),
+        sa.Column('ipv4_prefix_count', sa.Integer(), nullable=True),
+        sa.Column('ipv6_prefix_count', sa.Integer(), nullable=True),
+        sa.Column('upstream_count', sa.Integer(), nullable=True),
+        sa.Column('is_announcing', sa.Boolean(), nullable=False),
+        sa.Column('last_changed_at', sa.DateTime(), nullable=True),
+        sa.Column('last_keyframe_at', sa.DateTime(), nullable=True),
+        sa.Column('snapshots_since_keyframe', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('asn')
+    )
+
+    # Popular com o último snapshot de cada ASN. A contagem por família só é
+    # preenchida quando o último keyframe tem o mesmo conjunto (hash) do último
+    # snapshot; nos demais casos fica nula até a próxima coleta
+    op.execute("""
+        WITH latest AS (
+            SELECT DISTINCT ON (asn) asn, id, timestamp, snapshot_type, prefix_hash,
+                   prefix_count, is_announcing
+            FROM asn_snapshots
+            ORDER BY asn, timestamp DESC
+        ),
+        keyframe AS (
+            SELECT DISTINCT ON (asn) asn, timestamp, prefix_hash, announced_prefixes
+            FROM asn_snapshots
+            WHERE snapshot_type = 'full'
+            ORDER BY asn, timestamp DESC
+        ),
+        last_other AS (
+            SELECT s.asn, max(s.timestamp) AS timestamp
+            FROM asn_snapshots s JOIN latest l ON l.asn = s.asn
+            WHERE s.prefix_hash IS DISTINCT FROM l.prefix_hash
+            GROUP BY s.asn
+        )
+        INSERT INTO asn_current_state
+        SELECT
+            l.asn, l.timestamp, l.id, l.snapshot_type, l.prefix_hash, l.prefix_count,
+            CASE WHEN k.prefix_hash = l.prefix_hash THEN
+                (SELECT count(*) FROM jsonb_array_elements_text(k.announced_prefixes) p WHERE p NOT LIKE '%:%')
+            END,
+            CASE WHEN k.prefix_hash = l.prefix_hash THEN
+                (SELECT count(*) FROM jsonb_array_elements_text(k.announced_prefixes) p WHERE p LIKE '%:%')
+            END,
+            (SELECT s.upstream_count FROM asn_snapshots s
+             WHERE s.asn = l.asn AND s.upstream_count IS NOT NULL
+             ORDER BY s.timestamp DESC LIMIT 1),
+            l.is_announcing,
+            (SELECT min(s.timestamp) FROM asn_snapshots s
+             WHERE s.asn = l.asn AND s.timestamp > coalesce(o.timestamp, '-infinity')),
+            k.timestamp,
+            (SELECT count(*) FROM asn_snapshots s WHERE s.asn = l.asn AND s.timestamp > k.timestamp)
+        FROM latest l
+        LEFT JOIN keyframe k ON k.asn = l.asn
+        LEFT JOIN last_other o ON o.asn = l.asn
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('asn_current_state')
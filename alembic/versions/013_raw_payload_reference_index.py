@@ -0,0 +1,25 @@
+"""Index on snapshot references to raw payloads
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Usado pela limpeza de raw_payloads órfãos (NOT EXISTS por content_hash)
+    op.create_index('idx_asn_snapshots_raw_payload_hash', 'asn_snapshots', ['raw_payload_hash'],
+                    postgresql_where=sa.text('raw_payload_hash IS NOT NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('idx_asn_snapshots_raw_payload_hash', table_name='asn_snapshots')
@@ -2,16 +2,20 @@
 BGP Historical Data API
 Endpoints para visualizar e gerenciar dados históricos BGP
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
+import ipaddress
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
+import logging
 
-from app.services.bgp_data_service import bgp_data_service
+from app.services.bgp_data_service import bgp_data_service, to_local_naive
 from app.services.anomaly_detector import anomaly_detector
 from app.core.asn_config import asn_config_manager
 from app.scheduler import bgp_scheduler
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/v1/bgp", tags=["BGP Historical Data"])
 
 
@@ -150,6 +154,21 @@ async def get_asn_statistics(
     return stats
 
 
+@router.get("/asns/{asn}/current")
+async def get_asn_current_state(asn: int):
+    """Obtém o estado corrente de um ASN (último snapshot gravado)"""
+    config = asn_config_manager.get_asn_config(asn)
+    if not config:
+        raise HTTPException(status_code=404, detail=f"ASN {asn} not found in configuration")
+    
+    states = await bgp_data_service.get_current_states([asn])
+    
+    if asn not in states:
+        raise HTTPException(status_code=404, detail=f"No snapshot recorded for AS{asn}")
+    
+    return states[asn]
+
+
 @router.get("/asns/{asn}/changes")
 async def get_asn_changes(
     asn: int,
@@ -170,6 +189,191 @@ async def get_asn_changes(
     }
 
 
+@router.get("/asns/{asn}/prefix-events")
+async def get_asn_prefix_events(
+    asn: int,
+    hours_back: int = Query(24, ge=1, le=720, description="Hours to look back"),
+    limit: int = Query(1000, ge=1, le=10000, description="Maximum number of events")
+):
+    """Obtém os eventos de anúncio/retirada de prefixos de um ASN (mais recentes primeiro)"""
+    config = asn_config_manager.get_asn_config(asn)
+    if not config:
+        raise HTTPException(status_code=404, detail=f"ASN {asn} not found in configuration")
+    
+    events = await bgp_data_service.get_asn_prefix_events(asn, hours_back, limit)
+    
+    return {
+        "asn": asn,
+        "hours_back": hours_back,
+        "total_events": len(events),
+        "events": events
+    }
+
+
+@router.get("/prefixes/timeline")
+async def get_prefix_timeline(
+    prefix: str = Query(..., description="Prefix in CIDR notation, e.g. 203.0.113.0/24"),
+    days_back: int = Query(30, ge=1, le=365, description="Days of history"),
+    asn: Optional[int] = Query(None, description="Restrict to one origin ASN")
+):
+    """Obtém a linha do tempo de anúncios/retiradas de um prefixo"""
+    try:
+        prefix = str(ipaddress.ip_network(prefix, strict=False))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid prefix: {prefix}")
+    
+    return await bgp_data_service.get_prefix_timeline(prefix, days_back, asn)
+
+
+@router.get("/prefixes/related")
+async def get_related_prefixes(
+    prefix: str = Query(..., description="Prefix in CIDR notation"),
+    relation: str = Query("more_specific", regex="^(covering|more_specific|overlap)$"),
+    days_back: int = Query(365, ge=1, le=730, description="Days of history"),
+    asn: Optional[int] = Query(None, description="Restrict to one origin ASN"),
+    limit: int = Query(1000, ge=1, le=10000, description="Maximum number of prefixes")
+):
+    """Busca prefixos que contêm, estão contidos ou se sobrepõem ao prefixo informado"""
+    try:
+        prefix = str(ipaddress.ip_network(prefix, strict=False))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid prefix: {prefix}")
+    
+    prefixes = await bgp_data_service.find_related_prefixes(prefix, relation, days_back, asn, limit)
+    
+    return {
+        "prefix": prefix,
+        "relation": relation,
+        "total_prefixes": len(prefixes),
+        "prefixes": prefixes
+    }
+
+
+@router.get("/prefixes/snapshots")
+async def get_prefix_snapshots(
+    prefix: str = Query(..., description="Prefix in CIDR notation"),
+    days_back: int = Query(30, ge=1, le=365, description="Days of history"),
+    asn: Optional[int] = Query(None, description="Restrict to one origin ASN")
+):
+    """Busca os ASNs cujos snapshots continham o prefixo no período"""
+    try:
+        prefix = str(ipaddress.ip_network(prefix, strict=False))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid prefix: {prefix}")
+    
+    asns = await bgp_data_service.find_asns_with_prefix(prefix, days_back, asn)
+    
+    return {
+        "prefix": prefix,
+        "days_back": days_back,
+        "total_asns": len(asns),
+        "asns": asns
+    }
+
+
+@router.get("/prefixes/lookup")
+async def lookup_ip_address(
+    ip: str = Query(..., description="IPv4 or IPv6 address"),
+    days_back: int = Query(365, ge=1, le=730, description="Days of history"),
+    asn: Optional[int] = Query(None, description="Restrict to one origin ASN")
+):
+    """Busca os prefixos (e ASNs de origem) que contêm um endereço IP"""
+    try:
+        ip = str(ipaddress.ip_address(ip))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid IP address: {ip}")
+    
+    prefixes = await bgp_data_service.find_prefixes_containing_ip(ip, days_back, asn)
+    
+    return {
+        "ip": ip,
+        "total_prefixes": len(prefixes),
+        "prefixes": prefixes
+    }
+
+
+@router.get("/asns/{asn}/prefixes")
+async def get_asn_current_prefixes(asn: int):
+    """Obtém o conjunto de prefixos atual de um ASN (cache em memória)"""
+    config = asn_config_manager.get_asn_config(asn)
+    if not config:
+        raise HTTPException(status_code=404, detail=f"ASN {asn} not found in configuration")
+    
+    result = await bgp_data_service.get_current_prefixes(asn)
+    
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No recent snapshot for AS{asn}")
+    
+    return result
+
+
+@router.get("/asns/{asn}/prefixes/at")
+async def get_asn_prefixes_at(
+    asn: int,
+    ts: datetime = Query(..., description="Point in time (ISO 8601)")
+):
+    """Obtém o conjunto de prefixos anunciados por um ASN em um instante"""
+    config = asn_config_manager.get_asn_config(asn)
+    if not config:
+        raise HTTPException(status_code=404, detail=f"ASN {asn} not found in configuration")
+    
+    result = await bgp_data_service.get_prefixes_at(asn, ts)
+    
+    if 'error' in result:
+        raise HTTPException(status_code=404, detail=result['error'])
+    
+    return result
+
+
+@router.get("/asns/{asn}/diff")
+async def get_asn_prefix_diff(
+    asn: int,
+    from_ts: datetime = Query(..., alias="from", description="Start instant (ISO 8601)"),
+    to_ts: datetime = Query(..., alias="to", description="End instant (ISO 8601)")
+):
+    """Compara os conjuntos de prefixos de um ASN em dois instantes"""
+    config = asn_config_manager.get_asn_config(asn)
+    if not config:
+        raise HTTPException(status_code=404, detail=f"ASN {asn} not found in configuration")
+    
+    diff = await bgp_data_service.get_prefix_diff(asn, from_ts, to_ts)
+    
+    if 'error' in diff:
+        raise HTTPException(status_code=404, detail=diff['error'])
+    
+    return diff
+
+
+@router.get("/asns/{asn}/uptime")
+async def get_asn_prefix_uptime(
+    asn: int,
+    start: Optional[datetime] = Query(None, description="Period start (default: now - days_back)"),
+    end: Optional[datetime] = Query(None, description="Period end (default: now)"),
+    days_back: int = Query(30, ge=1, le=365, description="Period length when start is omitted"),
+    prefix: Optional[str] = Query(None, description="Restrict to one prefix")
+):
+    """Obtém a disponibilidade (uptime/SLA) de cada prefixo de um ASN no período"""
+    config = asn_config_manager.get_asn_config(asn)
+    if not config:
+        raise HTTPException(status_code=404, detail=f"ASN {asn} not found in configuration")
+    
+    if prefix is not None:
+        try:
+            prefix = str(ipaddress.ip_network(prefix, strict=False))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid prefix: {prefix}")
+    
+    if end is not None:
+        end = to_local_naive(end)
+    start = to_local_naive(start) if start else (end or datetime.now()) - timedelta(days=days_back)
+    uptime = await bgp_data_service.get_prefix_uptime(asn, start, end, prefix)
+    
+    if 'error' in uptime:
+        raise HTTPException(status_code=400, detail=uptime['error'])
+    
+    return uptime
+
+
 @router.get("/asns/{asn}/anomalies")
 async def get_asn_anomalies(
     asn: int,
@@ -205,6 +409,20 @@ async def get_asn_instability(
     return instability
 
 
+@router.get("/asns/{asn}/snapshots/{snapshot_id}/raw")
+async def get_snapshot_raw_payload(asn: int, snapshot_id: int):
+    """Obtém o payload bruto arquivado de um snapshot (descomprimido sob demanda)"""
+    payload = await bgp_data_service.get_raw_payload(asn, snapshot_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"No raw payload archived for snapshot {snapshot_id} of AS{asn}")
+    
+    return {
+        "asn": asn,
+        "snapshot_id": snapshot_id,
+        "raw_data": payload
+    }
+
+
 @router.get("/overview")
 async def get_monitoring_overview(
     limit: int = Query(10, ge=1, le=50, description="Limit number of ASNs in detailed view"),
@@ -235,18 +453,24 @@ async def get_monitoring_overview(
     # Gerar relatório consolidado
     anomaly_report = await anomaly_detector.monitor_multiple_asns(enabled_asns)
     
-    # Estatísticas por ASN
+    # Estatísticas por ASN (uma consulta agrupada para todos) e estado corrente
     asn_summaries = []
-    for asn in enabled_asns[:10]:  # Limitar a 10 para performance
+    detailed_asns = enabled_asns[:10]  # Limitar a 10 para performance
+    all_stats = await bgp_data_service.get_multiple_asn_statistics(detailed_asns, days_back=7)
+    current_states = await bgp_data_service.get_current_states(detailed_asns)
+    for asn in detailed_asns:
         try:
-            stats = await bgp_data_service.get_asn_statistics(asn, days_back=7)
+            stats = all_stats.get(asn, {'error': 'No data available'})
+            state = current_states.get(asn)
             instability = await anomaly_detector.detect_routing_instability(asn, window_hours=24)
             
             if 'error' not in stats:
                 asn_summaries.append({
                     "asn": asn,
                     "name": asn_config_manager.get_asn_config(asn).name,
-                    "current_prefixes": stats.get('prefix_statistics', {}).get('current_count', 0),
+                    "current_prefixes": state['prefix_count'] if state else 0,
+                    "last_update": state['updated_at'] if state else None,
+                    "last_change": state['last_changed_at'] if state else None,
                     "stability_score": stats.get('stability_score', 0),
                     "instability_status": instability.get('status', 'unknown')
                 })
@@ -328,18 +552,40 @@ async def force_collection_all():
 
 
 @router.post("/asns/{asn}/collect")
-async def manual_collection(asn: int):
-    """Força coleta manual de dados para um ASN específico"""
+async def manual_collection(asn: int, response: Response):
+    """
+    Força coleta manual de dados para um ASN específico
+    Com o banco indisponível, o snapshot coletado vai para o spill journal e a
+    resposta é 202 (aceito, gravado no banco quando o replay executar)
+    """
     config = asn_config_manager.get_asn_config(asn)
     if not config:
         raise HTTPException(status_code=404, detail=f"ASN {asn} not found in configuration")
     
+    try:
+        previous = (await bgp_data_service.get_current_states([asn])).get(asn)
+    except Exception as e:
+        logger.warning(f"Failed to load current state for AS{asn}: {e}")
+        previous = None
+    
     result = await bgp_data_service.collect_asn_snapshot(asn)
     
     if not result:
         raise HTTPException(status_code=500, detail="Failed to collect data")
     
+    if result.get('status') == 'spilled':
+        response.status_code = 202
+        return {
+            "message": f"Data collected for AS{asn}; database unavailable, snapshot queued in spill journal",
+            "spilled": True,
+            "snapshot": result
+        }
+    
+    # Comparação com o estado corrente anterior à coleta
     return {
         "message": f"Data collected successfully for AS{asn}",
-        "snapshot": result
+        "snapshot": result,
+        "previous_state": previous,
+        "prefixes_changed": previous is None or previous['prefix_hash'] != result['prefix_hash'],
+        "prefix_count_change": result['prefix_count'] - previous['prefix_count'] if previous else None
     }
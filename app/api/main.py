@@ -11,6 +11,7 @@ from app.services.prefix_monitor import prefix_monitor
 from app.services.peer_monitor import peer_monitor
 from app.services.irr_validator import irr_validator
 from app.utils.metrics import metrics
+from app.database.connection import db_manager, use_pool, API_POOL
 from app.api.bgp_historical import router as bgp_router
 import logging
 
@@ -34,6 +35,13 @@ app.add_middleware(
 # Incluir rotas da API histórica
 app.include_router(bgp_router)
 
+
+@app.middleware("http")
+async def api_database_pool(request, call_next):
+    """Consultas feitas pelas rotas usam o pool de conexões da API"""
+    with use_pool(API_POOL):
+        return await call_next(request)
+
 # Lista de prefixos monitorados (armazenada em memória)
 monitored_prefixes = []
 
@@ -65,8 +73,10 @@ async def health_check():
 
 @app.get("/metrics")
 async def get_metrics():
-    """Endpoint para estatísticas do sistema"""
-    return metrics.get_system_stats()
+    """Endpoint para estatísticas do sistema (inclui a ocupação atual dos pools do banco)"""
+    stats = metrics.get_system_stats()
+    stats["db_pools"] = db_manager.get_pool_stats()
+    return stats
 
 
 # Endpoints de Prefixos
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Optional, Dict
 from dotenv import load_dotenv
 
 # Carrega variáveis do arquivo .env
@@ -24,6 +24,34 @@ class Settings:
         self.ripe_api_key = os.getenv("RIPE_API_KEY")
         self.ripe_base_url = os.getenv("RIPE_BASE_URL", "https://stat.ripe.net/data")
         
+        # Cliente HTTP compartilhado para a API RIPE
+        self.http_timeout = float(os.getenv("HTTP_TIMEOUT", "30"))
+        self.user_agent = os.getenv("USER_AGENT", "BGP-Monitor/2.2.0")
+        self.ripe_http2 = os.getenv("RIPE_HTTP2", "true").lower() == "true"
+        self.ripe_http_max_connections = int(os.getenv("RIPE_HTTP_MAX_CONNECTIONS", "20"))
+        self.ripe_http_max_keepalive = int(os.getenv("RIPE_HTTP_MAX_KEEPALIVE", "10"))
+        self.ripe_http_keepalive_expiry = float(os.getenv("RIPE_HTTP_KEEPALIVE_EXPIRY", "60"))  # seconds
+        self.ripe_http_warmup = os.getenv("RIPE_HTTP_WARMUP", "true").lower() == "true"
+        
+        # Rate limit global da API RIPE (token bucket com ajuste AIMD)
+        self.ripe_rate_limit_rps = float(os.getenv("RIPE_RATE_LIMIT_RPS", "4"))  # requests/second
+        self.ripe_rate_limit_burst = int(os.getenv("RIPE_RATE_LIMIT_BURST", "8"))
+        self.ripe_rate_limit_min_rps = float(os.getenv("RIPE_RATE_LIMIT_MIN_RPS", "0.2"))
+        self.ripe_rate_limit_increase = float(os.getenv("RIPE_RATE_LIMIT_INCREASE", "0.1"))  # additive step
+        self.ripe_rate_limit_decrease = float(os.getenv("RIPE_RATE_LIMIT_DECREASE", "0.5"))  # multiplicative factor
+        self.ripe_rate_limit_backoff = float(os.getenv("RIPE_RATE_LIMIT_BACKOFF", "5"))  # seconds, sem Retry-After
+        self.ripe_max_retries = int(os.getenv("RIPE_MAX_RETRIES", "3"))
+        
+        # Cache de respostas da API RIPE (TTL por endpoint, formato "endpoint=segundos,...")
+        self.ripe_cache_enabled = os.getenv("RIPE_CACHE_ENABLED", "true").lower() == "true"
+        self.ripe_cache_ttls = self._parse_ttls(os.getenv(
+            "RIPE_CACHE_TTLS",
+            "as-overview=86400,rir-stats-country=86400,asn-neighbours=300"
+        ))
+        self.ripe_cache_negative_ttl = float(os.getenv("RIPE_CACHE_NEGATIVE_TTL", "60"))  # seconds
+        self.ripe_cache_max_bytes = int(os.getenv("RIPE_CACHE_MAX_MB", "32")) * 1024 * 1024  # JSON armazenado, descomprimido
+        self.ripe_cache_path = os.getenv("RIPE_CACHE_PATH") or None  # vazio = somente memória
+        
         # Monitoring intervals (seconds)
         self.prefix_check_interval = int(os.getenv("PREFIX_CHECK_INTERVAL", "300"))
         self.peer_check_interval = int(os.getenv("PEER_CHECK_INTERVAL", "600"))
@@ -46,13 +74,76 @@ class Settings:
         self.db_user = os.getenv("DB_USER", "bgp_monitor")
         self.db_password = os.getenv("DB_PASSWORD", "bgp_monitor_password")
         
+        # Pools de conexões nomeados: ingest (coleta/gravações), analytics (análises
+        # do scheduler) e api (rotas HTTP). Timeouts de statement em ms (0 = sem limite)
+        self.db_pool_ingest_size = int(os.getenv("DB_POOL_INGEST_SIZE", "10"))
+        self.db_pool_ingest_max_overflow = int(os.getenv("DB_POOL_INGEST_MAX_OVERFLOW", "10"))
+        self.db_pool_ingest_statement_timeout = int(os.getenv("DB_POOL_INGEST_STATEMENT_TIMEOUT", "300000"))
+        self.db_pool_analytics_size = int(os.getenv("DB_POOL_ANALYTICS_SIZE", "5"))
+        self.db_pool_analytics_max_overflow = int(os.getenv("DB_POOL_ANALYTICS_MAX_OVERFLOW", "5"))
+        self.db_pool_analytics_statement_timeout = int(os.getenv("DB_POOL_ANALYTICS_STATEMENT_TIMEOUT", "120000"))
+        self.db_pool_api_size = int(os.getenv("DB_POOL_API_SIZE", "10"))
+        self.db_pool_api_max_overflow = int(os.getenv("DB_POOL_API_MAX_OVERFLOW", "10"))
+        self.db_pool_api_statement_timeout = int(os.getenv("DB_POOL_API_STATEMENT_TIMEOUT", "30000"))
+        self.db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # espera máxima por conexão (s)
+        # Réplica de leitura opcional para os pools analytics e api (vazio = primário)
+        self.db_read_replica_url = os.getenv("DB_READ_REPLICA_URL", "")
+        
         # Data retention settings
         self.data_retention_days = int(os.getenv("DATA_RETENTION_DAYS", "365"))
+        self.alert_retention_days = int(os.getenv("ALERT_RETENTION_DAYS", "90"))
+        self.prefix_history_retention_days = int(os.getenv("PREFIX_HISTORY_RETENTION_DAYS", str(self.data_retention_days)))
+        self.metrics_retention_days = int(os.getenv("METRICS_RETENTION_DAYS", "30"))
+        self.rollup_hourly_retention_days = int(os.getenv("ROLLUP_HOURLY_RETENTION_DAYS", "90"))
+        self.partition_months_ahead = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+        self.partition_retention_mode = os.getenv("PARTITION_RETENTION_MODE", "drop").lower()  # drop ou detach
         self.cleanup_interval_hours = int(os.getenv("CLEANUP_INTERVAL_HOURS", "24"))
+        self.retention_batch_size = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+        self.retention_max_rows_per_second = int(os.getenv("RETENTION_MAX_ROWS_PER_SECOND", "20000"))  # 0 = sem limite
+        self.retention_analyze_threshold = int(os.getenv("RETENTION_ANALYZE_THRESHOLD", "10000"))
+        self.retention_checkpoint_path = os.getenv("RETENTION_CHECKPOINT_PATH", "retention_checkpoint.json")
+        
+        # Armazenamento de snapshots: "full" (lista completa sempre) ou "delta" (keyframe + deltas)
+        self.snapshot_storage_mode = os.getenv("SNAPSHOT_STORAGE_MODE", "delta").lower()
+        self.snapshot_keyframe_interval = int(os.getenv("SNAPSHOT_KEYFRAME_INTERVAL", "288"))  # snapshots entre keyframes
+        self.snapshot_keyframe_max_age_hours = int(os.getenv("SNAPSHOT_KEYFRAME_MAX_AGE_HOURS", "24"))
+        self.snapshot_dedup_enabled = os.getenv("SNAPSHOT_DEDUP_ENABLED", "true").lower() == "true"
+        self.prefix_events_enabled = os.getenv("PREFIX_EVENTS_ENABLED", "true").lower() == "true"
+        self.prefix_cache_max_asns = int(os.getenv("PREFIX_CACHE_MAX_ASNS", "10000"))  # ASNs no cache de conjuntos
+        self.raw_payload_policy = os.getenv("RAW_PAYLOAD_POLICY", "on_change").lower()  # off, sampled, on_change
+        self.raw_payload_sample_rate = float(os.getenv("RAW_PAYLOAD_SAMPLE_RATE", "0.05"))
+        self.raw_payload_compression_level = int(os.getenv("RAW_PAYLOAD_COMPRESSION_LEVEL", "3"))
+        self.raw_payload_orphan_grace_hours = int(os.getenv("RAW_PAYLOAD_ORPHAN_GRACE_HOURS", "48"))
         
         # Rate limiting for API calls
-        self.api_rate_limit_per_asn = int(os.getenv("API_RATE_LIMIT_PER_ASN", "30"))  # seconds
+        self.api_rate_limit_per_asn = int(os.getenv("API_RATE_LIMIT_PER_ASN", "30"))  # seconds between snapshots
         self.api_batch_size = int(os.getenv("API_BATCH_SIZE", "5"))  # ASNs per batch
+        self.snapshot_persist_batch_size = int(os.getenv("SNAPSHOT_PERSIST_BATCH_SIZE", "500"))  # snapshots por transação
+        
+        # Write-behind: snapshots e alertas gravados em group commits pelo scheduler
+        self.write_behind_enabled = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+        self.write_behind_flush_size = int(os.getenv("WRITE_BEHIND_FLUSH_SIZE", "500"))  # registros por commit
+        self.write_behind_flush_interval = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "2.0"))  # segundos
+        self.write_behind_max_records = int(os.getenv("WRITE_BEHIND_MAX_RECORDS", "5000"))  # limite de memória
+        self.write_behind_max_mb = int(os.getenv("WRITE_BEHIND_MAX_MB", "64"))  # tamanho estimado dos registros
+        
+        # Spill journal: snapshots gravados em disco quando o banco está indisponível
+        self.spill_journal_enabled = os.getenv("SPILL_JOURNAL_ENABLED", "true").lower() == "true"
+        self.spill_journal_dir = os.getenv("SPILL_JOURNAL_DIR", "spill_journal")
+        self.spill_journal_segment_mb = int(os.getenv("SPILL_JOURNAL_SEGMENT_MB", "64"))
+        self.spill_replay_interval = int(os.getenv("SPILL_REPLAY_INTERVAL", "60"))  # segundos
+
+    
+    @staticmethod
+    def _parse_ttls(value: str) -> Dict[str, float]:
+        """Converte "endpoint=segundos,..." em dicionário"""
+        ttls = {}
+        for item in value.split(","):
+            if "=" not in item:
+                continue
+            endpoint, ttl = item.split("=", 1)
+            ttls[endpoint.strip()] = float(ttl)
+        return ttls
 
 
 # Instância global das configurações
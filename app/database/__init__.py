@@ -3,7 +3,7 @@ BGP Monitor v2.1.0 - Database Module
 
 Módulo de banco de dados do BGP Monitor v2.1.0 com:
 - Gerenciamento de conexões PostgreSQL assíncronas
-- Pool de conexões otimizado
+- Pools de conexões nomeados (ingest, analytics, api)
 - Session management
 - Health checks de conectividade
 
@@ -17,7 +17,8 @@ from .connection import (
     db_manager,
     get_db_session,
     init_database,
-    close_database
+    close_database,
+    use_pool
 )
 
 # Alias para compatibilidade
@@ -29,7 +30,8 @@ __all__ = [
     'get_db_session',
     'get_db',  # Alias
     'init_database',
-    'close_database'
+    'close_database',
+    'use_pool'
 ]
 
 __version__ = "2.0.0"
@@ -2,24 +2,123 @@
 Database connection and session management
 """
 import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy import create_engine, text
-from typing import AsyncGenerator, Optional
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import Any, AsyncGenerator, Dict, Iterator, Optional
 import logging
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 
 from app.core.config import settings
 from app.models.database import Base
+from app.database.partitions import ensure_partitions, add_months, month_start
+from app.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Pools nomeados; analytics e api podem usar a réplica de leitura
+INGEST_POOL = "ingest"
+ANALYTICS_POOL = "analytics"
+API_POOL = "api"
+READ_POOLS = (ANALYTICS_POOL, API_POOL)
+
+# Pool usado por get_session() quando nenhum é informado
+_current_pool: ContextVar[str] = ContextVar("db_pool", default=INGEST_POOL)
+
+
+@contextmanager
+def use_pool(name: str) -> Iterator[None]:
+    """Direciona as sessões abertas neste contexto (e nas tarefas criadas nele) para o pool informado"""
+    token = _current_pool.set(name)
+    try:
+        yield
+    finally:
+        _current_pool.reset(token)
+
+
+def pool_settings() -> Dict[str, Dict[str, Any]]:
+    """Tamanho, overflow e timeout de statement (ms) de cada pool"""
+    return {
+        INGEST_POOL: {
+            "size": settings.db_pool_ingest_size,
+            "max_overflow": settings.db_pool_ingest_max_overflow,
+            "statement_timeout": settings.db_pool_ingest_statement_timeout
+        },
+        ANALYTICS_POOL: {
+            "size": settings.db_pool_analytics_size,
+            "max_overflow": settings.db_pool_analytics_max_overflow,
+            "statement_timeout": settings.db_pool_analytics_statement_timeout
+        },
+        API_POOL: {
+            "size": settings.db_pool_api_size,
+            "max_overflow": settings.db_pool_api_max_overflow,
+            "statement_timeout": settings.db_pool_api_statement_timeout
+        }
+    }
+
+
+# SQLSTATE de falhas de conexão (classe 08) e de servidor indisponível (57P01-57P03)
+CONNECTION_SQLSTATE_PREFIXES = ("08", "57P")
+
+
+def is_connection_error(exc: BaseException) -> bool:
+    """
+    Indica se a falha é de conectividade com o banco (servidor fora do ar,
+    conexão recusada/perdida, sem conexão livre no pool), e não de dados
+    Percorre a exceção do SQLAlchemy, a do driver e suas causas
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (OSError, asyncio.TimeoutError, PoolTimeoutError)):
+            return True
+        if isinstance(exc, DBAPIError) and exc.connection_invalidated:
+            return True
+        sqlstate = getattr(exc, "sqlstate", None)
+        if isinstance(sqlstate, str) and sqlstate.startswith(CONNECTION_SQLSTATE_PREFIXES):
+            return True
+        exc = getattr(exc, "orig", None) or exc.__cause__
+    return False
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Pool que mede a espera por uma conexão livre (fila do pool e abertura de
+    conexão nova quando o pool cresce), sem o pre-ping nem o uso da conexão
+    O nome do pool nas métricas vem do pool_logging_name do engine
+    """
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            metrics.increment_counter(f"db_pool.{self.logging_name}.timeouts")
+            raise
+        metrics.record_timing(f"db_pool.{self.logging_name}.wait", time.perf_counter() - started)
+        return record
+
+
+def _async_url(url: str) -> str:
+    """Garante o driver asyncpg em URLs postgresql://"""
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    return url
+
 
 class DatabaseManager:
     """Gerenciador de conexões com o banco de dados"""
     
     def __init__(self):
-        self.engine: Optional[create_async_engine] = None
+        self.engine: Optional[AsyncEngine] = None  # Engine do pool ingest (primário)
         self.session_factory: Optional[async_sessionmaker] = None
+        self.engines: Dict[str, AsyncEngine] = {}
+        self.session_factories: Dict[str, async_sessionmaker] = {}
+        self.pool_capacity: Dict[str, int] = {}  # pool_size + max_overflow
         self._initialized = False
     
     async def initialize(self):
@@ -34,59 +133,127 @@ class DatabaseManager:
                 f"@{settings.db_host}:{settings.db_port}/{settings.db_name}"
             )
             
-            # Criar engine assíncrono
-            self.engine = create_async_engine(
-                database_url,
-                echo=settings.debug,  # Log SQL queries em modo debug
-                pool_size=20,         # Pool de conexões para 50 ASNs
-                max_overflow=30,
-                pool_pre_ping=True,   # Verifica conexões antes de usar
-                pool_recycle=3600,    # Recria conexões a cada hora
-            )
+            replica_url = _async_url(settings.db_read_replica_url) if settings.db_read_replica_url else None
             
-            # Criar factory de sessões
-            self.session_factory = async_sessionmaker(
-                self.engine,
-                class_=AsyncSession,
-                expire_on_commit=False
-            )
+            # Um engine (pool independente) por tipo de carga
+            for name, config in pool_settings().items():
+                url = replica_url if replica_url and name in READ_POOLS else database_url
+                self.engines[name] = self._create_engine(name, url, config)
+                self.session_factories[name] = async_sessionmaker(
+                    self.engines[name],
+                    class_=AsyncSession,
+                    expire_on_commit=False
+                )
+            
+            self.engine = self.engines[INGEST_POOL]
+            self.session_factory = self.session_factories[INGEST_POOL]
             
             # Criar tabelas se não existirem
             await self.create_tables()
+            await self.ensure_partitions()
             
             self._initialized = True
-            logger.info("Database connection initialized successfully")
+            logger.info(
+                "Database connection initialized successfully"
+                + (" (read pools on replica)" if replica_url else "")
+            )
             
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
             raise
     
+    def _create_engine(self, name: str, url: str, config: Dict[str, Any]) -> AsyncEngine:
+        """Cria o engine de um pool nomeado (timeout de statement e application_name próprios)"""
+        server_settings = {"application_name": f"bgp-monitor-{name}"}
+        if config["statement_timeout"] > 0:
+            server_settings["statement_timeout"] = str(config["statement_timeout"])
+        
+        engine = create_async_engine(
+            url,
+            echo=settings.debug,  # Log SQL queries em modo debug
+            pool_size=config["size"],
+            max_overflow=config["max_overflow"],
+            pool_timeout=settings.db_pool_timeout,
+            poolclass=TimedQueuePool,
+            pool_logging_name=name,
+            pool_pre_ping=True,   # Verifica conexões antes de usar
+            pool_recycle=3600,    # Recria conexões a cada hora
+            connect_args={"server_settings": server_settings},
+        )
+        self.pool_capacity[name] = config["size"] + config["max_overflow"]
+        return engine
+    
+    def _publish_pool_usage(self, name: str):
+        """Publica conexões em uso, overflow e saturação (em uso / capacidade) do pool"""
+        pool = self.engines[name].sync_engine.pool
+        checked_out = pool.checkedout()
+        capacity = self.pool_capacity[name]
+        metrics.set_gauge(f"db_pool.{name}.checked_out", checked_out)
+        metrics.set_gauge(f"db_pool.{name}.overflow", max(pool.overflow(), 0))
+        metrics.set_gauge(f"db_pool.{name}.saturation", round(checked_out / capacity, 3) if capacity else 0)
+    
     async def create_tables(self):
-        """Cria as tabelas no banco de dados"""
+        """
+        Cria as tabelas no banco de dados
+        A extensão btree_gist (índice de períodos de prefix_intervals) é instalada
+        pela migração 010, que exige privilégio CREATE no banco
+        """
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
     
+    async def ensure_partitions(self, months_ahead: Optional[int] = None):
+        """Cria antecipadamente as partições mensais do mês corrente e dos próximos meses"""
+        if months_ahead is None:
+            months_ahead = settings.partition_months_ahead
+        
+        current = month_start(datetime.now())
+        async with self.engine.begin() as conn:
+            await ensure_partitions(conn, current, add_months(current, months_ahead))
+    
     async def close(self):
         """Fecha a conexão com o banco de dados"""
-        if self.engine:
-            await self.engine.dispose()
+        if self.engines:
+            for engine in self.engines.values():
+                await engine.dispose()
             self._initialized = False
             logger.info("Database connection closed")
     
     @asynccontextmanager
-    async def get_session(self) -> AsyncGenerator[AsyncSession, None]:
-        """Context manager para obter uma sessão do banco de dados"""
+    async def get_session(self, pool: Optional[str] = None) -> AsyncGenerator[AsyncSession, None]:
+        """
+        Context manager para obter uma sessão do banco de dados
+        Sem pool informado, usa o pool do contexto atual (use_pool; padrão ingest)
+        """
         if not self._initialized:
             await self.initialize()
-            
-        async with self.session_factory() as session:
+        
+        name = pool or _current_pool.get()
+        async with self.session_factories[name]() as session:
             try:
+                # Conexão obtida já na abertura para publicar a ocupação do pool
+                # (espera e timeouts são medidos pelo TimedQueuePool)
+                await session.connection()
+                self._publish_pool_usage(name)
                 yield session
             except Exception:
                 await session.rollback()
                 raise
             finally:
                 await session.close()
+                self._publish_pool_usage(name)
+    
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Ocupação atual de cada pool"""
+        stats = {}
+        for name, engine in self.engines.items():
+            pool = engine.sync_engine.pool
+            stats[name] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "replica": name in READ_POOLS and bool(settings.db_read_replica_url)
+            }
+        return stats
     
     async def health_check(self) -> bool:
         """Verifica se o banco de dados está funcionando"""
@@ -0,0 +1,93 @@
+"""
+Gerenciamento das partições mensais (RANGE por timestamp) das tabelas históricas
+"""
+import re
+import logging
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+# Tabelas particionadas por mês na coluna "timestamp"
+PARTITIONED_TABLES = ("asn_snapshots", "prefix_history", "bgp_alerts")
+
+_PARTITION_SUFFIX = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+def month_start(value: datetime) -> datetime:
+    """Primeiro instante do mês do valor informado"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """Soma meses a um início de mês"""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    """Nome da partição mensal, ex.: asn_snapshots_y2026m10"""
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+async def create_partition(conn: AsyncConnection, table: str, month: datetime) -> str:
+    """Cria (se não existir) a partição do mês informado"""
+    start = month_start(month)
+    name = partition_name(table, start)
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{add_months(start, 1).isoformat()}')"
+    ))
+    return name
+
+
+async def ensure_partitions(conn: AsyncConnection, start: datetime, end: datetime):
+    """Garante partições de todos os meses entre start e end (inclusive) em todas as tabelas"""
+    first = month_start(start)
+    last = month_start(end)
+    for table in PARTITIONED_TABLES:
+        month = first
+        while month <= last:
+            await create_partition(conn, table, month)
+            month = add_months(month, 1)
+
+
+async def list_partitions(conn: AsyncConnection, table: str) -> List[Tuple[str, datetime]]:
+    """Lista as partições mensais de uma tabela com o início de cada mês (ordem cronológica)"""
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+        "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+        "WHERE parent.relname = :table"
+    ), {"table": table})
+
+    partitions = []
+    for name in result.scalars():
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+async def drop_partitions_before(conn: AsyncConnection, table: str, cutoff: datetime,
+                                 drop: bool = True) -> List[str]:
+    """
+    Remove as partições cujo mês inteiro é anterior ao corte
+    Com drop=False as partições são apenas desanexadas (para arquivamento externo)
+    """
+    removed = []
+    for name, month in await list_partitions(conn, table):
+        if add_months(month, 1) > cutoff:
+            break
+
+        await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        if drop:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        removed.append(name)
+
+    if removed:
+        logger.info(f"{'Dropped' if drop else 'Detached'} {len(removed)} partitions of {table}: {', '.join(removed)}")
+    return removed
@@ -0,0 +1,385 @@
+"""
+Consultas projetadas sobre asn_snapshots, prefix_history e prefix_intervals
+
+Retornam tuplas tipadas leves com apenas as colunas necessárias, sem carregar
+listas de prefixos (JSON) quando o chamador precisa só de contagens.
+"""
+from datetime import datetime
+from typing import AsyncIterator, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import DateTime, and_, cast, desc, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import CIDR, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import ASNSnapshot, PrefixHistory, PrefixInterval
+
+
+class PrefixCountRow(NamedTuple):
+    """Contagem de prefixos em um instante"""
+    timestamp: datetime
+    prefix_count: int
+
+
+class SnapshotPrefixRow(NamedTuple):
+    """Colunas necessárias para reconstruir conjuntos de prefixos (keyframe + deltas)"""
+    timestamp: datetime
+    snapshot_type: str
+    prefix_hash: Optional[str]
+    announced_prefixes: Optional[List[str]]
+    added_prefixes: Optional[List[str]]
+    removed_prefixes: Optional[List[str]]
+
+
+class CountBaselineRow(NamedTuple):
+    """Snapshot recente de um ASN com o baseline estatístico dos snapshots anteriores"""
+    asn: int
+    timestamp: datetime
+    prefix_count: int
+    total_snapshots: int  # Snapshots na janela (recentes + baseline)
+    baseline_mean: Optional[float]
+    baseline_std: float  # Desvio padrão amostral (0 com menos de 2 amostras)
+
+
+class PrefixCountStatsRow(NamedTuple):
+    """Agregados de prefix_count de um ASN em um período (a partir dos rollups)"""
+    asn: int
+    snapshot_count: int
+    mean: float
+    variance: float  # Variância populacional
+    min_count: int
+    max_count: int
+    current_count: int
+    first_timestamp: datetime
+    last_timestamp: datetime
+
+
+class PrefixEventRow(NamedTuple):
+    """Evento de anúncio/retirada de um prefixo (prefix_history)"""
+    timestamp: datetime
+    asn: int
+    prefix: str
+    is_announced: bool
+
+
+class PrefixSnapshotsRow(NamedTuple):
+    """ASN cujos snapshots continham um prefixo no período"""
+    asn: int
+    snapshot_count: int  # Keyframes com o prefixo + deltas que o adicionaram
+    first_seen: datetime
+    last_seen: datetime
+
+
+class RelatedPrefixRow(NamedTuple):
+    """Prefixo (por ASN de origem) relacionado a um prefixo/IP consultado"""
+    prefix: str
+    asn: int
+    first_seen: datetime
+    last_seen: datetime
+    is_announced: bool  # Estado no último evento do período
+    event_count: int
+
+
+class PrefixUptimeRow(NamedTuple):
+    """Tempo de presença de um prefixo em um período (a partir de prefix_intervals)"""
+    prefix: str
+    uptime_seconds: float
+    interval_count: int
+    announced_at_end: bool  # Anunciado no fim do período
+
+
+# Relações entre prefixos atendidas pelo índice GiST (inet_ops) de prefix_history
+PREFIX_RELATIONS = {
+    'covering': '>>=',       # Prefixos que contêm o consultado (menos específicos, inclusive)
+    'more_specific': '<<=',  # Prefixos contidos no consultado (mais específicos, inclusive)
+    'overlap': '&&',         # Qualquer sobreposição
+}
+
+
+def _window(asn: int, since: datetime, until: Optional[datetime]):
+    conditions = [ASNSnapshot.asn == asn, ASNSnapshot.timestamp >= since]
+    if until is not None:
+        conditions.append(ASNSnapshot.timestamp <= until)
+    return and_(*conditions)
+
+
+async def fetch_prefix_counts(session: AsyncSession, asn: int, since: datetime,
+                              until: Optional[datetime] = None,
+                              newest_first: bool = False) -> List[PrefixCountRow]:
+    """Série (timestamp, prefix_count) de um ASN no intervalo"""
+    order = desc(ASNSnapshot.timestamp) if newest_first else ASNSnapshot.timestamp
+    query = select(ASNSnapshot.timestamp, ASNSnapshot.prefix_count).where(
+        _window(asn, since, until)
+    ).order_by(order)
+
+    result = await session.execute(query)
+    return [PrefixCountRow(*row) for row in result]
+
+
+async def stream_prefix_rows(session: AsyncSession, asn: int, since: datetime,
+                             until: Optional[datetime] = None) -> AsyncIterator[SnapshotPrefixRow]:
+    """Percorre, em ordem cronológica, as colunas de prefixos dos snapshots a partir de since"""
+    query = select(
+        ASNSnapshot.timestamp, ASNSnapshot.snapshot_type, ASNSnapshot.prefix_hash,
+        ASNSnapshot.announced_prefixes, ASNSnapshot.added_prefixes, ASNSnapshot.removed_prefixes
+    ).where(
+        _window(asn, since, until)
+    ).order_by(ASNSnapshot.timestamp)
+
+    result = await session.stream(query)
+    async for row in result:
+        yield SnapshotPrefixRow(*row)
+
+
+async def fetch_snapshots_with_prefix(session: AsyncSession, prefix: str, since: datetime,
+                                     asn: Optional[int] = None) -> List[PrefixSnapshotsRow]:
+    """
+    ASNs com snapshots no período que continham o prefixo (keyframe que o lista
+    ou delta que o adicionou), via contenção JSONB (@>) nos índices GIN
+    """
+    needle = [prefix]
+    conditions = [
+        ASNSnapshot.timestamp >= since,
+        or_(ASNSnapshot.announced_prefixes.contains(needle), ASNSnapshot.added_prefixes.contains(needle))
+    ]
+    if asn is not None:
+        conditions.append(ASNSnapshot.asn == asn)
+
+    query = select(
+        ASNSnapshot.asn, func.count(), func.min(ASNSnapshot.timestamp), func.max(ASNSnapshot.timestamp)
+    ).where(and_(*conditions)).group_by(ASNSnapshot.asn).order_by(ASNSnapshot.asn)
+
+    result = await session.execute(query)
+    return [PrefixSnapshotsRow(*row) for row in result]
+
+
+async def fetch_count_baselines(session: AsyncSession, asns: Iterable[int], since: datetime,
+                                recent: int = 10) -> List[CountBaselineRow]:
+    """
+    Para cada ASN, retorna os `recent` snapshots mais recentes da janela junto com
+    média e desvio padrão amostral dos demais (baseline), calculados no PostgreSQL
+    em uma única consulta (funções de janela + agregados por ASN)
+    """
+    rank = func.row_number().over(
+        partition_by=ASNSnapshot.asn, order_by=desc(ASNSnapshot.timestamp)
+    )
+    ranked = select(
+        ASNSnapshot.asn, ASNSnapshot.timestamp, ASNSnapshot.prefix_count, rank.label('rank')
+    ).where(
+        and_(ASNSnapshot.asn.in_(list(asns)), ASNSnapshot.timestamp >= since)
+    ).cte('ranked')
+
+    in_baseline = ranked.c.rank > recent
+    baseline = select(
+        ranked.c.asn,
+        func.count().label('total'),
+        func.avg(ranked.c.prefix_count).filter(in_baseline).label('mean'),
+        func.stddev_samp(ranked.c.prefix_count).filter(in_baseline).label('std')
+    ).group_by(ranked.c.asn).cte('baseline')
+
+    query = select(
+        ranked.c.asn, ranked.c.timestamp, ranked.c.prefix_count,
+        baseline.c.total, baseline.c.mean, baseline.c.std
+    ).join(baseline, baseline.c.asn == ranked.c.asn).where(
+        ranked.c.rank <= recent
+    ).order_by(ranked.c.asn, ranked.c.rank)
+
+    result = await session.execute(query)
+    return [
+        CountBaselineRow(
+            asn, timestamp, prefix_count, total,
+            float(mean) if mean is not None else None,
+            float(std) if std is not None else 0.0
+        )
+        for asn, timestamp, prefix_count, total, mean, std in result
+    ]
+
+
+async def fetch_existing_snapshot_keys(session: AsyncSession, asns: Iterable[int],
+                                       start: datetime, end: datetime) -> Set[Tuple[int, datetime]]:
+    """Pares (asn, timestamp) já gravados no período [start, end] para os ASNs"""
+    query = select(ASNSnapshot.asn, ASNSnapshot.timestamp).where(
+        and_(
+            ASNSnapshot.asn.in_(list(asns)),
+            ASNSnapshot.timestamp >= start,
+            ASNSnapshot.timestamp <= end
+        )
+    )
+    result = await session.execute(query)
+    return {(asn, timestamp) for asn, timestamp in result}
+
+
+async def fetch_rollup_statistics(session: AsyncSession, model, asns: Iterable[int],
+                                  since: datetime) -> List[PrefixCountStatsRow]:
+    """
+    Combina os buckets de um rollup (ASNHourlyStats/ASNDailyStats) em uma única
+    consulta agrupada por ASN: média e variância a partir de soma e soma dos quadrados
+    """
+    # Aritmética em numeric (sem perda de precisão na soma dos quadrados)
+    count = func.sum(model.snapshot_count)
+    mean = func.sum(model.prefix_count_sum) / count
+    variance = func.greatest(func.sum(model.prefix_count_sum_sq) / count - mean * mean, 0)
+
+    query = select(
+        model.asn,
+        count,
+        mean,
+        variance,
+        func.min(model.prefix_count_min),
+        func.max(model.prefix_count_max),
+        func.array_agg(aggregate_order_by(model.last_prefix_count, desc(model.bucket)))[1],
+        func.min(model.first_timestamp),
+        func.max(model.last_timestamp)
+    ).where(
+        and_(model.asn.in_(list(asns)), model.bucket >= since)
+    ).group_by(model.asn)
+
+    result = await session.execute(query)
+    return [
+        PrefixCountStatsRow(asn, int(total), float(avg), float(var), *rest)
+        for asn, total, avg, var, *rest in result
+    ]
+
+
+async def fetch_prefix_events(session: AsyncSession, since: datetime,
+                              until: Optional[datetime] = None,
+                              prefix: Optional[str] = None,
+                              asn: Optional[int] = None,
+                              limit: Optional[int] = None,
+                              newest_first: bool = False) -> List[PrefixEventRow]:
+    """
+    Eventos de anúncio/retirada, filtrados por prefixo e/ou ASN
+    Varredura por faixa nos índices (prefix, timestamp) e (asn, prefix, timestamp)
+    """
+    conditions = [PrefixHistory.timestamp >= since]
+    if until is not None:
+        conditions.append(PrefixHistory.timestamp <= until)
+    if prefix is not None:
+        conditions.append(PrefixHistory.prefix == cast(prefix, CIDR))
+    if asn is not None:
+        conditions.append(PrefixHistory.asn == asn)
+
+    query = select(
+        PrefixHistory.timestamp, PrefixHistory.asn, PrefixHistory.prefix, PrefixHistory.is_announced
+    ).where(and_(*conditions))
+    if newest_first:
+        query = query.order_by(desc(PrefixHistory.timestamp), PrefixHistory.prefix)
+    else:
+        query = query.order_by(PrefixHistory.timestamp, PrefixHistory.prefix)
+    if limit is not None:
+        query = query.limit(limit)
+
+    result = await session.execute(query)
+    return [PrefixEventRow(timestamp, asn, str(prefix), is_announced)
+            for timestamp, asn, prefix, is_announced in result]
+
+
+async def fetch_latest_prefix_events(session: AsyncSession, prefix: str,
+                                     asn: Optional[int] = None) -> List[PrefixEventRow]:
+    """Último evento de um prefixo por ASN de origem (estado atual, sem limite de período)"""
+    conditions = [PrefixHistory.prefix == cast(prefix, CIDR)]
+    if asn is not None:
+        conditions.append(PrefixHistory.asn == asn)
+
+    query = select(
+        PrefixHistory.timestamp, PrefixHistory.asn, PrefixHistory.prefix, PrefixHistory.is_announced
+    ).where(and_(*conditions)).distinct(PrefixHistory.asn).order_by(
+        PrefixHistory.asn, desc(PrefixHistory.timestamp)
+    )
+
+    result = await session.execute(query)
+    return [PrefixEventRow(timestamp, asn, str(prefix), is_announced)
+            for timestamp, asn, prefix, is_announced in result]
+
+
+async def fetch_related_prefixes(session: AsyncSession, relation: str, prefix: str,
+                                 since: datetime, asn: Optional[int] = None,
+                                 limit: Optional[int] = None) -> List[RelatedPrefixRow]:
+    """
+    Prefixos com eventos no período que contêm, estão contidos ou se sobrepõem
+    ao prefixo consultado (um IP é consultado como /32 ou /128 com 'covering')
+    O filtro de contenção usa o índice GiST; o período restringe as partições
+    """
+    operator = PREFIX_RELATIONS[relation]
+    conditions = [
+        PrefixHistory.prefix.op(operator)(cast(prefix, CIDR)),
+        PrefixHistory.timestamp >= since
+    ]
+    if asn is not None:
+        conditions.append(PrefixHistory.asn == asn)
+
+    query = select(
+        PrefixHistory.prefix,
+        PrefixHistory.asn,
+        func.min(PrefixHistory.timestamp),
+        func.max(PrefixHistory.timestamp),
+        func.array_agg(aggregate_order_by(PrefixHistory.is_announced, desc(PrefixHistory.timestamp)))[1],
+        func.count()
+    ).where(and_(*conditions)).group_by(
+        PrefixHistory.prefix, PrefixHistory.asn
+    ).order_by(PrefixHistory.prefix, PrefixHistory.asn)
+    if limit is not None:
+        query = query.limit(limit)
+
+    result = await session.execute(query)
+    return [RelatedPrefixRow(str(prefix), *rest) for prefix, *rest in result]
+
+
+def _tsrange(lower, upper):
+    # Limites como constante (não parâmetro) para coincidir com a expressão do índice
+    return func.tsrange(lower, upper, literal_column("'[)'"))
+
+
+# Período [announced_from, announced_until) do intervalo; mesma expressão do
+# índice GiST idx_prefix_intervals_asn_period
+INTERVAL_PERIOD = _tsrange(PrefixInterval.announced_from, PrefixInterval.announced_until)
+
+
+def _overlapping_intervals(asn: int, start: datetime, end: datetime):
+    """Intervalos do ASN que se sobrepõem a [start, end)"""
+    return and_(
+        PrefixInterval.asn == asn,
+        INTERVAL_PERIOD.op('&&')(_tsrange(cast(start, DateTime), cast(end, DateTime)))
+    )
+
+
+async def fetch_interval_coverage_start(session: AsyncSession, asn: int) -> Optional[datetime]:
+    """Início do intervalo mais antigo registrado para o ASN"""
+    query = select(func.min(PrefixInterval.announced_from)).where(PrefixInterval.asn == asn)
+    return (await session.execute(query)).scalar()
+
+
+async def fetch_prefixes_at(session: AsyncSession, asn: int, at: datetime) -> List[str]:
+    """Conjunto de prefixos anunciados pelo ASN no instante informado (ordenado)"""
+    query = select(PrefixInterval.prefix).where(
+        and_(PrefixInterval.asn == asn, INTERVAL_PERIOD.op('@>')(cast(at, DateTime)))
+    ).order_by(PrefixInterval.prefix)
+
+    result = await session.execute(query)
+    return [str(prefix) for prefix in result.scalars()]
+
+
+async def fetch_prefix_uptime(session: AsyncSession, asn: int, start: datetime, end: datetime,
+                              prefix: Optional[str] = None) -> List[PrefixUptimeRow]:
+    """
+    Tempo anunciado de cada prefixo do ASN em [start, end): soma da sobreposição
+    de cada intervalo com o período (intervalos abertos contam até end)
+    """
+    until = func.coalesce(PrefixInterval.announced_until, end)
+    overlap = func.least(until, end) - func.greatest(PrefixInterval.announced_from, start)
+    conditions = [_overlapping_intervals(asn, start, end)]
+    if prefix is not None:
+        conditions.append(PrefixInterval.prefix == cast(prefix, CIDR))
+
+    query = select(
+        PrefixInterval.prefix,
+        func.sum(func.extract('epoch', overlap)),
+        func.count(),
+        # Intervalos são [from, until): retirado exatamente em end não está anunciado em end
+        func.bool_or(PrefixInterval.announced_until.is_(None) | (PrefixInterval.announced_until > end))
+    ).where(and_(*conditions)).group_by(PrefixInterval.prefix).order_by(PrefixInterval.prefix)
+
+    result = await session.execute(query)
+    return [
+        PrefixUptimeRow(str(prefix), float(seconds), count, bool(at_end))
+        for prefix, seconds, count, at_end in result
+    ]
@@ -1,14 +1,30 @@
 """
 Database models for BGP monitoring data
 """
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, Boolean, Index
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, Text, Boolean, Index, LargeBinary
+from sqlalchemy.dialects.postgresql import CIDR, JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql import func, literal_column, text
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
 Base = declarative_base()
 
+# Tipos de snapshot: "full" guarda o conjunto completo de prefixos (keyframe),
+# "delta" guarda apenas os prefixos adicionados/removidos desde o snapshot anterior
+# e "heartbeat" registra uma coleta cujo conjunto não mudou (sem dados de prefixos)
+SNAPSHOT_FULL = "full"
+SNAPSHOT_DELTA = "delta"
+SNAPSHOT_HEARTBEAT = "heartbeat"
+
+# Índices BRIN de timestamp das tabelas históricas (inserções em ordem de tempo):
+# faixas de 32 páginas e resumo automático das faixas novas pelo autovacuum
+BRIN_TIMESTAMP_OPTIONS = {'pages_per_range': 32, 'autosummarize': 'on'}
+
+# asn_snapshots, prefix_history e bgp_alerts são particionadas por mês (RANGE em
+# timestamp); a chave primária inclui timestamp, exigência do particionamento
+
 
 class ASNSnapshot(Base):
     """
@@ -17,15 +33,20 @@ class ASNSnapshot(Base):
     __tablename__ = "asn_snapshots"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    asn = Column(Integer, nullable=False, index=True)
-    timestamp = Column(DateTime, nullable=False, default=func.now(), index=True)
+    asn = Column(Integer, nullable=False)
+    timestamp = Column(DateTime, primary_key=True, nullable=False, default=func.now())
     
     # Dados dos prefixos anunciados
-    announced_prefixes = Column(JSON, nullable=False)  # Lista de prefixos
+    snapshot_type = Column(String(16), nullable=False, default=SNAPSHOT_FULL)
+    # Colunas JSONB pesadas são carregadas sob demanda (grupo "prefixes")
+    announced_prefixes = deferred(Column(JSONB, nullable=True), group="prefixes")  # Lista completa (apenas snapshots "full")
+    added_prefixes = deferred(Column(JSONB, nullable=True), group="prefixes")  # Delta em relação ao snapshot anterior
+    removed_prefixes = deferred(Column(JSONB, nullable=True), group="prefixes")
     prefix_count = Column(Integer, nullable=False)
+    prefix_hash = Column(String(64), nullable=True)  # SHA-256 do conjunto normalizado de prefixos
     
     # Dados de peers/upstreams
-    peer_data = Column(JSON, nullable=True)
+    peer_data = deferred(Column(JSONB, nullable=True), group="prefixes")
     upstream_count = Column(Integer, nullable=True)
     
     # Status geral
@@ -33,12 +54,24 @@ class ASNSnapshot(Base):
     
     # Metadata
     data_source = Column(String(50), nullable=False, default="ripe")
-    raw_data = Column(JSON, nullable=True)  # Dados brutos da API
+    raw_payload_hash = Column(String(64), nullable=True)  # Dados brutos da API (tabela raw_payloads)
     
     # Índices compostos para queries eficientes
     __table_args__ = (
         Index('idx_asn_timestamp', 'asn', 'timestamp'),
-        Index('idx_timestamp_asn', 'timestamp', 'asn'),
+        # Faixas de tempo sem ASN (listagens, contenção, retenção) usam o BRIN
+        Index('idx_asn_snapshots_timestamp_brin', 'timestamp',
+              postgresql_using='brin', postgresql_with=BRIN_TIMESTAMP_OPTIONS),
+        Index('idx_asn_prefix_hash', 'asn', 'prefix_hash'),
+        # Referências a raw_payloads (limpeza de payloads órfãos)
+        Index('idx_asn_snapshots_raw_payload_hash', 'raw_payload_hash',
+              postgresql_where=text('raw_payload_hash IS NOT NULL')),
+        # Pertinência de prefixos (@>) em keyframes e deltas
+        Index('idx_asn_snapshots_announced_gin', 'announced_prefixes',
+              postgresql_using='gin', postgresql_ops={'announced_prefixes': 'jsonb_path_ops'}),
+        Index('idx_asn_snapshots_added_gin', 'added_prefixes',
+              postgresql_using='gin', postgresql_ops={'added_prefixes': 'jsonb_path_ops'}),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
     )
     
     def to_dict(self) -> Dict[str, Any]:
@@ -46,12 +79,106 @@ class ASNSnapshot(Base):
             'id': self.id,
             'asn': self.asn,
             'timestamp': self.timestamp.isoformat(),
+            'snapshot_type': self.snapshot_type,
             'announced_prefixes': self.announced_prefixes,
+            'added_prefixes': self.added_prefixes,
+            'removed_prefixes': self.removed_prefixes,
             'prefix_count': self.prefix_count,
+            'prefix_hash': self.prefix_hash,
             'peer_data': self.peer_data,
             'upstream_count': self.upstream_count,
             'is_announcing': self.is_announcing,
-            'data_source': self.data_source
+            'data_source': self.data_source,
+            'raw_payload_hash': self.raw_payload_hash
+        }
+
+
+class RawPayload(Base):
+    """
+    Payloads brutos da API arquivados de forma comprimida
+    Endereçados pelo hash do conteúdo: payloads idênticos são armazenados uma única vez
+    """
+    __tablename__ = "raw_payloads"
+    
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 do JSON canônico
+    encoding = Column(String(16), nullable=False)  # zstd ou gzip
+    payload = Column(LargeBinary, nullable=False)
+    size_bytes = Column(Integer, nullable=False)  # Tamanho original (JSON)
+    compressed_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now())  # Criação ou último reuso
+
+
+class PrefixCountRollupMixin:
+    """
+    Agregados incrementais de prefix_count por ASN e intervalo (bucket)
+    Soma e soma dos quadrados permitem calcular média e variância combinando buckets
+    """
+    asn = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)  # Início do intervalo
+    
+    snapshot_count = Column(Integer, nullable=False)
+    prefix_count_sum = Column(BigInteger, nullable=False)
+    prefix_count_sum_sq = Column(BigInteger, nullable=False)
+    prefix_count_min = Column(Integer, nullable=False)
+    prefix_count_max = Column(Integer, nullable=False)
+    
+    # Primeiro e último snapshot do intervalo
+    first_timestamp = Column(DateTime, nullable=False)
+    first_prefix_count = Column(Integer, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+    last_prefix_count = Column(Integer, nullable=False)
+
+
+class ASNHourlyStats(PrefixCountRollupMixin, Base):
+    """Rollup horário de prefix_count por ASN"""
+    __tablename__ = "asn_stats_hourly"
+
+
+class ASNDailyStats(PrefixCountRollupMixin, Base):
+    """Rollup diário de prefix_count por ASN"""
+    __tablename__ = "asn_stats_daily"
+
+
+class ASNCurrentState(Base):
+    """
+    Estado corrente de cada ASN (uma linha por ASN)
+    Atualizado por upsert na mesma transação que grava o snapshot: leituras do
+    estado atual não dependem do tamanho do histórico
+    """
+    __tablename__ = "asn_current_state"
+    
+    asn = Column(Integer, primary_key=True)
+    updated_at = Column(DateTime, nullable=False)  # Instante do último snapshot
+    last_snapshot_id = Column(Integer, nullable=True)
+    last_snapshot_type = Column(String(16), nullable=False)
+    
+    # Conjunto de prefixos atual
+    prefix_hash = Column(String(64), nullable=True)
+    prefix_count = Column(Integer, nullable=False)
+    ipv4_prefix_count = Column(Integer, nullable=True)
+    ipv6_prefix_count = Column(Integer, nullable=True)
+    upstream_count = Column(Integer, nullable=True)
+    is_announcing = Column(Boolean, nullable=False)
+    last_changed_at = Column(DateTime, nullable=True)  # Última mudança do conjunto (hash)
+    
+    # Base da codificação delta: último keyframe e snapshots gravados desde ele
+    last_keyframe_at = Column(DateTime, nullable=True)
+    snapshots_since_keyframe = Column(Integer, nullable=False, default=0)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'asn': self.asn,
+            'updated_at': self.updated_at.isoformat(),
+            'last_snapshot_id': self.last_snapshot_id,
+            'last_snapshot_type': self.last_snapshot_type,
+            'prefix_hash': self.prefix_hash,
+            'prefix_count': self.prefix_count,
+            'ipv4_prefix_count': self.ipv4_prefix_count,
+            'ipv6_prefix_count': self.ipv6_prefix_count,
+            'upstream_count': self.upstream_count,
+            'is_announcing': self.is_announcing,
+            'last_changed_at': self.last_changed_at.isoformat() if self.last_changed_at else None,
+            'last_keyframe_at': self.last_keyframe_at.isoformat() if self.last_keyframe_at else None
         }
 
 
@@ -62,9 +189,9 @@ class PrefixHistory(Base):
     __tablename__ = "prefix_history"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    prefix = Column(String(43), nullable=False, index=True)  # IPv6 pode ter até 43 chars
-    asn = Column(Integer, nullable=False, index=True)
-    timestamp = Column(DateTime, nullable=False, default=func.now(), index=True)
+    prefix = Column(CIDR, nullable=False)
+    asn = Column(Integer, nullable=False)
+    timestamp = Column(DateTime, primary_key=True, nullable=False, default=func.now())
     
     # Status do prefixo
     is_announced = Column(Boolean, nullable=False)
@@ -80,9 +207,53 @@ class PrefixHistory(Base):
     __table_args__ = (
         Index('idx_prefix_timestamp', 'prefix', 'timestamp'),
         Index('idx_asn_prefix_timestamp', 'asn', 'prefix', 'timestamp'),
+        Index('idx_prefix_history_timestamp_brin', 'timestamp',
+              postgresql_using='brin', postgresql_with=BRIN_TIMESTAMP_OPTIONS),
+        # Consultas de contenção/sobreposição (<<=, >>=, &&) sobre o prefixo
+        Index('idx_prefix_history_prefix_gist', 'prefix',
+              postgresql_using='gist', postgresql_ops={'prefix': 'inet_ops'}),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
     )
 
 
+class PrefixInterval(Base):
+    """
+    Intervalos de presença de cada prefixo anunciado por um ASN
+    Abertos/fechados na ingestão a partir dos eventos de anúncio/retirada
+    """
+    __tablename__ = "prefix_intervals"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    asn = Column(Integer, nullable=False)
+    prefix = Column(CIDR, nullable=False)
+    announced_from = Column(DateTime, nullable=False)
+    announced_until = Column(DateTime, nullable=True)  # NULL = ainda anunciado
+    
+    # "ripe" (ingestão) ou "ripe_timelines" (semeado a partir dos timelines da API)
+    data_source = Column(String(50), nullable=False, default="ripe")
+    
+    __table_args__ = (
+        Index('idx_prefix_intervals_asn_from', 'asn', 'announced_from'),
+        Index('idx_prefix_intervals_asn_prefix_from', 'asn', 'prefix', 'announced_from'),
+        # No máximo um intervalo aberto por (asn, prefixo)
+        Index('uq_prefix_intervals_open', 'asn', 'prefix', unique=True,
+              postgresql_where=text('announced_until IS NULL')),
+        # Consultas pontuais/de sobreposição no período (requer btree_gist)
+        Index('idx_prefix_intervals_asn_period', asn,
+              func.tsrange(announced_from, announced_until, literal_column("'[)'")),
+              postgresql_using='gist'),
+    )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'asn': self.asn,
+            'prefix': str(self.prefix),
+            'announced_from': self.announced_from.isoformat(),
+            'announced_until': self.announced_until.isoformat() if self.announced_until else None,
+            'data_source': self.data_source
+        }
+
+
 class BGPAlert(Base):
     """
     Histórico de alertas gerados pelo sistema
@@ -90,16 +261,16 @@ class BGPAlert(Base):
     __tablename__ = "bgp_alerts"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    asn = Column(Integer, nullable=False, index=True)
+    asn = Column(Integer, nullable=False)
     alert_type = Column(String(50), nullable=False, index=True)  # 'prefix_withdrawal', 'new_prefix', etc.
-    timestamp = Column(DateTime, nullable=False, default=func.now(), index=True)
+    timestamp = Column(DateTime, primary_key=True, nullable=False, default=func.now())
     
     # Conteúdo do alerta
     message = Column(Text, nullable=False)
     severity = Column(String(20), nullable=False, default="info")  # info, warning, critical
     
     # Dados relacionados
-    prefix = Column(String(43), nullable=True, index=True)
+    prefix = Column(CIDR, nullable=True, index=True)
     old_value = Column(JSON, nullable=True)
     new_value = Column(JSON, nullable=True)
     
@@ -109,6 +280,11 @@ class BGPAlert(Base):
     
     __table_args__ = (
         Index('idx_asn_alert_type_timestamp', 'asn', 'alert_type', 'timestamp'),
+        Index('idx_bgp_alerts_timestamp_brin', 'timestamp',
+              postgresql_using='brin', postgresql_with=BRIN_TIMESTAMP_OPTIONS),
+        Index('idx_bgp_alerts_prefix_gist', 'prefix',
+              postgresql_using='gist', postgresql_ops={'prefix': 'inet_ops'}),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
     )
 
 
@@ -119,7 +295,7 @@ class SystemMetrics(Base):
     __tablename__ = "system_metrics"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    timestamp = Column(DateTime, nullable=False, default=func.now(), index=True)
+    timestamp = Column(DateTime, nullable=False, default=func.now())
     
     # Métricas de API
     api_calls_count = Column(Integer, nullable=False, default=0)
@@ -133,3 +309,8 @@ class SystemMetrics(Base):
     
     # Dados detalhados
     metrics_data = Column(JSON, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_system_metrics_timestamp_brin', 'timestamp',
+              postgresql_using='brin', postgresql_with=BRIN_TIMESTAMP_OPTIONS),
+    )
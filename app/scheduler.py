@@ -11,9 +11,12 @@ from app.services.telegram import telegram_service
 from app.services.prefix_monitor import prefix_monitor
 from app.services.peer_monitor import peer_monitor
 from app.services.irr_validator import irr_validator
-from app.services.bgp_data_service import bgp_data_service
+from app.services.bgp_data_service import bgp_data_service, estimate_collected_bytes
 from app.services.anomaly_detector import anomaly_detector
-from app.database.connection import init_database, close_database
+from app.services.ripe_api import ripe_api
+from app.services.write_buffer import write_buffer
+from app.services.spill_replay import spill_replayer
+from app.database.connection import init_database, close_database, db_manager, use_pool, ANALYTICS_POOL
 from app.utils.metrics import metrics
 import logging
 
@@ -26,13 +29,22 @@ class BGPScheduler:
     def __init__(self):
         self.running = False
         self.thread = None
-        self.loop = None
+        self.loop = None  # Event loop da aplicação, onde as tarefas assíncronas executam
         self.monitored_asns = []  # Lista de ASNs para monitoramento histórico
         
     async def initialize(self):
-        """Inicializa o banco de dados e configurações"""
+        """
+        Inicializa o banco de dados e configurações
+        Deve ser chamado no event loop da aplicação: conexões do banco e do
+        cliente RIPE pertencem ao loop que as abriu, então as tarefas agendadas
+        são submetidas a este mesmo loop
+        """
+        self.loop = asyncio.get_running_loop()
         await init_database()
         
+        # Abrir cliente HTTP compartilhado da API RIPE (keep-alive entre coletas)
+        await ripe_api.start()
+        
         # Carregar ASNs do gerenciador de configuração
         self.monitored_asns = asn_config_manager.get_enabled_asns()
         
@@ -48,6 +60,17 @@ class BGPScheduler:
             )
             self.monitored_asns = [settings.target_asn]
         
+        # Último conjunto de prefixos de cada ASN em memória antes da primeira coleta
+        try:
+            await bgp_data_service.warm_prefix_cache(self.monitored_asns)
+        except Exception as e:
+            logger.warning(f"Failed to warm prefix cache: {e}")
+        
+        if settings.write_behind_enabled:
+            write_buffer.register("snapshot", bgp_data_service.flush_snapshots, estimate_collected_bytes)
+            write_buffer.register("alert", anomaly_detector.persist_alerts)
+            write_buffer.start()
+        
         logger.info(f"Scheduler initialized with {len(self.monitored_asns)} ASNs for historical monitoring: {self.monitored_asns}")
         
     def start(self):
@@ -69,6 +92,7 @@ class BGPScheduler:
         schedule.every(5).minutes.do(self._run_historical_collection)  # Coleta a cada 5 minutos
         schedule.every(30).minutes.do(self._run_anomaly_detection)     # Detecção de anomalias
         schedule.every().day.at("02:00").do(self._run_data_cleanup)    # Limpeza diária
+        schedule.every(settings.spill_replay_interval).seconds.do(self._run_spill_replay)  # Replay do spill journal
         schedule.every().day.at("06:00").do(self._send_weekly_analysis) # Relatório semanal (domingo)
         
         # Iniciar thread do scheduler
@@ -85,15 +109,16 @@ class BGPScheduler:
     
     def _scheduler_loop(self):
         """Loop principal do scheduler"""
-        # Criar event loop para tarefas assíncronas
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-        
+        # A thread apenas dispara os horários; as tarefas assíncronas executam no
+        # event loop da aplicação (self.loop), dono das conexões do banco e da API RIPE
         while self.running:
             schedule.run_pending()
             time.sleep(1)
-            
-        self.loop.close()
+    
+    async def _in_pool(self, pool: str, coro):
+        """Executa a tarefa com as sessões do banco direcionadas ao pool informado"""
+        with use_pool(pool):
+            return await coro
     
     def _run_prefix_check(self):
         """Executa verificação de prefixos"""
@@ -228,11 +253,9 @@ class BGPScheduler:
         """Verificação assíncrona de saúde"""
         try:
             # Verifica conectividade com serviços externos
-            from app.services.ripe_api import ripe_api
-            
             # Teste básico da API RIPE
             try:
-                await ripe_api.get_announced_prefixes(settings.target_asn)
+                await ripe_api.get_announced_prefix_set(settings.target_asn)
                 metrics.update_component_health("ripe_api", True)
             except Exception:
                 metrics.update_component_health("ripe_api", False)
@@ -260,7 +283,7 @@ class BGPScheduler:
             
             if self.loop:
                 asyncio.run_coroutine_threadsafe(
-                    self._async_daily_report(), self.loop
+                    self._in_pool(ANALYTICS_POOL, self._async_daily_report()), self.loop
                 ).result(timeout=120)
             
         except Exception as e:
@@ -356,7 +379,7 @@ Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}"""
                 
             logger.info("Starting anomaly detection...")
             asyncio.run_coroutine_threadsafe(
-                self._async_anomaly_detection(), self.loop
+                self._in_pool(ANALYTICS_POOL, self._async_anomaly_detection()), self.loop
             ).result(timeout=180)  # 3 minutos timeout
             
         except Exception as e:
@@ -400,17 +423,31 @@ Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}"""
                 return
                 
             logger.info("Starting data cleanup...")
-            asyncio.run_coroutine_threadsafe(
+            # A limpeza roda em lotes com limite de taxa e pode demorar; não
+            # bloqueia a thread do scheduler (erros são registrados no callback)
+            future = asyncio.run_coroutine_threadsafe(
                 self._async_data_cleanup(), self.loop
-            ).result(timeout=600)  # 10 minutos timeout
+            )
+            future.add_done_callback(self._on_data_cleanup_done)
             
         except Exception as e:
             logger.error(f"Data cleanup failed: {str(e)}")
     
+    def _on_data_cleanup_done(self, future):
+        """Registra falhas da limpeza executada em segundo plano"""
+        if future.cancelled():
+            logger.warning("Data cleanup cancelled")
+        elif future.exception():
+            logger.error(f"Data cleanup failed: {future.exception()}")
+    
     async def _async_data_cleanup(self):
         """Executa limpeza de dados antigos assíncrona"""
         try:
-            await bgp_data_service.cleanup_old_data(settings.data_retention_days)
+            # Partições dos próximos meses são criadas antes de remover as expiradas
+            await db_manager.ensure_partitions()
+            report = await bgp_data_service.cleanup_old_data(settings.data_retention_days)
+            if report.get("skipped"):
+                return
             logger.info("Data cleanup completed successfully")
             metrics.increment_counter("data_cleanups")
             
@@ -418,6 +455,26 @@ Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}"""
             logger.error(f"Data cleanup error: {e}")
             metrics.increment_counter("data_cleanup_errors")
     
+    def _run_spill_replay(self):
+        """Carrega no banco os snapshots do spill journal, se houver"""
+        try:
+            if not self.loop or not bgp_data_service.spill_journal.has_pending():
+                return
+            
+            # O replay pode demorar; não bloqueia a thread do scheduler
+            future = asyncio.run_coroutine_threadsafe(spill_replayer.run(), self.loop)
+            future.add_done_callback(self._on_spill_replay_done)
+            
+        except Exception as e:
+            logger.error(f"Spill replay failed: {str(e)}")
+    
+    def _on_spill_replay_done(self, future):
+        """Registra falhas do replay executado em segundo plano"""
+        if future.cancelled():
+            logger.warning("Spill replay cancelled")
+        elif future.exception():
+            logger.error(f"Spill replay failed: {future.exception()}")
+    
     def _send_weekly_analysis(self):
         """Envia análise semanal (apenas aos domingos)"""
         if datetime.now().weekday() != 6:  # 6 = domingo
@@ -429,7 +486,7 @@ Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}"""
                 
             logger.info("Starting weekly analysis...")
             asyncio.run_coroutine_threadsafe(
-                self._async_weekly_analysis(), self.loop
+                self._in_pool(ANALYTICS_POOL, self._async_weekly_analysis()), self.loop
             ).result(timeout=300)
             
         except Exception as e:
@@ -443,9 +500,12 @@ Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}"""
             
             weekly_reports = []
             
+            # Estatísticas da semana de todos os ASNs em uma única consulta
+            weekly_stats = await bgp_data_service.get_multiple_asn_statistics(self.monitored_asns, days_back=7)
+            
             for asn in self.monitored_asns:
                 # Gerar estatísticas da semana
-                stats = await bgp_data_service.get_asn_statistics(asn, days_back=7)
+                stats = weekly_stats.get(asn, {'error': 'No data available'})
                 
                 # Detectar alterações da semana
                 changes = await bgp_data_service.detect_prefix_changes(asn, hours_back=168)  # 7 dias
@@ -557,6 +617,9 @@ Esta mensagem é enviada automaticamente quando múltiplas anomalias de alta sev
     async def cleanup(self):
         """Limpeza final do scheduler"""
         try:
+            # Gravar tudo o que estiver no buffer write-behind antes de fechar o banco
+            await write_buffer.close()
+            await ripe_api.close()
             await close_database()
             logger.info("Scheduler cleanup completed")
         except Exception as e:
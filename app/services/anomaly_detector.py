@@ -5,14 +5,15 @@ Detecta alterações bruscas e anomalias nos dados BGP usando análise estatíst
 import asyncio
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
-from sqlalchemy import select, func, desc, and_, or_
-import statistics
+from sqlalchemy import insert, func, or_
 import logging
 
-from app.models.database import ASNSnapshot, BGPAlert
-from app.database.connection import db_manager
+from app.models.database import BGPAlert
+from app.database.connection import db_manager, INGEST_POOL
+from app.database.queries import fetch_count_baselines, CountBaselineRow
 from app.services.bgp_data_service import bgp_data_service
 from app.services.telegram import telegram_service
+from app.services.write_buffer import write_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +34,16 @@ class BGPAnomalyDetector:
             asn: Número do ASN a analisar
             sensitivity: "low", "medium", "high" - sensibilidade da detecção
         """
+        anomalies = await self.detect_sudden_changes_multiple([asn], sensitivity)
+        return anomalies.get(asn, [])
+    
+    async def detect_sudden_changes_multiple(self, asn_list: List[int],
+                                             sensitivity: str = "medium") -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Detecta mudanças bruscas em vários ASNs
+        Baseline (média e desvio padrão) e snapshots recentes vêm de uma única
+        consulta agrupada no PostgreSQL; apenas 10 linhas por ASN retornam à aplicação
+        """
         # Configurações de sensibilidade
         sensitivity_config = {
             "low": {"std_multiplier": 3.0, "min_change_percent": 20},
@@ -45,78 +56,81 @@ class BGPAnomalyDetector:
         # Buscar dados históricos (últimas 48 horas)
         cutoff_time = datetime.now() - timedelta(hours=48)
         
-        from app.database.connection import db_manager
         async with db_manager.get_session() as session:
-            query = select(ASNSnapshot).where(
-                and_(
-                    ASNSnapshot.asn == asn,
-                    ASNSnapshot.timestamp >= cutoff_time
-                )
-            ).order_by(desc(ASNSnapshot.timestamp))
-            
-            result = await session.execute(query)
-            snapshots = result.scalars().all()
+            rows = await fetch_count_baselines(session, asn_list, cutoff_time, recent=10)
+        
+        recent_by_asn: Dict[int, List[CountBaselineRow]] = {}
+        for row in rows:
+            recent_by_asn.setdefault(row.asn, []).append(row)
+        
+        results = {}
+        for asn, recent in recent_by_asn.items():
+            results[asn] = await self._evaluate_sudden_changes(asn, recent, config)
+        return results
+    
+    async def _evaluate_sudden_changes(self, asn: int, recent: List[CountBaselineRow],
+                                       config: Dict[str, float]) -> List[Dict[str, Any]]:
+        """Compara os snapshots recentes (mais recentes primeiro) com o baseline do ASN"""
+        # Precisa de dados suficientes (snapshots recentes + baseline)
+        if recent[0].total_snapshots < 10 or recent[0].baseline_mean is None:
+            return []
+        
+        anomalies = []
+        
+        # Baseline estatístico (exclui os 10 mais recentes)
+        baseline_mean = recent[0].baseline_mean
+        baseline_std = recent[0].baseline_std
+        
+        # Analisar os snapshots mais recentes
+        for snapshot in recent:
+            current_count = snapshot.prefix_count
             
-            if len(snapshots) < 10:  # Precisa de dados suficientes
-                return []
+            # Calcular desvio do baseline
+            if baseline_std > 0:
+                z_score = abs(current_count - baseline_mean) / baseline_std
+            else:
+                z_score = 0
             
-            anomalies = []
-            prefix_counts = [s.prefix_count for s in snapshots]
+            # Calcular mudança percentual em relação à média
+            percent_change = abs(current_count - baseline_mean) / baseline_mean * 100 if baseline_mean > 0 else 0
             
-            # Calcular baseline estatístico
-            baseline_mean = statistics.mean(prefix_counts[10:])  # Excluir os 10 mais recentes
-            baseline_std = statistics.stdev(prefix_counts[10:]) if len(prefix_counts[10:]) > 1 else 0
+            # Detectar anomalia
+            is_anomaly = (
+                z_score > config["std_multiplier"] and 
+                percent_change > config["min_change_percent"]
+            )
             
-            # Analisar os snapshots mais recentes
-            for i, snapshot in enumerate(snapshots[:10]):
-                current_count = snapshot.prefix_count
+            if is_anomaly:
+                anomaly_type = "sudden_increase" if current_count > baseline_mean else "sudden_decrease"
                 
-                # Calcular desvio do baseline
-                if baseline_std > 0:
-                    z_score = abs(current_count - baseline_mean) / baseline_std
-                else:
-                    z_score = 0
-                
-                # Calcular mudança percentual em relação à média
-                percent_change = abs(current_count - baseline_mean) / baseline_mean * 100 if baseline_mean > 0 else 0
+                anomaly = {
+                    "timestamp": snapshot.timestamp.isoformat(),
+                    "asn": asn,
+                    "type": anomaly_type,
+                    "severity": self._calculate_severity(z_score, percent_change),
+                    "current_prefixes": current_count,
+                    "baseline_mean": round(baseline_mean, 2),
+                    "z_score": round(z_score, 2),
+                    "percent_change": round(percent_change, 2),
+                    "description": f"Detected {anomaly_type} in AS{asn}: {current_count} prefixes ({percent_change:.1f}% change)"
+                }
                 
-                # Detectar anomalia
-                is_anomaly = (
-                    z_score > config["std_multiplier"] and 
-                    percent_change > config["min_change_percent"]
-                )
+                # Registrar anomalia ativa
+                self.active_anomalies[asn] = {
+                    "type": anomaly_type,
+                    "detected_at": snapshot.timestamp,
+                    "severity": anomaly["severity"],
+                    "z_score": z_score,
+                    "percent_change": percent_change
+                }
                 
-                if is_anomaly:
-                    anomaly_type = "sudden_increase" if current_count > baseline_mean else "sudden_decrease"
-                    
-                    anomaly = {
-                        "timestamp": snapshot.timestamp.isoformat(),
-                        "asn": asn,
-                        "type": anomaly_type,
-                        "severity": self._calculate_severity(z_score, percent_change),
-                        "current_prefixes": current_count,
-                        "baseline_mean": round(baseline_mean, 2),
-                        "z_score": round(z_score, 2),
-                        "percent_change": round(percent_change, 2),
-                        "description": f"Detected {anomaly_type} in AS{asn}: {current_count} prefixes ({percent_change:.1f}% change)"
-                    }
-                    
-                    # Registrar anomalia ativa
-                    self.active_anomalies[asn] = {
-                        "type": anomaly_type,
-                        "detected_at": snapshot.timestamp,
-                        "severity": anomaly["severity"],
-                        "z_score": z_score,
-                        "percent_change": percent_change
-                    }
-                    
-                    anomalies.append(anomaly)
-                else:
-                    # Não há anomalia - verificar se havia uma ativa e foi resolvida
-                    if asn in self.active_anomalies:
-                        await self._check_anomaly_recovery(asn, current_count, baseline_mean, snapshot.timestamp)
-    
-            return anomalies
+                anomalies.append(anomaly)
+            else:
+                # Não há anomalia - verificar se havia uma ativa e foi resolvida
+                if asn in self.active_anomalies:
+                    await self._check_anomaly_recovery(asn, current_count, baseline_mean, snapshot.timestamp)
+        
+        return anomalies
     
     async def detect_routing_instability(self, asn: int, window_hours: int = 6) -> Dict[str, Any]:
         """
@@ -124,63 +138,47 @@ class BGPAnomalyDetector:
         """
         cutoff_time = datetime.now() - timedelta(hours=window_hours)
         
-        async with db_manager.get_session() as session:
-            query = select(ASNSnapshot).where(
-                and_(
-                    ASNSnapshot.asn == asn,
-                    ASNSnapshot.timestamp >= cutoff_time
-                )
-            ).order_by(ASNSnapshot.timestamp)
-            
-            result = await session.execute(query)
-            snapshots = result.scalars().all()
-            
-            if len(snapshots) < 3:
-                return {"instability_score": 0, "status": "insufficient_data"}
-            
-            # Contar mudanças consecutivas
-            changes = 0
-            total_change_magnitude = 0
-            
-            for i in range(1, len(snapshots)):
-                current = snapshots[i]
-                previous = snapshots[i-1]
-                
-                current_prefixes = set(current.announced_prefixes)
-                previous_prefixes = set(previous.announced_prefixes)
-                
-                if current_prefixes != previous_prefixes:
-                    changes += 1
-                    # Calcular magnitude da mudança
-                    added = len(current_prefixes - previous_prefixes)
-                    removed = len(previous_prefixes - current_prefixes)
-                    total_change_magnitude += added + removed
-            
-            # Calcular score de instabilidade
-            change_frequency = changes / len(snapshots) * 100  # Porcentagem de snapshots com mudanças
-            avg_change_magnitude = total_change_magnitude / changes if changes > 0 else 0
-            
-            # Score combinado (0-100, onde 100 é muito instável)
-            instability_score = min(100, change_frequency * 2 + (avg_change_magnitude / 10))
-            
-            status = "stable"
-            if instability_score > 70:
-                status = "highly_unstable"
-            elif instability_score > 40:
-                status = "unstable"
-            elif instability_score > 20:
-                status = "moderately_stable"
-            
-            return {
-                "asn": asn,
-                "window_hours": window_hours,
-                "instability_score": round(instability_score, 2),
-                "status": status,
-                "total_changes": changes,
-                "change_frequency_percent": round(change_frequency, 2),
-                "avg_change_magnitude": round(avg_change_magnitude, 2),
-                "recommendation": self._get_instability_recommendation(status)
-            }
+        # Comparação de hashes primeiro; conjuntos só são reconstruídos se houve mudança
+        snapshot_count, change_count = await bgp_data_service.get_change_summary(asn, cutoff_time)
+        prefix_changes = []
+        if change_count > 0:
+            snapshot_count, prefix_changes = await bgp_data_service.get_prefix_changes(asn, cutoff_time)
+        
+        if snapshot_count < 3:
+            return {"instability_score": 0, "status": "insufficient_data"}
+        
+        # Contar mudanças consecutivas
+        changes = len(prefix_changes)
+        total_change_magnitude = sum(
+            len(change["added_prefixes"]) + len(change["removed_prefixes"])
+            for change in prefix_changes
+        )
+        
+        # Calcular score de instabilidade
+        change_frequency = changes / snapshot_count * 100  # Porcentagem de snapshots com mudanças
+        avg_change_magnitude = total_change_magnitude / changes if changes > 0 else 0
+        
+        # Score combinado (0-100, onde 100 é muito instável)
+        instability_score = min(100, change_frequency * 2 + (avg_change_magnitude / 10))
+        
+        status = "stable"
+        if instability_score > 70:
+            status = "highly_unstable"
+        elif instability_score > 40:
+            status = "unstable"
+        elif instability_score > 20:
+            status = "moderately_stable"
+        
+        return {
+            "asn": asn,
+            "window_hours": window_hours,
+            "instability_score": round(instability_score, 2),
+            "status": status,
+            "total_changes": changes,
+            "change_frequency_percent": round(change_frequency, 2),
+            "avg_change_magnitude": round(avg_change_magnitude, 2),
+            "recommendation": self._get_instability_recommendation(status)
+        }
     
     async def monitor_multiple_asns(self, asn_list: List[int]) -> Dict[str, Any]:
         """
@@ -198,11 +196,17 @@ class BGPAnomalyDetector:
             }
         }
         
-        # Processar ASNs em batches para não sobrecarregar
+        # Anomalias de todos os ASNs com uma única consulta de baseline
+        try:
+            sudden_changes = await self.detect_sudden_changes_multiple(asn_list, "medium")
+        except Exception as e:
+            logger.error(f"Error detecting sudden changes: {e}")
+            sudden_changes = {}
+        
         for asn in asn_list:
             try:
                 # Detectar anomalias
-                anomalies = await self.detect_sudden_changes(asn, "medium")
+                anomalies = sudden_changes.get(asn, [])
                 if anomalies:
                     results["anomalies"].extend(anomalies)
                     results["summary"]["total_anomalies"] += len(anomalies)
@@ -256,21 +260,21 @@ class BGPAnomalyDetector:
             if time_diff < 3600:  # 1 hora
                 return
         
-        # Criar alerta no banco de dados
-        async with db_manager.get_session() as session:
-            alert = BGPAlert(
-                asn=asn,
-                alert_type=anomaly["type"],
-                message=anomaly["description"],
-                severity=anomaly["severity"],
-                new_value={
-                    "current_prefixes": anomaly["current_prefixes"],
-                    "z_score": anomaly["z_score"],
-                    "percent_change": anomaly["percent_change"]
-                }
-            )
-            session.add(alert)
-            await session.commit()
+        # Registrar alerta no banco de dados (via buffer write-behind quando ativo)
+        alert = {
+            "asn": asn,
+            "alert_type": anomaly["type"],
+            "timestamp": current_time,
+            "message": anomaly["description"],
+            "severity": anomaly["severity"],
+            "new_value": {
+                "current_prefixes": anomaly["current_prefixes"],
+                "z_score": anomaly["z_score"],
+                "percent_change": anomaly["percent_change"]
+            }
+        }
+        if not await write_buffer.submit("alert", [alert]):
+            await self.persist_alerts([alert])
         
         # Enviar via Telegram
         emoji = "🚨" if anomaly["severity"] == "critical" else "⚠️"
@@ -291,6 +295,15 @@ class BGPAnomalyDetector:
         # Atualizar cache de cooldown
         self.alert_cooldown[alert_key] = current_time
     
+    async def persist_alerts(self, alerts: List[Dict[str, Any]]):
+        """Grava um lote de alertas em uma única transação (executemany)"""
+        if not alerts:
+            return
+        
+        async with db_manager.get_session(INGEST_POOL) as session:
+            await session.execute(insert(BGPAlert), alerts)
+            await session.commit()
+    
     def _calculate_severity(self, z_score: float, percent_change: float) -> str:
         """Calcula a severidade baseada no z-score e mudança percentual"""
         if z_score > 4.0 or percent_change > 50:
@@ -2,211 +2,1312 @@
 BGP Data Service - Gerencia o armazenamento e análise de dados BGP históricos
 """
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
-from sqlalchemy import select, func, desc, and_, or_
+import hashlib
+import ipaddress
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Set, Tuple, FrozenSet
+from sqlalchemy import select, func, desc, and_, or_, not_, case, cast, update, delete, bindparam, any_
+from sqlalchemy.dialects.postgresql import insert, ARRAY, CIDR
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
-from app.models.database import ASNSnapshot, PrefixHistory, BGPAlert, SystemMetrics
-from app.database.connection import db_manager
-from app.services.ripe_api import RIPEStatAPI
+from app.models.database import (
+    ASNSnapshot, ASNCurrentState, PrefixHistory, PrefixInterval, SystemMetrics, RawPayload,
+    ASNHourlyStats, ASNDailyStats,
+    SNAPSHOT_FULL, SNAPSHOT_DELTA, SNAPSHOT_HEARTBEAT
+)
+from app.database.connection import db_manager, is_connection_error, INGEST_POOL
+from app.database.queries import (
+    stream_prefix_rows, fetch_rollup_statistics, fetch_prefix_events, fetch_latest_prefix_events,
+    fetch_related_prefixes, fetch_snapshots_with_prefix, fetch_prefixes_at, fetch_prefix_uptime,
+    fetch_interval_coverage_start
+)
+from app.core.config import settings
+from app.services.ripe_api import ripe_api
+from app.utils.payload_codec import decode_payload
+from app.utils.metrics import metrics
+from app.utils.prefix_set_cache import PrefixSetCache, PrefixSetEntry
+from app.utils.spill_journal import SpillJournal
+from app.services.write_buffer import write_buffer
+from app.services.retention import retention_worker, build_policies
 
 logger = logging.getLogger(__name__)
 
+# Rollups de prefix_count mantidos na ingestão: (modelo, granularidade)
+ROLLUPS = ((ASNHourlyStats, "hour"), (ASNDailyStats, "day"))
+
+# Períodos de estatística até este limite usam o rollup horário; acima, o diário
+ROLLUP_HOURLY_MAX_DAYS = 7
+
+
+def bucket_start(timestamp: datetime, unit: str) -> datetime:
+    """Início do intervalo (hora ou dia) que contém o instante informado"""
+    timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+    if unit == "day":
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+
+def to_local_naive(timestamp: datetime) -> datetime:
+    """
+    Instante no horário local sem fuso, o formato gravado no banco
+    (datetime.now()); instantes com fuso (ex.: ?ts=...Z) são convertidos
+    """
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone().replace(tzinfo=None)
+
+
+def compute_prefix_hash(prefixes) -> str:
+    """Hash estável (SHA-256) do conjunto de prefixos, independente de ordem e duplicatas"""
+    normalized = "\n".join(sorted(set(prefixes)))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def estimate_collected_bytes(item: Dict[str, Any]) -> int:
+    """
+    Memória aproximada de um snapshot coletado (strings de prefixo, ponteiros da
+    lista e payload bruto comprimido), usada como limite do buffer write-behind
+    """
+    raw_payload = item.get('raw_payload')
+    prefix_bytes = sum(len(prefix) + 57 for prefix in item['announced_prefixes'])  # str + ponteiro
+    return 256 + prefix_bytes + (raw_payload['compressed_bytes'] if raw_payload else 0)
+
+
+def normalize_prefix(prefix: str) -> Optional[str]:
+    """Prefixo em notação CIDR canônica (bits de host zerados); None se inválido"""
+    try:
+        return str(ipaddress.ip_network(prefix, strict=False))
+    except ValueError:
+        return None
+
+
+def parse_ripe_time(value: str) -> datetime:
+    """Horário do RIPE (UTC, com ou sem 'Z') em horário local ingênuo"""
+    return to_local_naive(datetime.fromisoformat(value.rstrip('Z')).replace(tzinfo=timezone.utc))
+
+
+def intervals_from_timelines(prefixes_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Converte o campo timelines do announced-prefixes (RIPE) em intervalos de presença
+    O timeline que termina no fim da janela consultada fica aberto (ainda anunciado)
+    Os horários do RIPE são UTC e são gravados em horário local, como o resto do banco
+    """
+    parsed = []
+    for record in prefixes_data:
+        prefix = normalize_prefix(record.get('prefix') or '')
+        if prefix is None:
+            continue
+        for timeline in record.get('timelines') or []:
+            try:
+                start = parse_ripe_time(timeline['starttime'])
+                end = parse_ripe_time(timeline['endtime'])
+            except (KeyError, AttributeError, ValueError):
+                continue
+            parsed.append((prefix, start, end))
+    
+    if not parsed:
+        return []
+    
+    window_end = max(end for _, _, end in parsed)
+    return [
+        {
+            'prefix': prefix,
+            'announced_from': start,
+            'announced_until': None if end >= window_end else end
+        }
+        for prefix, start, end in parsed
+    ]
+
 
 class BGPDataService:
     """Serviço para gerenciar dados BGP históricos"""
     
     def __init__(self):
-        self.ripe_api = RIPEStatAPI()
+        self.ripe_api = ripe_api  # Cliente compartilhado (pool de conexões único)
         self.last_collection_time = {}  # Cache para rate limiting por ASN
+        # Último conjunto persistido por ASN (base dos deltas/heartbeats e do conjunto atual)
+        self.prefix_cache = PrefixSetCache(settings.prefix_cache_max_asns)
+        # Snapshots que não puderam ser gravados aguardam o replay em disco
+        self.spill_journal = SpillJournal(
+            settings.spill_journal_dir,
+            settings.spill_journal_segment_mb * 1024 * 1024,
+            settings.spill_journal_enabled
+        )
     
     async def collect_asn_snapshot(self, asn: int) -> Optional[Dict[str, Any]]:
         """
         Coleta um snapshot atual do ASN e armazena no banco de dados
-        Implementa rate limiting inteligente
+        O rate limit das chamadas à API RIPE é aplicado globalmente pelo RIPEStatAPI
         """
+        collected = await self._fetch_snapshot(asn)
+        if collected is None:
+            return None
+        
+        results = await self.persist_snapshots_batch([collected])
+        return results[0] if results else None
+    
+    async def _fetch_snapshot(self, asn: int) -> Optional[Dict[str, Any]]:
+        """Coleta os dados atuais do ASN na API RIPE (sem gravar no banco)"""
         current_time = datetime.now()
         
-        # Rate limiting: mínimo 30 segundos entre coletas do mesmo ASN
+        # Evita snapshots duplicados: intervalo mínimo entre coletas do mesmo ASN
         if asn in self.last_collection_time:
             time_diff = (current_time - self.last_collection_time[asn]).total_seconds()
-            if time_diff < 30:
+            if time_diff < settings.api_rate_limit_per_asn:
                 logger.debug(f"Rate limiting: skipping ASN {asn} (last collection {time_diff}s ago)")
                 return None
         
         try:
-            # Coletar dados da API do RIPE
-            prefixes_data = await self.ripe_api.get_announced_prefixes(asn)
-            
-            # Processar dados
-            announced_prefixes = [p.get('prefix') for p in prefixes_data if p.get('prefix')]
-            prefix_count = len(announced_prefixes)
-            
-            # Criar snapshot
-            snapshot_data = {
-                'asn': asn,
-                'timestamp': current_time,
-                'announced_prefixes': announced_prefixes,
-                'prefix_count': prefix_count,
-                'is_announcing': prefix_count > 0,
-                'data_source': 'ripe',
-                'raw_data': prefixes_data
-            }
-            
-            # Armazenar no banco de dados
-            async with db_manager.get_session() as session:
-                snapshot = ASNSnapshot(**snapshot_data)
-                session.add(snapshot)
-                await session.commit()
+            fetched = await self.ripe_api.get_announced_prefix_set(asn, archive=self._archive_requested())
+        except Exception as e:
+            logger.error(f"Failed to collect snapshot for AS{asn}: {e}")
+            return None
+        
+        # Apenas as strings de prefixo e o payload bruto já comprimido (sem timelines)
+        return {
+            'asn': asn,
+            'timestamp': current_time,
+            'announced_prefixes': fetched['prefixes'],
+            'raw_payload': fetched['raw_payload']
+        }
+    
+    async def persist_snapshots_batch(self, collected: List[Dict[str, Any]],
+                                      keyframed_asns: Optional[Set[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Grava um lote de snapshots coletados em uma única transação
+        Os snapshots são inseridos com INSERT multi-linha (um round trip por
+        página de linhas) e os payloads brutos arquivados com um único INSERT
+        
+        A diferença de conjuntos em relação ao snapshot anterior é calculada uma
+        vez aqui e gravada como eventos de anúncio/retirada em prefix_history;
+        o estado corrente de cada ASN (asn_current_state) é atualizado na mesma transação
+        
+        Se o banco estiver inacessível, os snapshots vão para o spill journal e
+        são retornados com status "spilled"; outros erros (ex.: dados inválidos)
+        são registrados e o lote é descartado. Enquanto houver snapshots no
+        journal, novos lotes também vão para ele, para que o replay os grave em
+        ordem cronológica. No replay (keyframed_asns informado) não há spill e o
+        primeiro snapshot de cada ASN fora do conjunto é gravado como keyframe
+        """
+        if not collected:
+            return []
+        
+        replay = keyframed_asns is not None
+        if not replay and self.spill_journal.has_pending():
+            return self._spill_snapshots(collected)
+        
+        started = time.perf_counter()
+        rows = []
+        payloads = []
+        events = []
+        resyncs = []
+        states: Dict[int, Dict[str, Any]] = {}
+        
+        try:
+            # Gravação sempre no primário, inclusive quando chamada por rotas da API
+            async with db_manager.get_session(INGEST_POOL) as session:
+                for item in collected:
+                    asn = item['asn']
+                    current_time = item['timestamp']
+                    announced_prefixes = item['announced_prefixes']
+                    prefix_set = frozenset(announced_prefixes)
+                    prefix_hash = compute_prefix_hash(prefix_set)
+                    
+                    cached = self.prefix_cache.get(asn)
+                    if cached is None:
+                        cached = await self._restore_prefix_state(session, asn, prefix_set, prefix_hash, current_time)
+                    
+                    changed = cached is None or prefix_hash != cached.prefix_hash
+                    if settings.prefix_events_enabled and changed:
+                        previous = cached.prefixes if cached else None
+                        asn_events = self._build_prefix_events(asn, previous, prefix_set, current_time)
+                        events.extend(asn_events)
+                        if previous is None:
+                            # Conjunto anterior desconhecido: intervalos abertos são reconciliados
+                            resyncs.append((asn, current_time, [event['prefix'] for event in asn_events]))
+                    
+                    # Replay: primeiro snapshot do ASN após a falha é sempre keyframe
+                    force_keyframe = replay and asn not in keyframed_asns and asn not in states
+                    
+                    # Criar snapshot (completo, delta ou heartbeat quando nada mudou)
+                    row = {
+                        'asn': asn,
+                        'timestamp': current_time,
+                        'prefix_count': len(announced_prefixes),
+                        'prefix_hash': prefix_hash,
+                        'upstream_count': item.get('upstream_count'),
+                        'is_announcing': len(announced_prefixes) > 0,
+                        'data_source': 'ripe',
+                        'added_prefixes': None,
+                        'removed_prefixes': None,
+                        'raw_payload_hash': None,
+                        **self._build_prefix_fields(None if force_keyframe else cached, announced_prefixes,
+                                                    prefix_set, prefix_hash, current_time)
+                    }
+                    if item.get('raw_payload') is not None and self._should_archive_payload(cached, prefix_hash):
+                        payloads.append((row, item['raw_payload']))
+                    rows.append(row)
+                    
+                    # Estado atualizado já na preparação para que ASNs repetidos no
+                    # lote usem o snapshot anterior correto
+                    entry = self._remember_prefix_set(asn, cached, row['snapshot_type'], prefix_set,
+                                                      prefix_hash, current_time)
+                    
+                    # Último snapshot do ASN no lote define o estado corrente
+                    ipv6_count = sum(1 for prefix in prefix_set if ':' in prefix)
+                    states[asn] = {
+                        'asn': asn,
+                        'updated_at': current_time,
+                        'last_snapshot_type': row['snapshot_type'],
+                        'prefix_hash': prefix_hash,
+                        'prefix_count': row['prefix_count'],
+                        'ipv4_prefix_count': len(prefix_set) - ipv6_count,
+                        'ipv6_prefix_count': ipv6_count,
+                        'upstream_count': row['upstream_count'],
+                        'is_announcing': row['is_announcing'],
+                        'last_changed_at': current_time if changed else states.get(asn, {}).get('last_changed_at'),
+                        'last_keyframe_at': entry.keyframe_at,
+                        'snapshots_since_keyframe': entry.snapshots_since_keyframe
+                    }
                 
-                logger.info(f"Collected snapshot for AS{asn}: {prefix_count} prefixes")
+                if payloads:
+                    hashes = await self._archive_payloads(session, [data for _, data in payloads])
+                    for (row, _), content_hash in zip(payloads, hashes):
+                        row['raw_payload_hash'] = content_hash
                 
-                # Atualizar cache de rate limiting
-                self.last_collection_time[asn] = current_time
+                # RETURNING apenas do id: os dados do snapshot já estão em memória
+                result = await session.scalars(
+                    insert(ASNSnapshot).returning(ASNSnapshot.id, sort_by_parameter_order=True), rows
+                )
+                snapshot_ids = result.all()
+                for row, snapshot_id in zip(rows, snapshot_ids):
+                    state = states[row['asn']]
+                    if state['updated_at'] == row['timestamp']:
+                        state['last_snapshot_id'] = snapshot_id
+                await self._update_current_state(session, list(states.values()))
+                if events:
+                    await session.execute(insert(PrefixHistory), events)
+                if events or resyncs:
+                    await self._update_prefix_intervals(session, events, resyncs)
+                await self._update_rollups(session, rows)
                 
-                return snapshot.to_dict()
+                commit_started = time.perf_counter()
+                await session.commit()
+                commit_time = time.perf_counter() - commit_started
                 
         except Exception as e:
-            logger.error(f"Failed to collect snapshot for AS{asn}: {e}")
+            # Estado em memória pode não corresponder ao banco: próximo snapshot será keyframe
+            for item in collected:
+                self._forget_prefix_state(item['asn'])
+            logger.error(f"Failed to persist batch of {len(collected)} snapshots: {e}")
+            metrics.increment_counter("snapshot_batch.errors")
+            if not replay and is_connection_error(e):
+                return self._spill_snapshots(collected)
+            return []
+        
+        if replay:
+            keyframed_asns.update(row['asn'] for row in rows)
+        
+        elapsed = time.perf_counter() - started
+        metrics.increment_counter("snapshot_batch.rows", len(snapshot_ids))
+        metrics.increment_counter("prefix_events.recorded", len(events))
+        metrics.record_timing("snapshot_batch.persist", elapsed)
+        metrics.record_timing("snapshot_batch.commit", commit_time)
+        metrics.set_gauge("snapshot_batch.rows_per_second", round(len(snapshot_ids) / elapsed, 1) if elapsed > 0 else 0)
+        self._publish_cache_metrics()
+        logger.info(
+            f"Persisted {len(snapshot_ids)} snapshots in {elapsed * 1000:.1f} ms "
+            f"(commit {commit_time * 1000:.1f} ms)"
+        )
+        
+        results = []
+        for item, row, snapshot_id in zip(collected, rows, snapshot_ids):
+            # Atualizar cache de rate limiting
+            self.last_collection_time[item['asn']] = item['timestamp']
+            
+            result = ASNSnapshot(id=snapshot_id, **row).to_dict()
+            result['announced_prefixes'] = item['announced_prefixes']
+            results.append(result)
+        return results
+    
+    def _spill_snapshots(self, collected: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Grava no spill journal snapshots que não puderam ir para o banco
+        Retorna um resumo por snapshot (status "spilled"), ou lista vazia se o
+        journal também falhar
+        """
+        if not self.spill_journal.append(collected):
+            return []
+        
+        # Dados já coletados contam para o intervalo mínimo entre coletas
+        for item in collected:
+            self.last_collection_time[item['asn']] = item['timestamp']
+        metrics.increment_counter("spill_journal.spilled", len(collected))
+        logger.warning(f"Spilled {len(collected)} snapshots to journal {self.spill_journal.directory}")
+        
+        return [self._collection_summary(item, 'spilled') for item in collected]
+    
+    def _build_prefix_events(self, asn: int, previous: Optional[FrozenSet[str]],
+                             prefix_set: FrozenSet[str], timestamp: datetime) -> List[Dict[str, Any]]:
+        """
+        Eventos de anúncio/retirada entre o conjunto anterior e o atual
+        Sem conjunto anterior conhecido (primeira coleta do ASN ou nenhum
+        snapshot recente), todos os prefixos são registrados como anunciados
+        """
+        previous = previous or frozenset()
+        changes = [(prefix, True) for prefix in sorted(prefix_set - previous)]
+        changes.extend((prefix, False) for prefix in sorted(previous - prefix_set))
+        
+        events = []
+        for prefix, is_announced in changes:
+            # Coluna cidr: bits de host zerados; entradas inválidas são descartadas
+            network = normalize_prefix(prefix)
+            if network is None:
+                logger.warning(f"Skipping invalid prefix {prefix!r} for AS{asn}")
+                continue
+            events.append({
+                'prefix': network,
+                'asn': asn,
+                'timestamp': timestamp,
+                'is_announced': is_announced,
+                'origin_asn': asn,
+                'data_source': 'ripe'
+            })
+        return events
+    
+    async def _update_prefix_intervals(self, session: AsyncSession, events: List[Dict[str, Any]],
+                                       resyncs: List[Tuple[int, datetime, List[str]]]):
+        """
+        Abre e fecha intervalos de presença a partir dos eventos do lote
+        Os eventos de cada prefixo são resolvidos em memória, em ordem, para que o
+        lote use poucos statements: fechamento de intervalos abertos, inserção de
+        intervalos iniciados e encerrados no próprio lote e abertura de novos
+        """
+        table = PrefixInterval.__table__
+        
+        # Sem conjunto anterior conhecido: fecha intervalos abertos de prefixos ausentes
+        for asn, timestamp, prefixes in resyncs:
+            await session.execute(
+                update(table).where(
+                    and_(
+                        table.c.asn == asn,
+                        table.c.announced_until.is_(None),
+                        not_(table.c.prefix == any_(bindparam('current', prefixes, type_=ARRAY(CIDR))))
+                    )
+                ).values(announced_until=timestamp)
+            )
+        
+        closes = []
+        closed = []
+        opens: Dict[Tuple[int, str], datetime] = {}
+        for event in events:
+            key = (event['asn'], event['prefix'])
+            if event['is_announced']:
+                opens.setdefault(key, event['timestamp'])
+                continue
+            
+            started = opens.pop(key, None)
+            if started is None:
+                closes.append({'b_asn': key[0], 'b_prefix': key[1], 'b_until': event['timestamp']})
+            else:
+                closed.append({
+                    'asn': key[0], 'prefix': key[1],
+                    'announced_from': started, 'announced_until': event['timestamp']
+                })
+        
+        if closes:
+            await session.execute(
+                update(table).where(
+                    and_(
+                        table.c.asn == bindparam('b_asn'),
+                        table.c.prefix == cast(bindparam('b_prefix'), CIDR),
+                        table.c.announced_until.is_(None)
+                    )
+                ).values(announced_until=bindparam('b_until')),
+                closes
+            )
+        if closed:
+            await session.execute(insert(PrefixInterval), closed)
+        if opens:
+            statement = insert(PrefixInterval).on_conflict_do_nothing(
+                index_elements=['asn', 'prefix'],
+                index_where=PrefixInterval.announced_until.is_(None)
+            )
+            await session.execute(statement, [
+                {'asn': asn, 'prefix': prefix, 'announced_from': timestamp}
+                for (asn, prefix), timestamp in opens.items()
+            ])
+    
+    async def _update_rollups(self, session: AsyncSession, rows: List[Dict[str, Any]]):
+        """
+        Atualiza os rollups horário e diário com os snapshots do lote
+        Os snapshots são agregados por bucket em memória e combinados com os
+        valores existentes via upsert (um INSERT ... ON CONFLICT por tabela)
+        """
+        for model, unit in ROLLUPS:
+            buckets: Dict[Tuple[int, datetime], Dict[str, Any]] = {}
+            for row in rows:
+                key = (row['asn'], bucket_start(row['timestamp'], unit))
+                count = row['prefix_count']
+                timestamp = row['timestamp']
+                
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = {
+                        'asn': key[0],
+                        'bucket': key[1],
+                        'snapshot_count': 1,
+                        'prefix_count_sum': count,
+                        'prefix_count_sum_sq': count * count,
+                        'prefix_count_min': count,
+                        'prefix_count_max': count,
+                        'first_timestamp': timestamp,
+                        'first_prefix_count': count,
+                        'last_timestamp': timestamp,
+                        'last_prefix_count': count
+                    }
+                    continue
+                
+                bucket['snapshot_count'] += 1
+                bucket['prefix_count_sum'] += count
+                bucket['prefix_count_sum_sq'] += count * count
+                bucket['prefix_count_min'] = min(bucket['prefix_count_min'], count)
+                bucket['prefix_count_max'] = max(bucket['prefix_count_max'], count)
+                if timestamp < bucket['first_timestamp']:
+                    bucket['first_timestamp'] = timestamp
+                    bucket['first_prefix_count'] = count
+                if timestamp >= bucket['last_timestamp']:
+                    bucket['last_timestamp'] = timestamp
+                    bucket['last_prefix_count'] = count
+            
+            table = model.__table__
+            statement = insert(model)
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                index_elements=['asn', 'bucket'],
+                set_={
+                    'snapshot_count': table.c.snapshot_count + excluded.snapshot_count,
+                    'prefix_count_sum': table.c.prefix_count_sum + excluded.prefix_count_sum,
+                    'prefix_count_sum_sq': table.c.prefix_count_sum_sq + excluded.prefix_count_sum_sq,
+                    'prefix_count_min': func.least(table.c.prefix_count_min, excluded.prefix_count_min),
+                    'prefix_count_max': func.greatest(table.c.prefix_count_max, excluded.prefix_count_max),
+                    'first_prefix_count': case(
+                        (excluded.first_timestamp < table.c.first_timestamp, excluded.first_prefix_count),
+                        else_=table.c.first_prefix_count
+                    ),
+                    'first_timestamp': func.least(table.c.first_timestamp, excluded.first_timestamp),
+                    'last_prefix_count': case(
+                        (excluded.last_timestamp >= table.c.last_timestamp, excluded.last_prefix_count),
+                        else_=table.c.last_prefix_count
+                    ),
+                    'last_timestamp': func.greatest(table.c.last_timestamp, excluded.last_timestamp)
+                }
+            )
+            # executemany com statement fixo: compilado uma vez e reaproveitado do cache
+            await session.execute(statement, list(buckets.values()))
+    
+    async def _update_current_state(self, session: AsyncSession, states: List[Dict[str, Any]]):
+        """
+        Upsert do estado corrente dos ASNs do lote (uma linha por ASN)
+        Snapshots mais antigos que o estado gravado não o substituem; o instante
+        da última mudança só avança quando o hash do conjunto difere do gravado
+        """
+        table = ASNCurrentState.__table__
+        statement = insert(ASNCurrentState)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=['asn'],
+            set_={
+                'updated_at': excluded.updated_at,
+                'last_snapshot_id': excluded.last_snapshot_id,
+                'last_snapshot_type': excluded.last_snapshot_type,
+                'prefix_hash': excluded.prefix_hash,
+                'prefix_count': excluded.prefix_count,
+                'ipv4_prefix_count': excluded.ipv4_prefix_count,
+                'ipv6_prefix_count': excluded.ipv6_prefix_count,
+                'upstream_count': func.coalesce(excluded.upstream_count, table.c.upstream_count),
+                'is_announcing': excluded.is_announcing,
+                'last_changed_at': case(
+                    (table.c.prefix_hash.is_distinct_from(excluded.prefix_hash),
+                     func.coalesce(excluded.last_changed_at, excluded.updated_at)),
+                    else_=table.c.last_changed_at
+                ),
+                'last_keyframe_at': excluded.last_keyframe_at,
+                'snapshots_since_keyframe': excluded.snapshots_since_keyframe
+            },
+            where=excluded.updated_at >= table.c.updated_at
+        )
+        await session.execute(statement, states)
+    
+    def _archive_requested(self) -> bool:
+        """
+        Indica se a coleta deve comprimir o payload bruto durante a leitura
+        Na política sampled a amostragem é feita aqui; em on_change o payload é
+        comprimido sempre e descartado na gravação se o conjunto não mudou
+        """
+        policy = settings.raw_payload_policy
+        if policy == "sampled":
+            return random.random() < settings.raw_payload_sample_rate
+        return policy == "on_change"
+    
+    def _should_archive_payload(self, cached: Optional[PrefixSetEntry], prefix_hash: str) -> bool:
+        """Aplica a política de arquivamento do payload bruto (off, sampled, on_change)"""
+        policy = settings.raw_payload_policy
+        if policy == "sampled":
+            return True  # Amostragem já aplicada na coleta
+        if policy == "on_change":
+            return cached is None or prefix_hash != cached.prefix_hash
+        return False
+    
+    async def _archive_payloads(self, session: AsyncSession, payloads: List[Dict[str, Any]]) -> List[str]:
+        """
+        Grava os payloads comprimidos na coleta (linhas de raw_payloads), uma única
+        vez por conteúdo, e retorna seus hashes
+        Um payload já arquivado tem created_at renovado quando passa da metade do
+        prazo de órfãos: o conflito bloqueia a linha, então a limpeza não remove
+        um payload reutilizado por um snapshot ainda não confirmado
+        """
+        hashes = [payload['content_hash'] for payload in payloads]
+        values = {payload['content_hash']: payload for payload in payloads}
+        
+        refresh_before = func.now() - timedelta(hours=settings.raw_payload_orphan_grace_hours / 2)
+        statement = insert(RawPayload).on_conflict_do_update(
+            index_elements=['content_hash'],
+            set_={'created_at': func.now()},
+            where=RawPayload.created_at < refresh_before
+        )
+        await session.execute(statement, list(values.values()))
+        
+        metrics.increment_counter("raw_payload.archived", len(values))
+        metrics.increment_counter("raw_payload.bytes_original", sum(v['size_bytes'] for v in values.values()))
+        metrics.increment_counter("raw_payload.bytes_compressed", sum(v['compressed_bytes'] for v in values.values()))
+        return hashes
+    
+    async def get_raw_payload(self, asn: int, snapshot_id: int) -> Optional[Any]:
+        """Retorna o payload bruto de um snapshot, descomprimido sob demanda"""
+        async with db_manager.get_session() as session:
+            query = select(RawPayload.encoding, RawPayload.payload).join(
+                ASNSnapshot, ASNSnapshot.raw_payload_hash == RawPayload.content_hash
+            ).where(
+                and_(ASNSnapshot.id == snapshot_id, ASNSnapshot.asn == asn)
+            )
+            row = (await session.execute(query)).first()
+        
+        if row is None:
             return None
+        
+        return decode_payload(row.encoding, row.payload)
+    
+    async def _restore_prefix_state(self, session: AsyncSession, asn: int,
+                                    prefix_set: Optional[FrozenSet[str]] = None,
+                                    prefix_hash: Optional[str] = None,
+                                    current_time: Optional[datetime] = None,
+                                    state: Optional[ASNCurrentState] = None) -> Optional[PrefixSetEntry]:
+        """
+        Recupera do banco o último conjunto gravado do ASN (ex.: após reinício ou
+        descarte do cache) e o coloca no cache
+        O hash, o último keyframe e a contagem desde ele vêm de asn_current_state
+        (leitura pela chave primária). Se o hash coincidir com o conjunto atual,
+        o conjunto anterior é conhecido sem precisar reconstruí-lo; caso contrário
+        ele é reconstruído a partir do keyframe e dos deltas, para que os eventos
+        de prefixo e o próximo snapshot (heartbeat/delta) partam do estado correto
+        """
+        if state is None:
+            state = await session.get(ASNCurrentState, asn)
+        if state is None or state.last_keyframe_at is None:
+            return None
+        
+        # Keyframes mais antigos que a idade máxima não servem de base
+        lookback = (current_time or datetime.now()) - timedelta(hours=settings.snapshot_keyframe_max_age_hours)
+        if state.last_keyframe_at < lookback:
+            return None
+        
+        if prefix_hash is not None and state.prefix_hash == prefix_hash:
+            previous, previous_hash = prefix_set, prefix_hash
+        else:
+            previous = await self._reconstruct_prefix_set(session, asn, state.last_keyframe_at)
+            previous_hash = compute_prefix_hash(previous)
+        
+        entry = PrefixSetEntry(
+            PrefixSetEntry.compact(previous), previous_hash, state.updated_at,
+            state.last_changed_at, state.last_keyframe_at, state.snapshots_since_keyframe
+        )
+        return self.prefix_cache.put_if_absent(asn, entry)
+    
+    async def _reconstruct_prefix_set(self, session: AsyncSession, asn: int, keyframe_time: datetime,
+                                      until: Optional[datetime] = None) -> FrozenSet[str]:
+        """Aplica os deltas gravados após o keyframe (até until) e retorna o conjunto de prefixos"""
+        current: FrozenSet[str] = frozenset()
+        async for snapshot in stream_prefix_rows(session, asn, keyframe_time, until):
+            if snapshot.snapshot_type == SNAPSHOT_FULL:
+                current = frozenset(snapshot.announced_prefixes or [])
+            elif snapshot.snapshot_type == SNAPSHOT_DELTA:
+                removed = frozenset(snapshot.removed_prefixes or [])
+                current = (current - removed) | frozenset(snapshot.added_prefixes or [])
+        return current
+    
+    def _build_prefix_fields(self, cached: Optional[PrefixSetEntry], announced_prefixes: List[str],
+                             prefix_set: FrozenSet[str], prefix_hash: str,
+                             current_time: datetime) -> Dict[str, Any]:
+        """
+        Define como o conjunto de prefixos será gravado
+        Um snapshot full (keyframe) é gravado periodicamente (por quantidade de
+        snapshots e por idade máxima) ou quando o conjunto anterior não é
+        conhecido (ex.: após reinício). Nos demais, um conjunto
+        inalterado (mesmo hash) vira heartbeat e, no modo delta, alterações gravam
+        apenas os prefixos adicionados/removidos
+        """
+        previous = cached.prefixes if cached else None
+        keyframe_time = cached.keyframe_at if cached else None
+        needs_keyframe = (
+            previous is None
+            or keyframe_time is None
+            or cached.snapshots_since_keyframe >= settings.snapshot_keyframe_interval
+            or current_time - keyframe_time >= timedelta(hours=settings.snapshot_keyframe_max_age_hours)
+        )
+        
+        if needs_keyframe:
+            return {'snapshot_type': SNAPSHOT_FULL, 'announced_prefixes': announced_prefixes}
+        
+        if settings.snapshot_dedup_enabled and prefix_hash == cached.prefix_hash:
+            return {'snapshot_type': SNAPSHOT_HEARTBEAT, 'announced_prefixes': None}
+        
+        if settings.snapshot_storage_mode != "delta":
+            return {'snapshot_type': SNAPSHOT_FULL, 'announced_prefixes': announced_prefixes}
+        
+        return {
+            'snapshot_type': SNAPSHOT_DELTA,
+            'announced_prefixes': None,
+            'added_prefixes': sorted(prefix_set - previous),
+            'removed_prefixes': sorted(previous - prefix_set)
+        }
+    
+    def _remember_prefix_set(self, asn: int, cached: Optional[PrefixSetEntry], snapshot_type: str,
+                             prefix_set: FrozenSet[str], prefix_hash: str,
+                             timestamp: datetime) -> PrefixSetEntry:
+        """Registra o último conjunto persistido, base para o próximo delta/heartbeat"""
+        unchanged = cached is not None and cached.prefix_hash == prefix_hash
+        if snapshot_type == SNAPSHOT_FULL:
+            keyframe_at, since_keyframe = timestamp, 0
+        else:
+            keyframe_at, since_keyframe = cached.keyframe_at, cached.snapshots_since_keyframe + 1
+        
+        # Conjunto inalterado reaproveita a estrutura já em cache
+        entry = PrefixSetEntry(
+            cached.prefixes if unchanged else PrefixSetEntry.compact(prefix_set),
+            prefix_hash,
+            timestamp,
+            cached.changed_at if unchanged else timestamp,
+            keyframe_at,
+            since_keyframe
+        )
+        self.prefix_cache.put(asn, entry)
+        return entry
+    
+    def _publish_cache_metrics(self):
+        """Publica acertos, falhas e descartes do cache de conjuntos de prefixos"""
+        stats = self.prefix_cache.get_stats()
+        for name in ("entries", "prefixes", "hits", "misses", "evictions"):
+            metrics.set_gauge(f"prefix_cache.{name}", stats[name])
+    
+    async def warm_prefix_cache(self, asn_list: List[int]) -> int:
+        """
+        Carrega no cache o último conjunto de prefixos dos ASNs (ex.: na inicialização)
+        Estado corrente em uma consulta; conjuntos reconstruídos do keyframe e deltas
+        """
+        started = time.perf_counter()
+        asn_list = [asn for asn in asn_list if self.prefix_cache.peek(asn) is None]
+        asn_list = asn_list[:self.prefix_cache.max_entries]
+        if not asn_list:
+            return 0
+        
+        warmed = 0
+        # Cache é a base dos deltas: lido do primário, nunca da réplica
+        async with db_manager.get_session(INGEST_POOL) as session:
+            states = await self._load_current_states(session, asn_list)
+            for asn, state in states.items():
+                if await self._restore_prefix_state(session, asn, state=state) is not None:
+                    warmed += 1
+        
+        elapsed = time.perf_counter() - started
+        metrics.record_timing("prefix_cache.warm", elapsed)
+        self._publish_cache_metrics()
+        logger.info(f"Warmed prefix cache with {warmed}/{len(asn_list)} ASNs in {elapsed * 1000:.1f} ms")
+        return warmed
+    
+    async def get_current_prefixes(self, asn: int) -> Optional[Dict[str, Any]]:
+        """
+        Conjunto de prefixos atual do ASN (último snapshot gravado)
+        Servido pelo cache; em caso de falha, carregado do banco e colocado no cache
+        """
+        entry = self.prefix_cache.get(asn)
+        source = "cache"
+        if entry is None:
+            async with db_manager.get_session(INGEST_POOL) as session:
+                entry = await self._restore_prefix_state(session, asn)
+            source = "database"
+        
+        if entry is None:
+            return None
+        
+        return {
+            'asn': asn,
+            'timestamp': entry.updated_at.isoformat(),
+            'last_change': entry.changed_at.isoformat() if entry.changed_at else None,
+            'source': source,
+            'prefix_hash': entry.prefix_hash,
+            'total_prefixes': len(entry.prefixes),
+            'prefixes': sorted(entry.prefixes)
+        }
+    
+    def get_prefix_cache_stats(self) -> Dict[str, Any]:
+        """Estatísticas do cache de conjuntos de prefixos"""
+        return self.prefix_cache.get_stats()
+    
+    def _forget_prefix_state(self, asn: int):
+        """Descarta o estado em memória do ASN (será recuperado do banco na próxima coleta)"""
+        self.prefix_cache.discard(asn)
+    
+    async def _load_prefix_changes(self, session: AsyncSession, asn: int,
+                                   since: datetime) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Reconstrói a sequência de conjuntos de prefixos a partir do último snapshot
+        full anterior à janela e aplica os deltas em ordem
+
+        Retorna o número de snapshots na janela e as alterações entre snapshots
+        consecutivos da janela (ordem cronológica). Apenas o conjunto corrente é
+        mantido em memória durante a varredura.
+        """
+        # Todo snapshot tem um keyframe no máximo snapshot_keyframe_max_age_hours
+        # antes dele; limitar a busca permite o pruning de partições
+        lookback = since - timedelta(hours=settings.snapshot_keyframe_max_age_hours)
+        keyframe_query = select(ASNSnapshot.timestamp).where(
+            and_(
+                ASNSnapshot.asn == asn,
+                ASNSnapshot.snapshot_type == SNAPSHOT_FULL,
+                ASNSnapshot.timestamp <= since,
+                ASNSnapshot.timestamp >= lookback
+            )
+        ).order_by(desc(ASNSnapshot.timestamp)).limit(1)
+        keyframe_time = (await session.execute(keyframe_query)).scalar()
+        
+        current: Optional[FrozenSet[str]] = None
+        current_hash: Optional[str] = None
+        snapshot_count = 0
+        changes = []
+        
+        async for snapshot in stream_prefix_rows(session, asn, keyframe_time or since):
+            previous = current
+            unchanged = (
+                snapshot.snapshot_type == SNAPSHOT_HEARTBEAT
+                or (snapshot.prefix_hash is not None and snapshot.prefix_hash == current_hash)
+            )
+            current_hash = snapshot.prefix_hash
+            
+            if unchanged:
+                # Mesmo conjunto do snapshot anterior: sem operações de conjunto
+                if current is None:
+                    continue
+                added = removed = frozenset()
+            elif snapshot.snapshot_type == SNAPSHOT_DELTA:
+                if current is None:
+                    continue  # Delta sem keyframe base (dados anteriores removidos)
+                added = frozenset(snapshot.added_prefixes or [])
+                removed = frozenset(snapshot.removed_prefixes or [])
+                current = (current - removed) | added
+            else:
+                current = frozenset(snapshot.announced_prefixes or [])
+                added = removed = None
+            
+            if snapshot.timestamp < since:
+                continue
+            
+            snapshot_count += 1
+            # Alterações são consideradas apenas entre snapshots dentro da janela
+            if snapshot_count == 1:
+                continue
+            
+            if added is None:
+                added = current - previous
+                removed = previous - current
+            
+            if added or removed:
+                changes.append({
+                    'timestamp': snapshot.timestamp,
+                    'added_prefixes': added,
+                    'removed_prefixes': removed,
+                    'total_before': len(previous),
+                    'total_after': len(current)
+                })
+        
+        return snapshot_count, changes
+    
+    async def get_prefix_changes(self, asn: int, since: datetime) -> Tuple[int, List[Dict[str, Any]]]:
+        """Retorna o número de snapshots e as alterações de prefixos desde o instante informado"""
+        async with db_manager.get_session() as session:
+            return await self._load_prefix_changes(session, asn, since)
+    
+    async def get_change_summary(self, asn: int, since: datetime,
+                                 until: Optional[datetime] = None) -> Tuple[int, int]:
+        """
+        Conta snapshots e alterações do conjunto de prefixos em um intervalo
+        comparando apenas os hashes de snapshots consecutivos (sem carregar prefixos)
+        """
+        conditions = [ASNSnapshot.asn == asn, ASNSnapshot.timestamp >= since]
+        if until is not None:
+            conditions.append(ASNSnapshot.timestamp <= until)
+        
+        previous_hash = func.lag(ASNSnapshot.prefix_hash).over(order_by=ASNSnapshot.timestamp)
+        hashes = select(
+            ASNSnapshot.prefix_hash.label('prefix_hash'),
+            previous_hash.label('previous_hash'),
+            func.row_number().over(order_by=ASNSnapshot.timestamp).label('position')
+        ).where(and_(*conditions)).subquery()
+        
+        query = select(
+            func.count(),
+            func.count().filter(
+                and_(hashes.c.position > 1, hashes.c.prefix_hash.is_distinct_from(hashes.c.previous_hash))
+            )
+        ).select_from(hashes)
+        
+        async with db_manager.get_session() as session:
+            snapshot_count, change_count = (await session.execute(query)).one()
+            return snapshot_count, change_count
     
     async def collect_multiple_asns(self, asn_list: List[int], batch_size: int = 5) -> List[Dict[str, Any]]:
         """
-        Coleta snapshots de múltiplos ASNs com rate limiting otimizado
+        Coleta snapshots de múltiplos ASNs
+        O ritmo das requisições é controlado pelo rate limiter global da API RIPE;
+        os snapshots coletados vão para o buffer write-behind (group commit) quando
+        ativo neste loop, ou são gravados em lotes de snapshot_persist_batch_size
+        por transação
+        
+        Retorna um resumo por snapshot (asn, timestamp, prefix_count, status), com
+        status "queued" (buffer), "persisted" ou "spilled" (spill journal)
         """
         results = []
+        pending = []
+        buffered = write_buffer.accepts()
         
         # Processar em batches para não sobrecarregar a API
         for i in range(0, len(asn_list), batch_size):
             batch = asn_list[i:i + batch_size]
             
             # Criar tasks para processamento paralelo (limitado por batch)
-            tasks = [self.collect_asn_snapshot(asn) for asn in batch]
+            tasks = [self._fetch_snapshot(asn) for asn in batch]
             batch_results = await asyncio.gather(*tasks, return_exceptions=True)
             
             # Filtrar resultados válidos
             for result in batch_results:
                 if isinstance(result, dict):
-                    results.append(result)
+                    pending.append(result)
                 elif isinstance(result, Exception):
                     logger.error(f"Batch collection error: {result}")
             
-            # Delay entre batches para respeitar rate limits
-            if i + batch_size < len(asn_list):
-                await asyncio.sleep(2)  # 2 segundos entre batches
+            # Write-behind: a coleta segue sem esperar o commit (aguarda apenas se o buffer estiver cheio)
+            if buffered and pending and await write_buffer.submit("snapshot", pending):
+                results.extend(self._collection_summary(item, 'queued') for item in pending)
+                pending = []
+            elif len(pending) >= settings.snapshot_persist_batch_size:
+                results.extend(await self._persist_collected(pending))
+                pending = []
         
+        results.extend(await self._persist_collected(pending))
         return results
     
+    async def flush_snapshots(self, collected: List[Dict[str, Any]]):
+        """
+        Handler do write-behind para snapshots: levanta exceção quando o lote
+        não foi gravado nem enviado ao spill journal, para que o buffer tente
+        de novo e contabilize o descarte
+        """
+        if collected and not await self.persist_snapshots_batch(collected):
+            raise RuntimeError(f"Failed to persist {len(collected)} snapshots")
+    
+    async def _persist_collected(self, pending: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Grava um lote da coleta e retorna o resumo de cada snapshot gravado ou enviado ao journal"""
+        return [
+            {
+                'asn': result['asn'],
+                'timestamp': result['timestamp'],
+                'prefix_count': result['prefix_count'],
+                'status': result.get('status', 'persisted')
+            }
+            for result in await self.persist_snapshots_batch(pending)
+        ]
+    
+    @staticmethod
+    def _collection_summary(item: Dict[str, Any], status: str) -> Dict[str, Any]:
+        """Resumo de um snapshot coletado (ainda não gravado no banco)"""
+        return {
+            'asn': item['asn'],
+            'timestamp': item['timestamp'].isoformat(),
+            'prefix_count': len(item['announced_prefixes']),
+            'status': status
+        }
+    
     async def detect_prefix_changes(self, asn: int, hours_back: int = 24) -> List[Dict[str, Any]]:
         """
         Detecta alterações bruscas nos prefixos de um ASN nas últimas N horas
         """
         cutoff_time = datetime.now() - timedelta(hours=hours_back)
         
+        # Conjunto em cache sem mudanças desde o início da janela: nada a reconstruir
+        entry = self.prefix_cache.get(asn)
+        if entry is not None and entry.changed_at is not None and entry.changed_at < cutoff_time:
+            return []
+        
+        # Reconstruir conjuntos a partir de keyframes + deltas
+        _, prefix_changes = await self.get_prefix_changes(asn, cutoff_time)
+        
+        changes = []
+        for change in reversed(prefix_changes):  # Mais recentes primeiro
+            added = change['added_prefixes']
+            removed = change['removed_prefixes']
+            changes.append({
+                'timestamp': change['timestamp'].isoformat(),
+                'asn': asn,
+                'added_prefixes': list(added),
+                'removed_prefixes': list(removed),
+                'net_change': len(added) - len(removed),
+                'total_before': change['total_before'],
+                'total_after': change['total_after']
+            })
+        
+        return changes
+    
+    async def get_prefix_timeline(self, prefix: str, days_back: int = 30,
+                                  asn: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Linha do tempo de anúncios/retiradas de um prefixo (opcionalmente de um ASN)
+        Lida diretamente de prefix_history, sem reconstruir snapshots
+        """
+        since = datetime.now() - timedelta(days=days_back)
         async with db_manager.get_session() as session:
-            # Buscar snapshots recentes
-            query = select(ASNSnapshot).where(
-                and_(
-                    ASNSnapshot.asn == asn,
-                    ASNSnapshot.timestamp >= cutoff_time
+            events = await fetch_prefix_events(session, since, prefix=prefix, asn=asn)
+            latest = await fetch_latest_prefix_events(session, prefix, asn)
+        
+        return {
+            'prefix': prefix,
+            'days_back': days_back,
+            'total_events': len(events),
+            # Estado atual: ASNs cujo último evento do prefixo é um anúncio
+            'announced_by': [event.asn for event in latest if event.is_announced],
+            'events': [
+                {
+                    'timestamp': event.timestamp.isoformat(),
+                    'asn': event.asn,
+                    'event': 'announce' if event.is_announced else 'withdraw'
+                }
+                for event in events
+            ]
+        }
+    
+    async def get_asn_prefix_events(self, asn: int, hours_back: int = 24,
+                                    limit: int = 1000) -> List[Dict[str, Any]]:
+        """Eventos de anúncio/retirada mais recentes dos prefixos de um ASN"""
+        since = datetime.now() - timedelta(hours=hours_back)
+        async with db_manager.get_session() as session:
+            events = await fetch_prefix_events(session, since, asn=asn, limit=limit, newest_first=True)
+        
+        return [
+            {
+                'timestamp': event.timestamp.isoformat(),
+                'prefix': event.prefix,
+                'event': 'announce' if event.is_announced else 'withdraw'
+            }
+            for event in events
+        ]
+    
+    async def find_related_prefixes(self, prefix: str, relation: str = "more_specific",
+                                    days_back: int = 365, asn: Optional[int] = None,
+                                    limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Prefixos vistos no período relacionados ao prefixo informado
+        relation: "covering" (menos específicos que o contêm), "more_specific"
+        (sub-prefixos) ou "overlap" (qualquer sobreposição)
+        """
+        since = datetime.now() - timedelta(days=days_back)
+        async with db_manager.get_session() as session:
+            rows = await fetch_related_prefixes(session, relation, prefix, since, asn, limit)
+        
+        return [
+            {
+                'prefix': row.prefix,
+                'asn': row.asn,
+                'first_seen': row.first_seen.isoformat(),
+                'last_seen': row.last_seen.isoformat(),
+                'announced': row.is_announced,
+                'events': row.event_count
+            }
+            for row in rows
+        ]
+    
+    async def find_asns_with_prefix(self, prefix: str, days_back: int = 30,
+                                    asn: Optional[int] = None) -> List[Dict[str, Any]]:
+        """ASNs cujos snapshots do período continham o prefixo (busca indexada nos arrays JSONB)"""
+        since = datetime.now() - timedelta(days=days_back)
+        async with db_manager.get_session() as session:
+            rows = await fetch_snapshots_with_prefix(session, prefix, since, asn)
+        
+        return [
+            {
+                'asn': row.asn,
+                'snapshots': row.snapshot_count,
+                'first_seen': row.first_seen.isoformat(),
+                'last_seen': row.last_seen.isoformat()
+            }
+            for row in rows
+        ]
+    
+    async def find_prefixes_containing_ip(self, ip: str, days_back: int = 365,
+                                          asn: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Prefixos vistos no período que contêm o endereço IP informado"""
+        return await self.find_related_prefixes(ip, "covering", days_back, asn)
+    
+    async def seed_prefix_intervals(self, asn: int,
+                                    prefixes_data: Optional[List[Dict[str, Any]]] = None) -> int:
+        """
+        Semeia os intervalos de presença do ASN a partir do campo timelines da RIPE
+        Usa o payload bruto arquivado mais recente (ou uma nova consulta à API).
+        Intervalos registrados a partir do início da janela dos timelines são
+        substituídos e os que a atravessam são encerrados nesse instante.
+        """
+        if prefixes_data is None:
+            prefixes_data = await self._load_latest_raw_payload(asn)
+        if prefixes_data is None:
+            prefixes_data = await self.ripe_api.get_announced_prefixes(asn)
+        
+        intervals = intervals_from_timelines(prefixes_data)
+        if not intervals:
+            return 0
+        
+        window_start = min(interval['announced_from'] for interval in intervals)
+        async with db_manager.get_session() as session:
+            await session.execute(
+                delete(PrefixInterval).where(
+                    and_(PrefixInterval.asn == asn, PrefixInterval.announced_from >= window_start)
                 )
-            ).order_by(desc(ASNSnapshot.timestamp))
-            
-            result = await session.execute(query)
-            snapshots = result.scalars().all()
-            
-            if len(snapshots) < 2:
-                return []
-            
-            changes = []
-            
-            # Comparar snapshots consecutivos
-            for i in range(len(snapshots) - 1):
-                current = snapshots[i]
-                previous = snapshots[i + 1]
-                
-                current_prefixes = set(current.announced_prefixes)
-                previous_prefixes = set(previous.announced_prefixes)
-                
-                # Detectar alterações
-                added = current_prefixes - previous_prefixes
-                removed = previous_prefixes - current_prefixes
-                
-                if added or removed:
-                    change = {
-                        'timestamp': current.timestamp.isoformat(),
-                        'asn': asn,
-                        'added_prefixes': list(added),
-                        'removed_prefixes': list(removed),
-                        'net_change': len(added) - len(removed),
-                        'total_before': len(previous_prefixes),
-                        'total_after': len(current_prefixes)
-                    }
-                    changes.append(change)
-            
-            return changes
+            )
+            await session.execute(
+                update(PrefixInterval).where(
+                    and_(
+                        PrefixInterval.asn == asn,
+                        or_(
+                            PrefixInterval.announced_until.is_(None),
+                            PrefixInterval.announced_until > window_start
+                        )
+                    )
+                ).values(announced_until=window_start)
+            )
+            await session.execute(insert(PrefixInterval), [
+                {**interval, 'asn': asn, 'data_source': 'ripe_timelines'} for interval in intervals
+            ])
+            await session.commit()
+        
+        logger.info(f"Seeded {len(intervals)} prefix intervals for AS{asn} since {window_start.isoformat()}")
+        return len(intervals)
+    
+    async def _load_latest_raw_payload(self, asn: int) -> Optional[Any]:
+        """Payload bruto arquivado mais recente do ASN, descomprimido"""
+        async with db_manager.get_session() as session:
+            query = select(RawPayload.encoding, RawPayload.payload).join(
+                ASNSnapshot, ASNSnapshot.raw_payload_hash == RawPayload.content_hash
+            ).where(ASNSnapshot.asn == asn).order_by(desc(ASNSnapshot.timestamp)).limit(1)
+            row = (await session.execute(query)).first()
+        
+        if row is None:
+            return None
+        
+        return decode_payload(row.encoding, row.payload)
+    
+    async def _prefix_set_at(self, session: AsyncSession, asn: int,
+                             at: datetime) -> Tuple[Optional[FrozenSet[str]], str]:
+        """
+        Conjunto de prefixos do ASN em um instante e a origem da resposta
+        Dentro da cobertura de prefix_intervals a consulta é pontual no índice
+        GiST do período; antes dela, o conjunto é reconstruído a partir do
+        keyframe mais próximo (no máximo snapshot_keyframe_max_age_hours antes)
+        """
+        at = to_local_naive(at)
+        
+        # Instantes a partir do último snapshot: conjunto atual, direto do cache
+        entry = self.prefix_cache.get(asn)
+        if entry is not None and at >= entry.updated_at:
+            return entry.prefixes, "cache"
+        
+        coverage_start = await fetch_interval_coverage_start(session, asn)
+        if coverage_start is not None and coverage_start <= at:
+            return frozenset(await fetch_prefixes_at(session, asn, at)), "intervals"
+        
+        lookback = at - timedelta(hours=settings.snapshot_keyframe_max_age_hours)
+        keyframe_query = select(func.max(ASNSnapshot.timestamp)).where(
+            and_(
+                ASNSnapshot.asn == asn,
+                ASNSnapshot.snapshot_type == SNAPSHOT_FULL,
+                ASNSnapshot.timestamp <= at,
+                ASNSnapshot.timestamp >= lookback
+            )
+        )
+        keyframe_time = (await session.execute(keyframe_query)).scalar()
+        if keyframe_time is None:
+            return None, "none"
+        
+        return await self._reconstruct_prefix_set(session, asn, keyframe_time, at), "snapshots"
+    
+    async def get_prefixes_at(self, asn: int, at: datetime) -> Dict[str, Any]:
+        """Prefixos anunciados pelo ASN no instante informado"""
+        at = to_local_naive(at)
+        async with db_manager.get_session() as session:
+            prefixes, source = await self._prefix_set_at(session, asn, at)
+        
+        if prefixes is None:
+            return {'error': f'No data available for AS{asn} at {at.isoformat()}'}
+        
+        return {
+            'asn': asn,
+            'timestamp': at.isoformat(),
+            'source': source,
+            'total_prefixes': len(prefixes),
+            'prefixes': sorted(prefixes)
+        }
+    
+    async def get_prefix_diff(self, asn: int, start: datetime, end: datetime) -> Dict[str, Any]:
+        """Prefixos adicionados e removidos entre dois instantes arbitrários"""
+        start, end = to_local_naive(start), to_local_naive(end)
+        async with db_manager.get_session() as session:
+            before, source_from = await self._prefix_set_at(session, asn, start)
+            after, source_to = await self._prefix_set_at(session, asn, end)
+        
+        if before is None or after is None:
+            missing = start if before is None else end
+            return {'error': f'No data available for AS{asn} at {missing.isoformat()}'}
+        
+        added = sorted(after - before)
+        removed = sorted(before - after)
+        return {
+            'asn': asn,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'source': {'from': source_from, 'to': source_to},
+            'total_before': len(before),
+            'total_after': len(after),
+            'net_change': len(added) - len(removed),
+            'added_prefixes': added,
+            'removed_prefixes': removed
+        }
+    
+    async def get_prefix_uptime(self, asn: int, start: datetime, end: Optional[datetime] = None,
+                                prefix: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Disponibilidade (percentual do período anunciado) de cada prefixo do ASN
+        O fim do período é limitado ao instante atual
+        """
+        now = datetime.now()
+        start = to_local_naive(start)
+        end = min(to_local_naive(end) if end else now, now)
+        period_seconds = (end - start).total_seconds()
+        if period_seconds <= 0:
+            return {'error': 'Invalid period'}
+        
+        async with db_manager.get_session() as session:
+            rows = await fetch_prefix_uptime(session, asn, start, end, prefix)
+        
+        prefixes = [
+            {
+                'prefix': row.prefix,
+                'uptime_seconds': round(row.uptime_seconds),
+                'uptime_percent': round(100 * row.uptime_seconds / period_seconds, 3),
+                'intervals': row.interval_count,
+                'announced_at_end': row.announced_at_end
+            }
+            for row in rows
+        ]
+        
+        return {
+            'asn': asn,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'total_prefixes': len(prefixes),
+            'average_uptime_percent': round(
+                sum(p['uptime_percent'] for p in prefixes) / len(prefixes), 3
+            ) if prefixes else None,
+            'prefixes': prefixes
+        }
+    
+    async def _load_current_states(self, session: AsyncSession,
+                                   asn_list: List[int]) -> Dict[int, ASNCurrentState]:
+        """Estado corrente dos ASNs (busca pela chave primária, independente do histórico)"""
+        result = await session.scalars(select(ASNCurrentState).where(ASNCurrentState.asn.in_(asn_list)))
+        return {state.asn: state for state in result}
+    
+    async def get_current_states(self, asn_list: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Estado corrente (último snapshot) de vários ASNs"""
+        if not asn_list:
+            return {}
+        
+        async with db_manager.get_session() as session:
+            states = await self._load_current_states(session, asn_list)
+        return {asn: state.to_dict() for asn, state in states.items()}
     
     async def get_asn_statistics(self, asn: int, days_back: int = 30) -> Dict[str, Any]:
         """
         Gera estatísticas históricas de um ASN
+        Calculadas a partir dos rollups (horário até ROLLUP_HOURLY_MAX_DAYS dias,
+        diário acima disso); o início do período é arredondado para o bucket
+        """
+        statistics = await self.get_multiple_asn_statistics([asn], days_back)
+        return statistics.get(asn) or {'error': 'No data available'}
+    
+    async def get_multiple_asn_statistics(self, asn_list: List[int],
+                                          days_back: int = 30) -> Dict[int, Dict[str, Any]]:
         """
+        Estatísticas de vários ASNs com uma única consulta agrupada aos rollups
+        ASNs sem dados no período não aparecem no resultado
+        """
+        if not asn_list:
+            return {}
+        
         cutoff_time = datetime.now() - timedelta(days=days_back)
+        model, unit = ROLLUPS[0] if days_back <= ROLLUP_HOURLY_MAX_DAYS else ROLLUPS[1]
         
         async with db_manager.get_session() as session:
-            # Buscar dados históricos
-            query = select(ASNSnapshot).where(
-                and_(
-                    ASNSnapshot.asn == asn,
-                    ASNSnapshot.timestamp >= cutoff_time
-                )
-            ).order_by(ASNSnapshot.timestamp)
-            
-            result = await session.execute(query)
-            snapshots = result.scalars().all()
-            
-            if not snapshots:
-                return {'error': 'No data available'}
-            
-            # Calcular estatísticas
-            prefix_counts = [s.prefix_count for s in snapshots]
-            
-            stats = {
-                'asn': asn,
+            rows = await fetch_rollup_statistics(session, model, asn_list, bucket_start(cutoff_time, unit))
+            states = await self._load_current_states(session, asn_list)
+        
+        statistics = {}
+        for row in rows:
+            # Contagem atual e última mudança vêm do estado corrente (quando existente)
+            state = states.get(row.asn)
+            statistics[row.asn] = {
+                'asn': row.asn,
                 'period_days': days_back,
-                'total_snapshots': len(snapshots),
-                'first_snapshot': snapshots[0].timestamp.isoformat(),
-                'last_snapshot': snapshots[-1].timestamp.isoformat(),
+                'total_snapshots': row.snapshot_count,
+                'first_snapshot': row.first_timestamp.isoformat(),
+                'last_snapshot': row.last_timestamp.isoformat(),
+                'last_change': state.last_changed_at.isoformat() if state and state.last_changed_at else None,
                 'prefix_statistics': {
-                    'current_count': prefix_counts[-1],
-                    'min_count': min(prefix_counts),
-                    'max_count': max(prefix_counts),
-                    'avg_count': sum(prefix_counts) / len(prefix_counts),
-                    'variance': self._calculate_variance(prefix_counts)
+                    'current_count': state.prefix_count if state else row.current_count,
+                    'min_count': row.min_count,
+                    'max_count': row.max_count,
+                    'avg_count': row.mean,
+                    'variance': row.variance
                 },
-                'stability_score': self._calculate_stability_score(prefix_counts)
+                'stability_score': self._calculate_stability_score(row.snapshot_count, row.mean, row.variance)
             }
-            
-            return stats
-    
-    def _calculate_variance(self, values: List[int]) -> float:
-        """Calcula a variância dos valores"""
-        if len(values) < 2:
-            return 0.0
-        mean = sum(values) / len(values)
-        return sum((x - mean) ** 2 for x in values) / len(values)
+        return statistics
     
-    def _calculate_stability_score(self, prefix_counts: List[int]) -> float:
+    def _calculate_stability_score(self, count: int, mean: float, variance: float) -> float:
         """
         Calcula um score de estabilidade (0-100)
         100 = muito estável, 0 = muito instável
         """
-        if len(prefix_counts) < 2:
+        if count < 2:
             return 100.0
-            
-        variance = self._calculate_variance(prefix_counts)
-        mean = sum(prefix_counts) / len(prefix_counts)
         
         if mean == 0:
             return 0.0
@@ -218,43 +1319,16 @@ class BGPDataService:
         stability = max(0, 100 - (cv * 100))
         return round(stability, 2)
     
-    async def cleanup_old_data(self, keep_days: int = 365):
+    async def cleanup_old_data(self, keep_days: Optional[int] = None) -> Dict[str, Any]:
         """
         Remove dados antigos para manter o banco de dados otimizado
-        Mantém dados dos últimos N dias
-        """
-        cutoff_time = datetime.now() - timedelta(days=keep_days)
+        Mantém dados dos últimos N dias (padrão: DATA_RETENTION_DAYS)
         
-        async with db_manager.get_session() as session:
-            # Limpar snapshots antigos
-            deleted_snapshots = await session.execute(
-                ASNSnapshot.__table__.delete().where(
-                    ASNSnapshot.timestamp < cutoff_time
-                )
-            )
-            
-            # Limpar histórico de prefixos antigos
-            deleted_prefix_history = await session.execute(
-                PrefixHistory.__table__.delete().where(
-                    PrefixHistory.timestamp < cutoff_time
-                )
-            )
-            
-            # Limpar alertas antigos (manter apenas últimos 90 dias)
-            alert_cutoff = datetime.now() - timedelta(days=90)
-            deleted_alerts = await session.execute(
-                BGPAlert.__table__.delete().where(
-                    BGPAlert.timestamp < alert_cutoff
-                )
-            )
-            
-            await session.commit()
-            
-            logger.info(
-                f"Cleanup completed: {deleted_snapshots.rowcount} snapshots, "
-                f"{deleted_prefix_history.rowcount} prefix history, "
-                f"{deleted_alerts.rowcount} alerts deleted"
-            )
+        Delegado ao RetentionWorker: partições de meses totalmente expirados
+        são removidas (DROP/DETACH) e as linhas expiradas restantes são
+        removidas em lotes curtos, com limite de linhas/segundo e checkpoint.
+        """
+        return await retention_worker.run(build_policies(keep_days))
 
 
 # Instância global do serviço
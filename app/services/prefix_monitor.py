@@ -56,8 +56,7 @@ class PrefixMonitor:
             logger.info(f"Checking prefix announcements (count: {len(self.monitored_prefixes)})")
             
             # Busca prefixos atualmente anunciados
-            announced_prefixes = await ripe_api.get_announced_prefixes(self.target_asn)
-            announced_set = {p.get("prefix") for p in announced_prefixes}
+            announced_set = set(await ripe_api.get_prefixes(self.target_asn))
             
             for prefix_obj in self.monitored_prefixes:
                 if not prefix_obj.get("is_active"):
@@ -0,0 +1,294 @@
+"""
+Retention Worker - Remove dados expirados em lotes, sem transações longas
+"""
+import asyncio
+import json
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.database.connection import db_manager
+from app.database.partitions import PARTITIONED_TABLES, drop_partitions_before
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """Retenção de uma tabela: coluna de tempo e coluna-chave usada para os lotes"""
+
+    def __init__(self, table: str, retention_days: int,
+                 time_column: str = "timestamp", key_column: str = "id"):
+        self.table = table
+        self.retention_days = retention_days
+        self.time_column = time_column
+        self.key_column = key_column
+
+
+def build_policies(data_retention_days: Optional[int] = None) -> List[RetentionPolicy]:
+    """Políticas de retenção por tabela a partir das configurações"""
+    keep_days = data_retention_days or settings.data_retention_days
+    return [
+        RetentionPolicy("asn_snapshots", keep_days),
+        RetentionPolicy("prefix_history", settings.prefix_history_retention_days),
+        # Intervalos abertos (announced_until nulo) nunca expiram
+        RetentionPolicy("prefix_intervals", settings.prefix_history_retention_days, "announced_until"),
+        RetentionPolicy("bgp_alerts", settings.alert_retention_days),
+        RetentionPolicy("system_metrics", settings.metrics_retention_days),
+        RetentionPolicy("asn_stats_hourly", settings.rollup_hourly_retention_days, "bucket", "bucket"),
+        RetentionPolicy("asn_stats_daily", keep_days, "bucket", "bucket"),
+    ]
+
+
+class RetentionWorker:
+    """
+    Aplica a retenção de dados tabela a tabela
+
+    - Tabelas particionadas: partições de meses totalmente expirados são
+      removidas (DROP/DETACH) de uma vez
+    - Linhas expiradas restantes são removidas em lotes por faixa da chave
+      (cada lote em sua própria transação curta), com limite de linhas/segundo
+    - O progresso (última chave removida) é salvo em checkpoint para que uma
+      execução interrompida continue de onde parou
+    - ANALYZE é executado nas tabelas com muitas linhas removidas
+    - Ao final, raw_payloads que nenhum snapshot referencia (e sem uso há
+      raw_payload_orphan_grace_hours) são removidos, também em lotes; no modo
+      "detach" os payloads são mantidos para as partições arquivadas
+    """
+
+    def __init__(self):
+        self.running = False
+        self.checkpoint_path = settings.retention_checkpoint_path
+        self.checkpoints: Dict[str, Dict[str, Any]] = {}
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    async def run(self, policies: Optional[List[RetentionPolicy]] = None) -> Dict[str, Any]:
+        """Executa a retenção de todas as tabelas; ignora a chamada se já estiver em execução"""
+        if self.running:
+            logger.warning("Retention already running, skipping")
+            return {"skipped": True}
+
+        self.running = True
+        started = time.perf_counter()
+        report: Dict[str, Any] = {"started_at": datetime.now().isoformat(), "tables": {}}
+
+        try:
+            self._load_checkpoints()
+            for policy in policies or build_policies():
+                report["tables"][policy.table] = await self._apply_policy(policy)
+            # Partições desanexadas (arquivo) continuam referenciando seus payloads
+            if settings.partition_retention_mode != "detach":
+                report["tables"]["raw_payloads"] = await self._collect_orphan_payloads()
+        finally:
+            self.running = False
+
+        duration = time.perf_counter() - started
+        report["duration_seconds"] = round(duration, 2)
+        report["rows_deleted"] = sum(t["rows_deleted"] for t in report["tables"].values())
+        self.last_run = report
+
+        metrics.record_timing("retention.run", duration)
+        metrics.set_gauge("retention.last_rows_deleted", report["rows_deleted"])
+        logger.info(
+            f"Retention completed in {duration:.1f}s: {report['rows_deleted']} rows deleted, "
+            f"{sum(len(t['partitions_removed']) for t in report['tables'].values())} partitions removed"
+        )
+        return report
+
+    async def _apply_policy(self, policy: RetentionPolicy) -> Dict[str, Any]:
+        cutoff = datetime.now() - timedelta(days=policy.retention_days)
+        partitions_removed: List[str] = []
+
+        if policy.table in PARTITIONED_TABLES:
+            drop = settings.partition_retention_mode != "detach"
+            async with db_manager.get_session() as session:
+                conn = await session.connection()
+                partitions_removed = await drop_partitions_before(conn, policy.table, cutoff, drop)
+                await session.commit()
+
+        rows_deleted = await self._delete_in_batches(policy, cutoff)
+
+        if rows_deleted >= settings.retention_analyze_threshold or partitions_removed:
+            await self._analyze(policy.table)
+
+        metrics.increment_counter(f"retention.rows_deleted.{policy.table}", rows_deleted)
+        return {
+            "cutoff": cutoff.isoformat(),
+            "rows_deleted": rows_deleted,
+            "partitions_removed": partitions_removed
+        }
+
+    async def _delete_in_batches(self, policy: RetentionPolicy, cutoff: datetime) -> int:
+        """Remove as linhas expiradas em lotes ordenados pela chave"""
+        batch_size = settings.retention_batch_size
+        max_rows_per_second = settings.retention_max_rows_per_second
+        table, key, time_column = policy.table, policy.key_column, policy.time_column
+
+        def batch_statement(after_key: bool):
+            key_range = f"AND {key} > :last_key" if after_key else ""
+            return text(f"""
+                WITH batch AS (
+                    SELECT {key} FROM {table}
+                    WHERE {time_column} < :cutoff {key_range}
+                    ORDER BY {key}
+                    LIMIT :batch_size
+                )
+                DELETE FROM {table} USING batch
+                WHERE {table}.{key} = batch.{key} AND {table}.{time_column} < :cutoff
+                RETURNING {table}.{key}
+            """)
+
+        # Checkpoint vale apenas para o mesmo corte (mesma execução interrompida)
+        checkpoint = self.checkpoints.get(table)
+        last_key = checkpoint["last_key"] if checkpoint and checkpoint["cutoff"] == cutoff.date().isoformat() else None
+        if isinstance(last_key, str) and key == "bucket":
+            last_key = datetime.fromisoformat(last_key)
+
+        total = 0
+        while True:
+            batch_started = time.perf_counter()
+            async with db_manager.get_session() as session:
+                params = {"cutoff": cutoff, "batch_size": batch_size}
+                if last_key is not None:
+                    params["last_key"] = last_key
+                result = await session.execute(batch_statement(last_key is not None), params)
+                keys = result.scalars().all()
+                await session.commit()
+
+            if not keys:
+                break
+
+            total += len(keys)
+            last_key = max(keys)
+            self._save_checkpoint(table, cutoff, last_key, total)
+
+            # Limite de linhas/segundo: espera o tempo restante do lote
+            if max_rows_per_second > 0:
+                wait = len(keys) / max_rows_per_second - (time.perf_counter() - batch_started)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+        self._clear_checkpoint(table)
+        if total:
+            logger.info(f"Retention deleted {total} rows from {table} (cutoff {cutoff.isoformat()})")
+        return total
+
+    async def _collect_orphan_payloads(self) -> Dict[str, Any]:
+        """
+        Remove em lotes (por faixa de content_hash) os payloads sem snapshots
+        A condição de órfão é verificada de novo no DELETE, e created_at é
+        renovado pela ingestão ao reutilizar um payload antigo
+        """
+        batch_size = settings.retention_batch_size
+        max_rows_per_second = settings.retention_max_rows_per_second
+        grace_hours = settings.raw_payload_orphan_grace_hours
+        orphan = """
+            raw_payloads.created_at < now() - make_interval(hours => :grace_hours)
+            AND NOT EXISTS (
+                SELECT 1 FROM asn_snapshots s WHERE s.raw_payload_hash = raw_payloads.content_hash
+            )
+        """
+        statement = text(f"""
+            WITH batch AS (
+                SELECT content_hash FROM raw_payloads
+                WHERE content_hash > :last_key AND {orphan}
+                ORDER BY content_hash
+                LIMIT :batch_size
+            )
+            DELETE FROM raw_payloads USING batch
+            WHERE raw_payloads.content_hash = batch.content_hash AND {orphan}
+            RETURNING raw_payloads.content_hash
+        """)
+
+        total = 0
+        last_key = ""
+        while True:
+            batch_started = time.perf_counter()
+            async with db_manager.get_session() as session:
+                result = await session.execute(statement, {
+                    "last_key": last_key, "grace_hours": grace_hours, "batch_size": batch_size
+                })
+                keys = result.scalars().all()
+                await session.commit()
+
+            if not keys:
+                break
+
+            total += len(keys)
+            last_key = max(keys)
+
+            if max_rows_per_second > 0:
+                wait = len(keys) / max_rows_per_second - (time.perf_counter() - batch_started)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+        if total >= settings.retention_analyze_threshold:
+            await self._analyze("raw_payloads")
+        if total:
+            logger.info(f"Retention deleted {total} orphan raw payloads")
+
+        metrics.increment_counter("retention.rows_deleted.raw_payloads", total)
+        return {
+            "cutoff": (datetime.now() - timedelta(hours=grace_hours)).isoformat(),
+            "rows_deleted": total,
+            "partitions_removed": []
+        }
+
+    async def _analyze(self, table: str):
+        """Atualiza as estatísticas do planner após remoções volumosas"""
+        async with db_manager.get_session() as session:
+            await session.execute(text(f"ANALYZE {table}"))
+            await session.commit()
+        logger.info(f"Analyzed {table} after retention")
+
+    def _load_checkpoints(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return
+
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                self.checkpoints = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load retention checkpoints from {self.checkpoint_path}: {e}")
+
+    def _save_checkpoint(self, table: str, cutoff: datetime, last_key: Any, rows_deleted: int):
+        self.checkpoints[table] = {
+            "cutoff": cutoff.date().isoformat(),
+            "last_key": last_key.isoformat() if isinstance(last_key, datetime) else last_key,
+            "rows_deleted": rows_deleted,
+            "updated_at": datetime.now().isoformat()
+        }
+        self._write_checkpoints()
+
+    def _clear_checkpoint(self, table: str):
+        if self.checkpoints.pop(table, None) is not None:
+            self._write_checkpoints()
+
+    def _write_checkpoints(self):
+        if not self.checkpoint_path:
+            return
+
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.checkpoints, f)
+            os.replace(tmp_path, self.checkpoint_path)
+        except OSError as e:
+            logger.warning(f"Failed to save retention checkpoints to {self.checkpoint_path}: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Estado atual do worker (execução em andamento, checkpoints e último relatório)"""
+        return {
+            "running": self.running,
+            "checkpoints": self.checkpoints,
+            "last_run": self.last_run
+        }
+
+
+# Instância global do worker
+retention_worker = RetentionWorker()
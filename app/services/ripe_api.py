@@ -1,35 +1,396 @@
 import httpx
 import asyncio
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+import json
+import time
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import logging
 from app.core.config import settings
+from app.utils.metrics import metrics
+from app.utils.payload_codec import PayloadEncoder
+from app.utils.rate_limiter import AdaptiveRateLimiter
+from app.utils.response_cache import ResponseCache
+
+try:
+    import ijson
+except ImportError:  # Decodificação incremental é opcional
+    ijson = None
 
 logger = logging.getLogger(__name__)
 
+# Endpoints decodificados de forma incremental (respostas grandes)
+STREAMED_ENDPOINTS = ("announced-prefixes",)
+
+# Caminho dos registros de prefixo no JSON do announced-prefixes e campos mantidos
+PREFIX_ITEM_PATH = "data.prefixes.item"
+PREFIX_RECORD_FIELDS = ("prefix", "timelines")
+
+# Projeções da decodificação do announced-prefixes
+# - records: registros {prefix, timelines} (seeding de intervalos, monitoramento)
+# - prefix_set: apenas as strings de prefixo (coleta de snapshots)
+# - prefix_set_archive: strings de prefixo e o payload bruto comprimido em streaming
+PROJECTION_RECORDS = "records"
+PROJECTION_PREFIX_SET = "prefix_set"
+PROJECTION_PREFIX_SET_ARCHIVE = "prefix_set_archive"
+
+# Status HTTP que indicam que o RIPE Stat está limitando nossas requisições
+THROTTLE_STATUS_CODES = (429, 503)
+
+# Limiter único do processo, compartilhado por todos os chamadores da API RIPE
+rate_limiter = AdaptiveRateLimiter(
+    rate=settings.ripe_rate_limit_rps,
+    burst=settings.ripe_rate_limit_burst,
+    min_rate=settings.ripe_rate_limit_min_rps,
+    increase_step=settings.ripe_rate_limit_increase,
+    decrease_factor=settings.ripe_rate_limit_decrease
+)
+
+# Cache de respostas do processo para endpoints que mudam pouco
+response_cache = ResponseCache(
+    max_bytes=settings.ripe_cache_max_bytes,
+    persist_path=settings.ripe_cache_path
+)
+
+
+def _http2_available() -> bool:
+    """Verifica se o suporte a HTTP/2 (pacote h2) está instalado"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
 
 class RIPEStatAPI:
     """Cliente para interagir com a API do RIPE Stat"""
     
     def __init__(self):
         self.base_url = settings.ripe_base_url
-        self.timeout = httpx.Timeout(30.0)
+        self.timeout = httpx.Timeout(settings.http_timeout)
+        # Um cliente por event loop: conexões keep-alive pertencem ao loop que as abriu
+        self._clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self.rate_limiter = rate_limiter
+        self.cache = response_cache
+        # Requisições em andamento, para coalescer chamadas idênticas (single-flight)
+        self._inflight: Dict[Tuple, "_InflightRequest"] = {}
+    
+    def _build_client(self) -> httpx.AsyncClient:
+        """Cria um cliente HTTP com pool de conexões persistentes"""
+        http2 = settings.ripe_http2 and _http2_available()
+        if settings.ripe_http2 and not http2:
+            logger.warning("HTTP/2 requested for RIPE API but 'h2' is not installed, using HTTP/1.1")
+        
+        limits = httpx.Limits(
+            max_connections=settings.ripe_http_max_connections,
+            max_keepalive_connections=settings.ripe_http_max_keepalive,
+            keepalive_expiry=settings.ripe_http_keepalive_expiry
+        )
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=limits,
+            http2=http2,
+            headers={
+                "Accept-Encoding": "gzip, deflate",
+                "User-Agent": settings.user_agent
+            }
+        )
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Retorna o cliente do event loop corrente, criando-o sob demanda"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            # Clientes de loops já encerrados não podem mais ser usados nem fechados
+            self._clients = {
+                other: existing for other, existing in self._clients.items() if not other.is_closed()
+            }
+            client = self._clients[loop] = self._build_client()
+        return client
+    
+    async def start(self):
+        """Abre o cliente do event loop corrente e pré-aquece DNS/conexão com o RIPE Stat"""
+        client = self._get_client()
+        self.cache.load()
+        
+        if not settings.ripe_http_warmup:
+            return
+        
+        start_time = time.perf_counter()
+        try:
+            await client.head(self.base_url, extensions={"trace": self._trace})
+            metrics.record_timing("ripe_api.warmup", time.perf_counter() - start_time)
+            logger.info("RIPE API connection warm-up completed")
+        except httpx.HTTPError as e:
+            logger.warning(f"RIPE API connection warm-up failed: {str(e)}")
+    
+    async def close(self):
+        """Fecha o cliente do event loop corrente e suas conexões, persistindo o cache"""
+        self.cache.save()
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None and not client.is_closed:
+            await client.aclose()
+            logger.info("RIPE API client closed")
+    
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        """Callback de trace do httpcore usado para contar novas conexões e handshakes"""
+        if event_name == "connection.connect_tcp.complete":
+            metrics.increment_counter("ripe_api.tcp_connects")
+        elif event_name == "connection.start_tls.complete":
+            metrics.increment_counter("ripe_api.tls_handshakes")
+        
+    def _parse_retry_after(self, value: Optional[str]) -> float:
+        """Converte o header Retry-After (segundos ou data HTTP) em segundos"""
+        if not value:
+            return settings.ripe_rate_limit_backoff
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return settings.ripe_rate_limit_backoff
+        
+    def _request_key(self, endpoint: str, params: Dict[str, Any]) -> Tuple:
+        """Chave estável de uma requisição (endpoint + parâmetros normalizados)"""
+        normalized = tuple(sorted((key, str(value)) for key, value in params.items()))
+        return (id(asyncio.get_running_loop()), endpoint, normalized)
+    
+    async def _make_request(self, endpoint: str, params: Dict[str, Any],
+                            projection: str = PROJECTION_RECORDS) -> Dict[str, Any]:
+        """
+        Faz uma requisição para a API do RIPE Stat
+        Endpoints com TTL configurado são servidos do cache enquanto válidos.
+        Chamadas concorrentes idênticas aguardam uma única requisição e
+        compartilham o resultado decodificado (que deve ser tratado como somente leitura)
+        
+        A requisição roda em uma task própria: cancelar um chamador (inclusive o
+        primeiro) cancela apenas a sua espera; a task só é cancelada quando não
+        resta nenhum chamador aguardando
+        
+        projection escolhe a decodificação dos endpoints em STREAMED_ENDPOINTS;
+        apenas a projeção padrão usa o cache de respostas
+        """
+        ttl = None
+        if settings.ripe_cache_enabled and projection == PROJECTION_RECORDS:
+            ttl = settings.ripe_cache_ttls.get(endpoint)
+        cache_key = None
+        
+        if ttl:
+            cache_key = self.cache.make_key(endpoint, params)
+            entry = self.cache.get_fresh(cache_key)
+            if entry is not None:
+                metrics.increment_counter("ripe_api.cache_hits")
+                if entry["error"] is not None:
+                    raise Exception(f"RIPE API error (cached): {entry['error']}")
+                return entry["data"]
+            metrics.increment_counter("ripe_api.cache_misses")
+        
+        key = self._request_key(endpoint, params) + (projection,)
+        
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            task = asyncio.get_running_loop().create_task(
+                self._load(endpoint, params, cache_key, ttl, projection)
+            )
+            inflight = self._inflight[key] = _InflightRequest(task)
+            task.add_done_callback(lambda done: self._finish_inflight(key, done))
+        else:
+            metrics.increment_counter("ripe_api.coalesced")
+            metrics.increment_counter(f"ripe_api.coalesced.{endpoint}")
+        
+        inflight.waiters += 1
+        try:
+            return await asyncio.shield(inflight.task)
+        except asyncio.CancelledError:
+            if inflight.waiters == 1 and not inflight.task.done():
+                inflight.task.cancel()
+            raise
+        finally:
+            inflight.waiters -= 1
+    
+    def _finish_inflight(self, key: Tuple, task: asyncio.Task):
+        """Remove a requisição concluída da tabela de requisições em andamento"""
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight.task is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Evita aviso de exceção não recuperada quando ninguém aguardava
+    
+    async def _load(self, endpoint: str, params: Dict[str, Any], cache_key: Optional[str],
+                    ttl: Optional[float], projection: str = PROJECTION_RECORDS) -> Dict[str, Any]:
+        """Busca a resposta, revalidando com ETag/Last-Modified quando há entrada expirada no cache"""
+        if cache_key is None:
+            response = await self._fetch(endpoint, params)
+            return await self._decode(endpoint, response, projection)
+        
+        stale = self.cache.get(cache_key)
+        headers = {}
+        if stale is not None and stale["error"] is None:
+            if stale["etag"]:
+                headers["If-None-Match"] = stale["etag"]
+            if stale["last_modified"]:
+                headers["If-Modified-Since"] = stale["last_modified"]
+        
+        try:
+            response = await self._fetch(endpoint, params, headers)
+        except httpx.HTTPStatusError as e:
+            self.cache.put_error(cache_key, str(e), settings.ripe_cache_negative_ttl)
+            raise
         
-    async def _make_request(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        """Faz uma requisição para a API do RIPE Stat"""
+        if response.status_code == 304 and stale is not None:
+            await response.aclose()
+            metrics.increment_counter("ripe_api.cache_revalidated")
+            self.cache.refresh(cache_key, ttl)
+            return stale["data"]
+        
+        data = await self._decode(endpoint, response)
+        # Respostas com status de erro do RIPE ficam em cache apenas pelo TTL negativo
+        entry_ttl = ttl if data.get("status") == "ok" else settings.ripe_cache_negative_ttl
+        self.cache.put(
+            cache_key,
+            data,
+            entry_ttl,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+        metrics.set_gauge("ripe_api.cache_bytes", self.cache.current_bytes)
+        metrics.set_gauge("ripe_api.cache_evictions", self.cache.evictions)
+        return data
+    
+    async def _decode(self, endpoint: str, response: httpx.Response,
+                      projection: str = PROJECTION_RECORDS) -> Dict[str, Any]:
+        """Lê e decodifica o corpo de uma resposta em streaming, fechando-a ao final"""
+        try:
+            if endpoint in STREAMED_ENDPOINTS:
+                return await self._decode_prefix_records(endpoint, response, projection)
+            await response.aread()
+            return response.json()
+        finally:
+            await response.aclose()
+    
+    async def _decode_prefix_records(self, endpoint: str, response: httpx.Response,
+                                     projection: str = PROJECTION_RECORDS) -> Dict[str, Any]:
+        """
+        Decodifica o announced-prefixes registro a registro (ijson), mantendo
+        apenas os campos usados (prefix/timelines) em vez de materializar o JSON completo
+
+        Nas projeções prefix_set cada registro é descartado assim que lido: ficam
+        em memória só as strings de prefixo e, em prefix_set_archive, a saída do
+        compressor do payload bruto (raw_payload, linha de raw_payloads). Na
+        projeção records a lista de registros, com os timelines, é montada inteira.
+        Sem ijson o corpo completo é decodificado antes da projeção.
+
+        O status é derivado do HTTP (o RIPE Stat espelha status_code no status
+        da resposta), pois os campos de status vêm depois da lista de prefixos.
+        """
+        reader = _ResponseReader(response)
+        start_time = time.perf_counter()
+        prefixes = []
+        encoder = None
+        if projection == PROJECTION_PREFIX_SET_ARCHIVE:
+            encoder = PayloadEncoder(settings.raw_payload_compression_level)
+        
+        async for record in self._iter_prefix_records(reader):
+            if projection == PROJECTION_RECORDS:
+                prefixes.append(record)
+                continue
+            if record.get("prefix"):
+                prefixes.append(record["prefix"])
+            if encoder is not None:
+                encoder.add(record)
+        decode_seconds = time.perf_counter() - start_time - reader.wait_seconds
+        
+        metrics.record_timing(f"ripe_api.decode.{endpoint}", decode_seconds)
+        metrics.increment_counter(f"ripe_api.bytes_decoded.{endpoint}", reader.bytes_read)
+        metrics.increment_counter(f"ripe_api.bytes_downloaded.{endpoint}", response.num_bytes_downloaded)
+        logger.debug(
+            f"Decoded {len(prefixes)} prefix records from {endpoint}: "
+            f"{reader.bytes_read} bytes in {decode_seconds * 1000:.1f}ms"
+        )
+        
+        data = {"prefixes": prefixes}
+        if encoder is not None:
+            data["raw_payload"] = encoder.finish()
+        return {
+            "status": "ok" if response.is_success else "error",
+            "status_code": response.status_code,
+            "data": data
+        }
+    
+    async def _iter_prefix_records(self, reader: "_ResponseReader") -> AsyncIterator[Dict[str, Any]]:
+        """Gera os registros de prefixo à medida que os bytes chegam da rede"""
+        if ijson is None:
+            # Sem ijson: decodifica o corpo inteiro, mas ainda descarta campos não usados
+            body = b"".join([chunk async for chunk in reader])
+            data = json.loads(body)
+            for record in data.get("data", {}).get("prefixes", []):
+                yield self._project_prefix_record(record)
+            return
+        
+        async for record in ijson.items(reader, PREFIX_ITEM_PATH, use_float=True):
+            yield self._project_prefix_record(record)
+    
+    @staticmethod
+    def _project_prefix_record(record: Dict[str, Any]) -> Dict[str, Any]:
+        """Mantém apenas os campos usados de um registro de prefixo"""
+        return {field: record[field] for field in PREFIX_RECORD_FIELDS if field in record}
+    
+    async def _fetch(self, endpoint: str, params: Dict[str, Any],
+                     headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        Executa a requisição HTTP respeitando o rate limit global
+        A resposta é retornada em modo streaming; o chamador deve lê-la e fechá-la
+        """
         url = f"{self.base_url}/{endpoint}/data.json"
+        params = dict(params)
         
         if settings.ripe_api_key:
             params["api_key"] = settings.ripe_api_key
+        
+        client = self._get_client()
+        attempts = settings.ripe_max_retries + 1
+        
+        for attempt in range(1, attempts + 1):
+            waited = await self.rate_limiter.acquire()
+            if waited > 0:
+                metrics.record_timing("ripe_api.rate_limit_wait", waited)
+            metrics.set_gauge("ripe_api.rate_limit_rps", round(self.rate_limiter.rate, 3))
             
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            start_time = time.perf_counter()
             try:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                return response.json()
+                request = client.build_request(
+                    "GET", url, params=params, headers=headers, extensions={"trace": self._trace}
+                )
+                response = await client.send(request, stream=True)
+                
+                if response.status_code in THROTTLE_STATUS_CODES:
+                    retry_after = self._parse_retry_after(response.headers.get("Retry-After"))
+                    self.rate_limiter.record_throttle(retry_after)
+                    metrics.increment_counter("ripe_api.throttled")
+                    
+                    if attempt < attempts:
+                        await response.aclose()
+                        logger.warning(
+                            f"RIPE API throttled (HTTP {response.status_code}) - endpoint: {endpoint}, "
+                            f"attempt {attempt}/{attempts}"
+                        )
+                        continue
+                
+                if response.status_code != 304 and not response.is_success:
+                    await response.aclose()
+                    response.raise_for_status()
+                self.rate_limiter.record_success()
+                metrics.increment_counter("ripe_api.requests")
+                return response
             except httpx.HTTPError as e:
+                metrics.increment_counter("ripe_api.errors")
                 logger.error(f"RIPE API request failed - endpoint: {endpoint}, url: {url}, error: {str(e)}")
                 raise
+            finally:
+                metrics.record_timing(f"ripe_api.{endpoint}", time.perf_counter() - start_time)
     
     async def get_announced_prefixes(self, asn: int) -> List[Dict[str, Any]]:
         """Obtém todos os prefixos anunciados por um ASN"""
@@ -41,6 +402,23 @@ class RIPEStatAPI:
             
         return data.get("data", {}).get("prefixes", [])
     
+    async def get_announced_prefix_set(self, asn: int, archive: bool = False) -> Dict[str, Any]:
+        """
+        Prefixos anunciados por um ASN, apenas as strings (sem timelines)
+        Com archive, inclui em raw_payload o payload bruto comprimido durante a leitura
+        """
+        projection = PROJECTION_PREFIX_SET_ARCHIVE if archive else PROJECTION_PREFIX_SET
+        data = await self._make_request("announced-prefixes", {"resource": f"AS{asn}"}, projection)
+        
+        if data.get("status") != "ok":
+            raise Exception(f"RIPE API error: {data.get('status_code')}")
+        
+        prefix_data = data.get("data", {})
+        return {
+            "prefixes": prefix_data.get("prefixes", []),
+            "raw_payload": prefix_data.get("raw_payload")
+        }
+    
     async def get_routing_status(self, prefix: str) -> Dict[str, Any]:
         """Verifica o status de roteamento de um prefixo"""
         params = {"resource": prefix}
@@ -93,8 +471,7 @@ class RIPEStatAPI:
     
     async def get_prefixes(self, asn: int) -> List[str]:
         """Obtém lista de prefixos anunciados por um ASN"""
-        prefixes_data = await self.get_announced_prefixes(asn)
-        return [prefix_info["prefix"] for prefix_info in prefixes_data]
+        return (await self.get_announced_prefix_set(asn))["prefixes"]
     
     async def get_peers(self, asn: int) -> List[int]:
         """Obtém lista de peers de um ASN"""
@@ -133,5 +510,43 @@ class RIPEStatAPI:
         return data.get("data", {})
 
 
+class _InflightRequest:
+    """Requisição em andamento compartilhada por chamadas idênticas"""
+    
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _ResponseReader:
+    """Adapta o stream de bytes do httpx à interface read() assíncrona usada pelo ijson"""
+    
+    def __init__(self, response: httpx.Response):
+        self._chunks = response.aiter_bytes()
+        self.bytes_read = 0
+        self.wait_seconds = 0.0  # Tempo aguardando a rede (descontado do tempo de decodificação)
+    
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:  # ijson usa read(0) para detectar o tipo do stream
+            return b""
+        start_time = time.perf_counter()
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            chunk = b""
+        self.wait_seconds += time.perf_counter() - start_time
+        self.bytes_read += len(chunk)
+        return chunk
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self) -> bytes:
+        chunk = await self.read()
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+
 # Instância global do cliente RIPE
 ripe_api = RIPEStatAPI()
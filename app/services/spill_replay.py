@@ -0,0 +1,186 @@
+"""
+Spill Replay - Carrega no PostgreSQL os snapshots gravados no spill journal
+"""
+import time
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.database.connection import db_manager
+from app.database.queries import fetch_existing_snapshot_keys
+from app.services.bgp_data_service import bgp_data_service
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SpillReplayer:
+    """
+    Replay do spill journal quando o banco volta a responder
+
+    - Só executa se houver segmentos pendentes e db_manager.health_check() passar
+    - Segmentos são carregados em ordem, em lotes de snapshot_persist_batch_size
+      gravados por persist_snapshots_batch (eventos, intervalos e estado corrente
+      são atualizados como na coleta normal)
+    - Idempotente: snapshots já gravados (mesmo asn e timestamp) são ignorados,
+      então um replay interrompido pode ser repetido
+    - O primeiro snapshot de cada ASN é gravado como keyframe
+    - Um segmento só é removido depois que todos os seus lotes foram gravados
+    - Snapshots recusados pelo banco (erro de dados, não de conexão) vão para
+      um arquivo de quarentena e o replay continua
+    """
+
+    def __init__(self):
+        self.journal = bgp_data_service.spill_journal
+        self.running = False
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    async def run(self) -> Dict[str, Any]:
+        """Executa o replay de todos os segmentos pendentes"""
+        if self.running:
+            return {"skipped": True, "reason": "already running"}
+        if not self.journal.has_pending():
+            return {"skipped": True, "reason": "journal empty"}
+        if not await db_manager.health_check():
+            return {"skipped": True, "reason": "database unavailable"}
+
+        self.running = True
+        started = time.perf_counter()
+        report: Dict[str, Any] = {
+            "started_at": datetime.now().isoformat(),
+            "segments": 0,
+            "records": 0,
+            "inserted": 0,
+            "duplicates": 0,
+            "quarantined": 0,
+            "completed": True
+        }
+        keyframed: Set[int] = set()
+
+        try:
+            # Novos segmentos podem surgir durante o replay (coletas em andamento)
+            segments = self.journal.seal()
+            while segments:
+                for path in segments:
+                    if not await self._replay_segment(path, keyframed, report):
+                        report["completed"] = False
+                        return report
+                    self.journal.remove_segment(path)
+                    report["segments"] += 1
+                segments = self.journal.seal()
+        except Exception as e:
+            logger.error(f"Spill replay failed: {e}")
+            report["completed"] = False
+        finally:
+            self.running = False
+            self._finish(report, time.perf_counter() - started)
+
+        return report
+
+    async def _replay_segment(self, path: str, keyframed: Set[int], report: Dict[str, Any]) -> bool:
+        batch: List[Dict[str, Any]] = []
+        for item in self.journal.read_segment(path):
+            report["records"] += 1
+            batch.append(item)
+            if len(batch) >= settings.snapshot_persist_batch_size:
+                if not await self._replay_batch(batch, keyframed, report):
+                    return False
+                batch = []
+
+        return await self._replay_batch(batch, keyframed, report)
+
+    async def _replay_batch(self, batch: List[Dict[str, Any]], keyframed: Set[int],
+                            report: Dict[str, Any]) -> bool:
+        """Grava os snapshots do lote que ainda não estão no banco"""
+        if not batch:
+            return True
+
+        try:
+            async with db_manager.get_session() as session:
+                existing = await fetch_existing_snapshot_keys(
+                    session,
+                    {item['asn'] for item in batch},
+                    min(item['timestamp'] for item in batch),
+                    max(item['timestamp'] for item in batch)
+                )
+        except Exception as e:
+            logger.error(f"Spill replay lookup of {len(batch)} snapshots failed: {e}")
+            return await self._handle_rejected(batch, keyframed, report)
+
+        pending = []
+        for item in batch:
+            key = (item['asn'], item['timestamp'])
+            if key in existing:
+                report["duplicates"] += 1
+                continue
+            existing.add(key)  # Duplicatas dentro do próprio journal
+            pending.append(item)
+
+        if not pending:
+            return True
+
+        persisted = await bgp_data_service.persist_snapshots_batch(pending, keyframed_asns=keyframed)
+        if not persisted:
+            return await self._handle_rejected(pending, keyframed, report)
+
+        report["inserted"] += len(persisted)
+        return True
+
+    async def _handle_rejected(self, items: List[Dict[str, Any]], keyframed: Set[int],
+                               report: Dict[str, Any]) -> bool:
+        """
+        Trata um lote que falhou: com o banco inacessível o replay para e o
+        segmento fica para a próxima execução; com o banco acessível a falha é
+        dos dados, então os snapshots são regravados um a um e os recusados vão
+        para a quarentena, para que um registro inválido não bloqueie o journal
+        """
+        if not await db_manager.health_check():
+            logger.error(f"Spill replay stopped: database unavailable ({len(items)} snapshots not persisted)")
+            return False
+
+        if len(items) > 1:
+            for item in items:
+                if not await self._replay_batch([item], keyframed, report):
+                    return False
+            return True
+
+        item = items[0]
+        if not self.journal.quarantine(items):
+            return False
+        report["quarantined"] += 1
+        logger.error(
+            f"Spill replay quarantined snapshot of ASN {item['asn']} at {item['timestamp'].isoformat()} "
+            f"(rejected by the database)"
+        )
+        return True
+
+    def _finish(self, report: Dict[str, Any], duration: float):
+        report["duration_seconds"] = round(duration, 2)
+        report["rows_per_second"] = round(report["inserted"] / duration, 1) if duration > 0 else 0.0
+        self.last_run = report
+
+        metrics.record_timing("spill_replay.run", duration)
+        metrics.increment_counter("spill_replay.inserted", report["inserted"])
+        metrics.increment_counter("spill_replay.duplicates", report["duplicates"])
+        metrics.increment_counter("spill_replay.quarantined", report["quarantined"])
+        metrics.set_gauge("spill_replay.rows_per_second", report["rows_per_second"])
+        metrics.set_gauge("spill_journal.segments", len(self.journal.list_segments()))
+        logger.info(
+            f"Spill replay {'completed' if report['completed'] else 'interrupted'} in {duration:.1f}s: "
+            f"{report['inserted']} snapshots inserted ({report['rows_per_second']} rows/s), "
+            f"{report['duplicates']} duplicates skipped, {report['quarantined']} quarantined, "
+            f"{report['segments']} segments removed"
+        )
+
+    def get_status(self) -> Dict[str, Any]:
+        """Estado do journal e do último replay"""
+        return {
+            "running": self.running,
+            "journal": self.journal.get_stats(),
+            "last_run": self.last_run
+        }
+
+
+# Instância global do replayer
+spill_replayer = SpillReplayer()
@@ -0,0 +1,206 @@
+"""
+Write-behind - Agrupa gravações de snapshots e alertas em commits por lote
+"""
+import asyncio
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+FlushHandler = Callable[[List[Any]], Awaitable[Any]]
+RecordSizer = Callable[[Any], int]
+
+# Tamanho estimado de um registro de tipo registrado sem estimador
+DEFAULT_RECORD_BYTES = 512
+
+
+class WriteBehindBuffer:
+    """
+    Fila de gravação assíncrona com group commit
+
+    - Registros são agrupados por tipo ("snapshot", "alert") e gravados pelo
+      handler registrado para o tipo, uma transação por lote
+    - O flush ocorre ao atingir flush_size registros ou a cada flush_interval
+      segundos, o que vier primeiro
+    - Memória limitada: com max_records registros ou max_bytes (tamanho
+      estimado pelo sizer do tipo) pendentes ou em gravação, submit() aguarda
+      o próximo flush (backpressure sobre a coleta); um registro maior que
+      max_bytes só entra com o buffer vazio
+    - Um lote cujo handler levanta exceção é tentado mais uma vez; se falhar de
+      novo, é descartado, contado em write_buffer.dropped.<tipo> e registrado
+      no log (quantidade e ASNs)
+    - O buffer pertence ao event loop em que foi iniciado (o da aplicação);
+      chamadas de outros loops (ex.: scripts) recebem False e devem gravar diretamente
+    """
+
+    def __init__(self, max_records: int, max_bytes: int, flush_size: int, flush_interval: float):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.handlers: Dict[str, FlushHandler] = {}
+        self.sizers: Dict[str, RecordSizer] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[str, List[Tuple[Any, int]]] = {}  # (registro, bytes estimados)
+        self._size = 0  # Registros pendentes + em gravação
+        self._bytes = 0  # Bytes estimados pendentes + em gravação
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+
+    def register(self, kind: str, handler: FlushHandler, sizer: Optional[RecordSizer] = None):
+        """
+        Define a função que grava um lote de registros do tipo informado e,
+        opcionalmente, a que estima o tamanho em bytes de um registro
+        """
+        self.handlers[kind] = handler
+        if sizer is not None:
+            self.sizers[kind] = sizer
+
+    def start(self):
+        """Inicia a tarefa de flush no event loop corrente"""
+        if self._task is not None:
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+        self._task = self.loop.create_task(self._run())
+        logger.info(
+            f"Write-behind buffer started (flush {self.flush_size} records / {self.flush_interval}s, "
+            f"max {self.max_records} records / {self.max_bytes // (1024 * 1024)} MB)"
+        )
+
+    def accepts(self) -> bool:
+        """Indica se o buffer está ativo e pode ser usado a partir do loop corrente"""
+        if self._task is None or self._closing:
+            return False
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def submit(self, kind: str, records: List[Any]) -> bool:
+        """
+        Enfileira registros para gravação em lote
+        Retorna False (nada enfileirado) se o buffer não estiver ativo neste loop
+        """
+        if kind not in self.handlers or not self.accepts():
+            return False
+
+        sizer = self.sizers.get(kind)
+        for record in records:
+            record_bytes = sizer(record) if sizer else DEFAULT_RECORD_BYTES
+            while self._size and (self._size >= self.max_records or self._bytes + record_bytes > self.max_bytes):
+                metrics.increment_counter("write_buffer.backpressure_waits")
+                self._wakeup.set()
+                self._space.clear()
+                await self._space.wait()
+
+            self._pending.setdefault(kind, []).append((record, record_bytes))
+            self._size += 1
+            self._bytes += record_bytes
+
+        if self._size >= self.flush_size:
+            self._wakeup.set()
+        self._publish_depth()
+        return True
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Grava todos os registros pendentes (lotes de até flush_size por transação)"""
+        async with self._flush_lock:
+            batches, self._pending = self._pending, {}
+            flushed = 0
+
+            for kind, records in batches.items():
+                handler = self.handlers[kind]
+                for start in range(0, len(records), self.flush_size):
+                    chunk = records[start:start + self.flush_size]
+                    started = time.perf_counter()
+                    try:
+                        await self._write_chunk(kind, handler, [record for record, _ in chunk])
+                    finally:
+                        metrics.record_timing("write_buffer.flush", time.perf_counter() - started)
+                        self._size -= len(chunk)
+                        self._bytes -= sum(record_bytes for _, record_bytes in chunk)
+                        flushed += len(chunk)
+                        self._space.set()
+
+            self._publish_depth()
+            return flushed
+
+    def _publish_depth(self):
+        metrics.set_gauge("write_buffer.depth", self._size)
+        metrics.set_gauge("write_buffer.bytes", self._bytes)
+
+    async def _write_chunk(self, kind: str, handler: FlushHandler, chunk: List[Any]):
+        """Grava um lote, com uma nova tentativa; na segunda falha o lote é descartado"""
+        for attempt in (1, 2):
+            try:
+                await handler(chunk)
+                metrics.increment_counter(f"write_buffer.flushed.{kind}", len(chunk))
+                return
+            except Exception as e:
+                logger.error(f"Write-behind flush of {len(chunk)} {kind} records failed (attempt {attempt}): {e}")
+                metrics.increment_counter("write_buffer.flush_errors")
+
+        metrics.increment_counter(f"write_buffer.dropped.{kind}", len(chunk))
+        asns = sorted({record.get('asn') for record in chunk if isinstance(record, dict) and record.get('asn')})
+        logger.error(f"Write-behind dropped {len(chunk)} {kind} records (ASNs {asns})")
+
+    async def close(self):
+        """Interrompe o flush periódico e grava tudo o que estiver pendente"""
+        if self._task is None:
+            return
+
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+        flushed = await self.flush()
+        self._space.set()
+        logger.info(f"Write-behind buffer closed ({flushed} records flushed on shutdown)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado atual do buffer"""
+        return {
+            "running": self._task is not None,
+            "depth": self._size,
+            "bytes": self._bytes,
+            "pending": {kind: len(records) for kind, records in self._pending.items()},
+            "max_records": self.max_records,
+            "max_bytes": self.max_bytes,
+            "flush_size": self.flush_size,
+            "flush_interval": self.flush_interval
+        }
+
+
+# Instância global do buffer (iniciado pelo scheduler no event loop da aplicação)
+write_buffer = WriteBehindBuffer(
+    settings.write_behind_max_records,
+    settings.write_behind_max_mb * 1024 * 1024,
+    settings.write_behind_flush_size,
+    settings.write_behind_flush_interval
+)
@@ -14,6 +14,9 @@ class SimpleMetrics:
         self.alert_counters = {}
         self.component_status = {}
         self.last_checks = {}
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
     
     def record_alert(self, alert_type: str, severity: str):
         """Registra um novo alerta"""
@@ -40,6 +43,37 @@ class SimpleMetrics:
         """Registra requisição à API do RIPE"""
         logger.debug("API request recorded", endpoint=endpoint, success=success)
     
+    def increment_counter(self, name: str, value: int = 1):
+        """Incrementa um contador genérico"""
+        self.counters[name] = self.counters.get(name, 0) + value
+    
+    def set_gauge(self, name: str, value: float):
+        """Define o valor atual de um gauge"""
+        self.gauges[name] = value
+    
+    def record_timing(self, name: str, duration: float):
+        """Registra uma amostra de duração (segundos) agregada por nome"""
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+            self.timings[name] = timing
+        timing["count"] += 1
+        timing["total"] += duration
+        timing["last"] = duration
+        timing["max"] = max(timing["max"], duration)
+    
+    def get_timing_summary(self) -> Dict[str, Any]:
+        """Retorna as durações agregadas com média calculada"""
+        return {
+            name: {
+                "count": timing["count"],
+                "avg_ms": round(timing["total"] / timing["count"] * 1000, 2) if timing["count"] else 0.0,
+                "max_ms": round(timing["max"] * 1000, 2),
+                "last_ms": round(timing["last"] * 1000, 2)
+            }
+            for name, timing in self.timings.items()
+        }
+    
     def get_system_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas do sistema"""
         uptime = int(time.time() - self.start_time)
@@ -52,7 +86,10 @@ class SimpleMetrics:
             "healthy_components": healthy_components,
             "total_components": len(self.component_status),
             "last_checks": self.last_checks,
-            "alert_breakdown": self.alert_counters
+            "alert_breakdown": self.alert_counters,
+            "counters": self.counters,
+            "gauges": self.gauges,
+            "timings": self.get_timing_summary()
         }
 
 
@@ -0,0 +1,95 @@
+"""
+Compressão de payloads brutos da API RIPE para arquivamento
+"""
+import gzip
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional; gzip é usado como alternativa
+    zstandard = None
+
+ENCODING_ZSTD = "zstd"
+ENCODING_GZIP = "gzip"
+
+
+def canonical_json(data: Any) -> bytes:
+    """Serialização estável: payloads iguais geram os mesmos bytes (e o mesmo hash)"""
+    return json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def encode_payload(data: Any, level: int = 3) -> Tuple[str, str, bytes, int]:
+    """
+    Serializa e comprime um payload
+    Retorna (hash do conteúdo, codificação, bytes comprimidos, tamanho original)
+    """
+    raw = canonical_json(data)
+    content_hash = hashlib.sha256(raw).hexdigest()
+
+    if zstandard is not None:
+        compressed = zstandard.ZstdCompressor(level=level).compress(raw)
+        return content_hash, ENCODING_ZSTD, compressed, len(raw)
+
+    return content_hash, ENCODING_GZIP, gzip.compress(raw, compresslevel=min(level, 9)), len(raw)
+
+
+class PayloadEncoder:
+    """
+    Serializa e comprime uma lista item a item, sem montar a lista em memória
+    O resultado (hash, bytes) é idêntico ao de encode_payload(lista); apenas a
+    saída comprimida é mantida
+    """
+
+    def __init__(self, level: int = 3):
+        self._hash = hashlib.sha256()
+        self._chunks = []
+        self._size = 0
+        self._items = 0
+        if zstandard is not None:
+            self.encoding = ENCODING_ZSTD
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self.encoding = ENCODING_GZIP
+            self._compressor = zlib.compressobj(min(level, 9), zlib.DEFLATED, 31)  # 31 = formato gzip
+        self._write(b"[")
+
+    def add(self, item: Any):
+        """Acrescenta um item da lista"""
+        self._write((b"," if self._items else b"") + canonical_json(item))
+        self._items += 1
+
+    def finish(self) -> Dict[str, Any]:
+        """Fecha a lista e retorna os campos de uma linha de raw_payloads"""
+        self._write(b"]")
+        self._chunks.append(self._compressor.flush())
+        payload = b"".join(self._chunks)
+        return {
+            "content_hash": self._hash.hexdigest(),
+            "encoding": self.encoding,
+            "payload": payload,
+            "size_bytes": self._size,
+            "compressed_bytes": len(payload)
+        }
+
+    def _write(self, data: bytes):
+        self._hash.update(data)
+        self._size += len(data)
+        self._chunks.append(self._compressor.compress(data))
+
+
+def decode_payload(encoding: str, payload: bytes) -> Any:
+    """Descomprime e decodifica um payload arquivado"""
+    if encoding == ENCODING_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to decode zstd payloads")
+        # decompressobj: frames do PayloadEncoder não informam o tamanho original
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+    elif encoding == ENCODING_GZIP:
+        raw = gzip.decompress(payload)
+    else:
+        raise ValueError(f"Unknown payload encoding: {encoding}")
+
+    return json.loads(raw)
@@ -0,0 +1,121 @@
+"""
+Cache em memória do conjunto de prefixos mais recente de cada ASN
+"""
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, FrozenSet, Iterable, Optional
+
+
+class PrefixSetEntry:
+    """
+    Último conjunto de prefixos gravado de um ASN
+
+    O conjunto é imutável (frozenset de strings internadas, compartilhadas entre
+    entradas) e a entrada inteira é substituída a cada snapshot gravado. Também
+    guarda a base da codificação delta: último keyframe e snapshots desde ele.
+    """
+
+    __slots__ = ("prefixes", "prefix_hash", "updated_at", "changed_at",
+                 "keyframe_at", "snapshots_since_keyframe")
+
+    def __init__(self, prefixes: FrozenSet[str], prefix_hash: str, updated_at: datetime,
+                 changed_at: Optional[datetime], keyframe_at: Optional[datetime],
+                 snapshots_since_keyframe: int = 0):
+        self.prefixes = prefixes
+        self.prefix_hash = prefix_hash
+        self.updated_at = updated_at  # Instante do último snapshot
+        self.changed_at = changed_at  # Última mudança do conjunto (None = desconhecida)
+        self.keyframe_at = keyframe_at
+        self.snapshots_since_keyframe = snapshots_since_keyframe
+
+    @staticmethod
+    def compact(prefixes: Iterable[str]) -> FrozenSet[str]:
+        """Conjunto imutável com as strings dos prefixos internadas"""
+        return frozenset(sys.intern(prefix) for prefix in prefixes)
+
+
+class PrefixSetCache:
+    """
+    Cache LRU limitado por número de ASNs
+
+    Leituras contam acertos/falhas (get) ou não afetam as estatísticas (peek).
+    Ao exceder o limite, o ASN usado há mais tempo é descartado; o estado dele
+    é recuperado do banco na próxima coleta.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, PrefixSetEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, asn: int) -> Optional[PrefixSetEntry]:
+        """Retorna a entrada do ASN (contabilizando acerto/falha) e a marca como usada"""
+        with self._lock:
+            entry = self._entries.get(asn)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(asn)
+            return entry
+
+    def peek(self, asn: int) -> Optional[PrefixSetEntry]:
+        """Retorna a entrada sem alterar estatísticas nem a ordem LRU"""
+        with self._lock:
+            return self._entries.get(asn)
+
+    def put(self, asn: int, entry: PrefixSetEntry):
+        """Armazena (ou substitui) a entrada do ASN"""
+        with self._lock:
+            self._entries[asn] = entry
+            self._entries.move_to_end(asn)
+            self._evict()
+
+    def put_if_absent(self, asn: int, entry: PrefixSetEntry) -> PrefixSetEntry:
+        """
+        Armazena a entrada apenas se o ASN não estiver no cache
+        Usado ao carregar do banco: não sobrescreve um estado mais novo gravado
+        pela ingestão nesse meio tempo. Retorna a entrada em cache.
+        """
+        with self._lock:
+            current = self._entries.get(asn)
+            if current is not None:
+                return current
+            self._entries[asn] = entry
+            self._evict()
+            return entry
+
+    def discard(self, asn: int):
+        """Remove o ASN do cache"""
+        with self._lock:
+            self._entries.pop(asn, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas de ocupação e acertos do cache"""
+        with self._lock:
+            entries = len(self._entries)
+            prefixes = sum(len(entry.prefixes) for entry in self._entries.values())
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "prefixes": prefixes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+        }
@@ -0,0 +1,80 @@
+"""
+Rate limiter adaptativo (token bucket + AIMD) compartilhado pelo processo
+"""
+import asyncio
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket global com ajuste AIMD da taxa de requisições
+
+    - Cada requisição reserva um token; se o balde estiver vazio, o chamador
+      aguarda o tempo necessário para o token ser reposto
+    - Sucessos aumentam a taxa de forma aditiva até o limite configurado
+    - Respostas 429/503 reduzem a taxa de forma multiplicativa e bloqueiam
+      novas requisições até o fim do Retry-After
+
+    A contabilidade usa um lock de thread (e não asyncio.Lock) para que o mesmo
+    limiter seja seguro entre o event loop da API e o do scheduler.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float,
+                 increase_step: float, decrease_factor: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min(min_rate, rate)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        """Repõe tokens proporcionalmente ao tempo decorrido"""
+        elapsed = now - self.updated_at
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """Reserva um token e retorna quantos segundos o chamador deve aguardar"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    async def acquire(self) -> float:
+        """Aguarda até que a requisição possa ser feita; retorna o tempo esperado"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_success(self):
+        """Aumento aditivo da taxa após uma resposta bem-sucedida"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def record_throttle(self, retry_after: float):
+        """Redução multiplicativa da taxa e bloqueio até o fim do Retry-After"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = min(self.tokens, 0.0)
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+        logger.warning(
+            f"RIPE API throttled: rate reduced to {self.rate:.2f} req/s, "
+            f"pausing requests for {retry_after:.1f}s"
+        )
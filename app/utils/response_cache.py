@@ -0,0 +1,158 @@
+"""
+Cache TTL em memória para respostas da API RIPE Stat
+"""
+import json
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Cache LRU com TTL por entrada e limite de memória
+
+    Cada entrada guarda a resposta decodificada junto com os validadores HTTP
+    (ETag/Last-Modified), permitindo revalidação condicional após expirar.
+    Entradas de erro (cache negativo) são mantidas apenas em memória.
+    O tamanho de uma entrada é o do objeto armazenado serializado em JSON
+    compacto (sem compressão); max_bytes limita a soma desses tamanhos.
+    """
+
+    def __init__(self, max_bytes: int, persist_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.persist_path = persist_path
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(endpoint: str, params: Dict[str, Any]) -> str:
+        """Gera a chave de cache a partir do endpoint e parâmetros"""
+        query = "&".join(f"{key}={params[key]}" for key in sorted(params))
+        return f"{endpoint}?{query}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada (mesmo expirada) e a marca como usada recentemente"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get_fresh(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada apenas se ainda estiver dentro do TTL"""
+        entry = self.get(key)
+        if entry is not None and entry["expires_at"] > time.time():
+            return entry
+        return None
+
+    @staticmethod
+    def estimate_size(data: Any) -> int:
+        """Tamanho do objeto armazenado, serializado em JSON compacto"""
+        return len(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    def put(self, key: str, data: Dict[str, Any], ttl: float,
+            etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Armazena uma resposta bem-sucedida"""
+        self._store(key, {
+            "data": data,
+            "error": None,
+            "expires_at": time.time() + ttl,
+            "etag": etag,
+            "last_modified": last_modified,
+            "size": self.estimate_size(data)
+        })
+
+    def put_error(self, key: str, error: str, ttl: float):
+        """Armazena um erro (cache negativo) por um TTL curto"""
+        self._store(key, {
+            "data": None,
+            "error": error,
+            "expires_at": time.time() + ttl,
+            "etag": None,
+            "last_modified": None,
+            "size": len(error)
+        })
+
+    def refresh(self, key: str, ttl: float) -> Optional[Dict[str, Any]]:
+        """Renova o TTL de uma entrada revalidada (HTTP 304)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["expires_at"] = time.time() + ttl
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key: str, entry: Dict[str, Any]):
+        if entry["size"] > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous["size"]
+
+            self._entries[key] = entry
+            self.current_bytes += entry["size"]
+
+            # Remove as entradas menos usadas até respeitar o limite de memória
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted["size"]
+                self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas de ocupação do cache"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions
+        }
+
+    def load(self):
+        """Carrega entradas válidas persistidas em disco"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load RIPE response cache from {self.persist_path}: {e}")
+            return
+
+        now = time.time()
+        loaded = 0
+        for key, entry in stored.items():
+            # Entradas expiradas com validadores ainda servem para revalidação
+            if entry["expires_at"] > now or entry.get("etag") or entry.get("last_modified"):
+                entry["size"] = self.estimate_size(entry["data"])
+                self._store(key, entry)
+                loaded += 1
+
+        logger.info(f"Loaded {loaded} RIPE response cache entries from disk")
+
+    def save(self):
+        """Persiste as entradas de sucesso em disco (escrita atômica)"""
+        if not self.persist_path:
+            return
+
+        with self._lock:
+            stored = {key: entry for key, entry in self._entries.items() if entry["error"] is None}
+
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.persist_path)
+            logger.info(f"Saved {len(stored)} RIPE response cache entries to disk")
+        except OSError as e:
+            logger.warning(f"Failed to save RIPE response cache to {self.persist_path}: {e}")
@@ -0,0 +1,168 @@
+"""
+Journal local (append-only, gzip JSONL) de snapshots que não puderam ser gravados
+"""
+import base64
+import gzip
+import json
+import os
+import threading
+import zlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "snapshots-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+QUARANTINE_PREFIX = "quarantine-"
+
+
+class SpillJournal:
+    """
+    Snapshots coletados gravados em disco quando o PostgreSQL está indisponível
+
+    - Cada append grava um membro gzip com uma linha JSON por snapshot e faz
+      fsync; o arquivo continua legível como um único stream gzip
+    - O journal é dividido em segmentos; o segmento ativo é fechado (seal) ao
+      atingir segment_bytes ou quando o replay começa, e novos appends vão para
+      um novo segmento
+    - Segmentos são lidos em ordem de criação e removidos após o replay
+    - Snapshots recusados pelo banco no replay vão para arquivos de quarentena
+      (quarantine-AAAAMMDD.jsonl.gz), que o replay ignora
+    - Uma linha final truncada (queda durante o append) é descartada na leitura
+    """
+
+    def __init__(self, directory: str, segment_bytes: int, enabled: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.enabled = enabled
+        self._active: Optional[str] = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def append(self, items: List[Dict[str, Any]]) -> bool:
+        """Grava os snapshots no segmento ativo; retorna False se não foi possível"""
+        if not self.enabled or not items:
+            return False
+
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                if self._active is None or self._size(self._active) >= self.segment_bytes:
+                    self._active = self._new_segment_path()
+                self._write(self._active, items)
+                return True
+            except OSError as e:
+                logger.error(f"Failed to append {len(items)} snapshots to spill journal: {e}")
+                return False
+
+    def quarantine(self, items: List[Dict[str, Any]]) -> bool:
+        """
+        Grava snapshots recusados pelo banco no arquivo de quarentena do dia
+        (mesmo formato dos segmentos, mas fora do replay; inspeção manual)
+        """
+        path = os.path.join(self.directory, f"{QUARANTINE_PREFIX}{datetime.now().strftime('%Y%m%d')}{SEGMENT_SUFFIX}")
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self._write(path, items)
+                return True
+            except OSError as e:
+                logger.error(f"Failed to quarantine {len(items)} snapshots: {e}")
+                return False
+
+    def _write(self, path: str, items: List[Dict[str, Any]]):
+        """Acrescenta os snapshots ao arquivo como um membro gzip e faz fsync"""
+        lines = "".join(json.dumps(self._encode(item), separators=(",", ":")) + "\n" for item in items)
+        with open(path, "ab") as f:
+            f.write(gzip.compress(lines.encode("utf-8"), compresslevel=6))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def has_pending(self) -> bool:
+        """Indica se há segmentos aguardando replay"""
+        return self.enabled and bool(self.list_segments())
+
+    def seal(self) -> List[str]:
+        """Fecha o segmento ativo e retorna todos os segmentos prontos para replay"""
+        with self._lock:
+            self._active = None
+            return self.list_segments()
+
+    def list_segments(self) -> List[str]:
+        """Segmentos existentes em ordem de criação"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(names)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        ]
+
+    def read_segment(self, path: str) -> Iterator[Dict[str, Any]]:
+        """Snapshots de um segmento, na ordem em que foram gravados"""
+        line_number = 0
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    line_number += 1
+                    try:
+                        yield self._decode(json.loads(line))
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"Skipping invalid record {path}:{line_number}: {e}")
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            # Último append incompleto: registros anteriores continuam válidos
+            logger.warning(f"Spill segment {path} truncated after {line_number} records: {e}")
+
+    def remove_segment(self, path: str):
+        """Remove um segmento já carregado no banco"""
+        with self._lock:
+            if path == self._active:
+                self._active = None
+            os.remove(path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Segmentos pendentes, tamanho em disco e arquivos de quarentena"""
+        segments = self.list_segments()
+        try:
+            quarantined = [name for name in os.listdir(self.directory) if name.startswith(QUARANTINE_PREFIX)]
+        except FileNotFoundError:
+            quarantined = []
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "segments": len(segments),
+            "bytes": sum(self._size(path) for path in segments),
+            "quarantine_files": sorted(quarantined)
+        }
+
+    def _new_segment_path(self) -> str:
+        self._sequence += 1
+        name = f"{SEGMENT_PREFIX}{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{self._sequence:06d}{SEGMENT_SUFFIX}"
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _encode(item: Dict[str, Any]) -> Dict[str, Any]:
+        record = {**item, "timestamp": item["timestamp"].isoformat()}
+        raw_payload = item.get("raw_payload")
+        if raw_payload is not None:
+            record["raw_payload"] = {**raw_payload, "payload": base64.b64encode(raw_payload["payload"]).decode("ascii")}
+        return record
+
+    @staticmethod
+    def _decode(record: Dict[str, Any]) -> Dict[str, Any]:
+        record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+        raw_payload = record.get("raw_payload")
+        if raw_payload is not None:
+            raw_payload["payload"] = base64.b64decode(raw_payload["payload"])
+        return record
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Benchmark das consultas ao banco de dados do BGP Monitor
+Autor: netovaat
+
+Mede tempo e volume de dados (bytes das colunas retornadas) dos caminhos de
+consulta sobre asn_snapshots. Usa o banco configurado no .env.
+
+Uso:
+    python scripts/benchmark_banco.py --seed 2000   # popula um ASN sintético
+    python scripts/benchmark_banco.py --seed-year   # 1 ano de coletas (5 min) + rollups
+    python scripts/benchmark_banco.py --seed 300 --seed-asns 50  # 50 ASNs sintéticos
+    python scripts/benchmark_banco.py --seed-intervals 1000  # 1 ano de intervalos de presença
+    python scripts/benchmark_banco.py --index-rows 1000000   # B-tree vs BRIN em timestamp
+    python scripts/benchmark_banco.py --asn 64512 --hours 48
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import and_, func, select, text  # noqa: E402
+from sqlalchemy.orm import load_only, undefer_group  # noqa: E402
+
+from app.database.connection import db_manager  # noqa: E402
+from app.database.queries import (  # noqa: E402
+    fetch_count_baselines, fetch_prefix_counts, fetch_prefixes_at, fetch_snapshots_with_prefix
+)
+from app.models.database import ASNSnapshot, PrefixInterval, SNAPSHOT_FULL  # noqa: E402
+from app.services.bgp_data_service import bgp_data_service, ROLLUPS  # noqa: E402
+
+SYNTHETIC_ASN = 64512  # ASN privado usado para dados sintéticos
+
+
+async def popular_asn_sintetico(asn: int, snapshots: int, prefixes: int, first_prefix: int = 0):
+    """Insere snapshots completos sintéticos (um a cada 5 minutos até agora)"""
+    now = datetime.now()
+    prefix_list = [f"10.{i // 256 % 256}.{i % 256}.0/24" for i in range(first_prefix, first_prefix + prefixes)]
+    rows = [
+        {
+            'asn': asn,
+            'timestamp': now - timedelta(minutes=5 * k),
+            'snapshot_type': SNAPSHOT_FULL,
+            'announced_prefixes': prefix_list,
+            'prefix_count': prefixes,
+            'is_announcing': True,
+            'data_source': 'benchmark'
+        }
+        for k in range(snapshots)
+    ]
+
+    async with db_manager.get_session() as session:
+        await session.execute(ASNSnapshot.__table__.insert(), rows)
+        await session.commit()
+    print(f"✅ {snapshots} snapshots sintéticos inseridos para AS{asn} ({prefixes} prefixos cada)")
+
+
+async def popular_ano_sintetico(asn: int):
+    """Insere 1 ano de coletas a cada 5 minutos (heartbeats) e reconstrói os rollups do ASN"""
+    async with db_manager.get_session() as session:
+        await session.execute(text("""
+            INSERT INTO asn_snapshots (asn, timestamp, snapshot_type, prefix_count, is_announcing, data_source)
+            SELECT :asn, ts, 'heartbeat', 1000 + (extract(epoch FROM ts)::bigint / 300 % 37)::int, true, 'benchmark'
+            FROM generate_series(now() - interval '365 days', now(), interval '5 minutes') AS ts
+        """), {"asn": asn})
+
+        for model, unit in ROLLUPS:
+            table = model.__tablename__
+            await session.execute(text(f"DELETE FROM {table} WHERE asn = :asn"), {"asn": asn})
+            await session.execute(text(f"""
+                INSERT INTO {table}
+                SELECT asn, date_trunc('{unit}', timestamp) AS bucket, count(*), sum(prefix_count),
+                       sum(prefix_count::bigint * prefix_count), min(prefix_count), max(prefix_count),
+                       min(timestamp), (array_agg(prefix_count ORDER BY timestamp))[1],
+                       max(timestamp), (array_agg(prefix_count ORDER BY timestamp DESC))[1]
+                FROM asn_snapshots WHERE asn = :asn
+                GROUP BY asn, bucket
+            """), {"asn": asn})
+        await session.commit()
+    print(f"✅ 1 ano de snapshots sintéticos inserido para AS{asn} (rollups reconstruídos)")
+
+
+async def popular_intervalos_sinteticos(asn: int, prefixes: int):
+    """Insere 1 ano de intervalos de presença: cada prefixo anunciado 20h por dia, com início defasado"""
+    async with db_manager.get_session() as session:
+        await session.execute(text("DELETE FROM prefix_intervals WHERE asn = :asn"), {"asn": asn})
+        await session.execute(text("""
+            INSERT INTO prefix_intervals (asn, prefix, announced_from, announced_until, data_source)
+            SELECT :asn,
+                   format('10.%s.%s.0/24', i / 256 % 256, i % 256)::cidr,
+                   day + make_interval(hours => i % 24),
+                   day + make_interval(hours => i % 24 + 20),
+                   'benchmark'
+            FROM generate_series(0, :prefixes - 1) AS i,
+                 generate_series(date_trunc('day', now()) - interval '365 days',
+                                 date_trunc('day', now()), interval '1 day') AS day
+        """), {"asn": asn, "prefixes": prefixes})
+        await session.commit()
+    print(f"✅ 1 ano de intervalos sintéticos inserido para AS{asn} ({prefixes} prefixos)")
+
+
+async def vacuum_analyze(tables=("asn_snapshots",)):
+    """VACUUM ANALYZE após popular: estatísticas atualizadas e lista pendente do GIN incorporada ao índice"""
+    async with db_manager.engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in tables:
+            await conn.execute(text(f"VACUUM ANALYZE {table}"))
+            print(f"✅ VACUUM ANALYZE {table}")
+
+
+async def bytes_das_colunas(session, columns, where) -> int:
+    """Soma do tamanho (pg_column_size) das colunas retornadas pela consulta"""
+    size = sum((func.coalesce(func.pg_column_size(column), 0) for column in columns[1:]),
+               func.coalesce(func.pg_column_size(columns[0]), 0))
+    result = await session.execute(select(func.sum(size)).where(where))
+    return int(result.scalar() or 0)
+
+
+async def medir(nome: str, consulta, session, columns, where):
+    """Executa a consulta e imprime linhas, tempo e bytes transferidos"""
+    started = time.perf_counter()
+    rows = await consulta()
+    elapsed = (time.perf_counter() - started) * 1000
+    transferred = await bytes_das_colunas(session, columns, where)
+    print(f"  {nome:<38} {len(rows):>7} linhas {elapsed:>9.1f} ms {transferred / 1024:>11.1f} KiB")
+
+
+async def benchmark_projecao(asn: int, hours: int):
+    """Compara objetos ORM completos, load_only e consulta projetada"""
+    since = datetime.now() - timedelta(hours=hours)
+    where = and_(ASNSnapshot.asn == asn, ASNSnapshot.timestamp >= since)
+    all_columns = list(ASNSnapshot.__table__.columns)
+    header_columns = [
+        ASNSnapshot.id, ASNSnapshot.asn, ASNSnapshot.timestamp, ASNSnapshot.snapshot_type,
+        ASNSnapshot.prefix_count, ASNSnapshot.prefix_hash, ASNSnapshot.is_announcing
+    ]
+
+    print(f"\n📊 Série de prefix_count de AS{asn} (últimas {hours}h)")
+    async with db_manager.get_session() as session:
+        async def orm_completo():
+            query = select(ASNSnapshot).options(undefer_group("prefixes")).where(where)
+            return (await session.execute(query)).scalars().all()
+
+        async def orm_load_only():
+            query = select(ASNSnapshot).options(load_only(*header_columns)).where(where)
+            return (await session.execute(query)).scalars().all()
+
+        async def projetada():
+            return await fetch_prefix_counts(session, asn, since)
+
+        await medir("ORM completo (todas as colunas)", orm_completo, session, all_columns, where)
+        session.expunge_all()
+        await medir("ORM com load_only", orm_load_only, session, header_columns, where)
+        session.expunge_all()
+        await medir("Projetada (timestamp, prefix_count)", projetada, session,
+                    [ASNSnapshot.timestamp, ASNSnapshot.prefix_count], where)
+
+
+def estatisticas_python(counts):
+    """Implementação anterior em Python (média, variância populacional, min, max)"""
+    mean = sum(counts) / len(counts)
+    variance = sum((x - mean) ** 2 for x in counts) / len(counts) if len(counts) > 1 else 0.0
+    return mean, variance, min(counts), max(counts)
+
+
+def comparar(nome: str, esperado, obtido):
+    """Confere se dois resultados numéricos coincidem"""
+    iguais = all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6) for a, b in zip(esperado, obtido))
+    print(f"  {'✅' if iguais else '❌'} {nome}: {tuple(round(v, 4) for v in obtido)}")
+
+
+async def benchmark_estatisticas(asn: int, days: int):
+    """Compara estatísticas calculadas em Python com agregados SQL e rollups"""
+    since = datetime.now() - timedelta(days=days)
+    print(f"\n📊 Estatísticas de prefix_count de AS{asn} (últimos {days} dias)")
+
+    async with db_manager.get_session() as session:
+        started = time.perf_counter()
+        rows = await fetch_prefix_counts(session, asn, since)
+        python_result = estatisticas_python([row.prefix_count for row in rows])
+        python_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        query = select(
+            func.avg(ASNSnapshot.prefix_count), func.var_pop(ASNSnapshot.prefix_count),
+            func.min(ASNSnapshot.prefix_count), func.max(ASNSnapshot.prefix_count)
+        ).where(and_(ASNSnapshot.asn == asn, ASNSnapshot.timestamp >= since))
+        sql_result = tuple(float(v) for v in (await session.execute(query)).one())
+        sql_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    stats = await bgp_data_service.get_asn_statistics(asn, days)
+    rollup_ms = (time.perf_counter() - started) * 1000
+    prefix_stats = stats['prefix_statistics']
+    rollup_result = (prefix_stats['avg_count'], prefix_stats['variance'],
+                     prefix_stats['min_count'], prefix_stats['max_count'])
+
+    print(f"  {'Python sobre linhas':<38} {len(rows):>7} linhas {python_ms:>9.1f} ms")
+    print(f"  {'Agregados SQL (asn_snapshots)':<38} {1:>7} linhas {sql_ms:>9.1f} ms")
+    print(f"  {'Rollups (get_asn_statistics)':<38} {1:>7} linhas {rollup_ms:>9.1f} ms")
+    comparar("agregados SQL", python_result, sql_result)
+    # Rollups arredondam o início do período para o bucket; compara no mesmo intervalo
+    print(f"  ℹ️  rollups: {tuple(round(v, 4) for v in rollup_result)} ({stats['total_snapshots']} snapshots)")
+
+
+async def benchmark_baseline(asn: int):
+    """Compara o baseline de anomalias (48h) em Python com a consulta de janela no PostgreSQL"""
+    since = datetime.now() - timedelta(hours=48)
+    print(f"\n📊 Baseline de anomalias de AS{asn} (48h)")
+
+    async with db_manager.get_session() as session:
+        started = time.perf_counter()
+        rows = await fetch_prefix_counts(session, asn, since, newest_first=True)
+        counts = [row.prefix_count for row in rows]
+        python_result = (statistics.mean(counts[10:]), statistics.stdev(counts[10:]))
+        python_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        baselines = await fetch_count_baselines(session, [asn], since)
+        sql_ms = (time.perf_counter() - started) * 1000
+
+    print(f"  {'Python (statistics)':<38} {len(rows):>7} linhas {python_ms:>9.1f} ms")
+    print(f"  {'Janela + agregados SQL':<38} {len(baselines):>7} linhas {sql_ms:>9.1f} ms")
+    comparar("baseline SQL", python_result, (baselines[0].baseline_mean, baselines[0].baseline_std))
+
+
+async def benchmark_contencao(prefix: str, days: int):
+    """Compara a busca de ASNs que continham um prefixo: varredura + decodificação vs @> com GIN"""
+    since = datetime.now() - timedelta(days=days)
+    print(f"\n📊 ASNs cujos snapshots continham {prefix} (últimos {days} dias)")
+
+    async with db_manager.get_session() as session:
+        started = time.perf_counter()
+        query = select(ASNSnapshot.asn, ASNSnapshot.announced_prefixes, ASNSnapshot.added_prefixes).where(
+            ASNSnapshot.timestamp >= since
+        )
+        scanned = 0
+        scan_asns = set()
+        for asn, announced, added in await session.execute(query):
+            scanned += 1
+            if prefix in (announced or []) or prefix in (added or []):
+                scan_asns.add(asn)
+        scan_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        rows = await fetch_snapshots_with_prefix(session, prefix, since)
+        gin_ms = (time.perf_counter() - started) * 1000
+
+        plan = await session.execute(text(
+            "EXPLAIN SELECT asn FROM asn_snapshots WHERE timestamp >= :since "
+            "AND (announced_prefixes @> CAST(:needle AS jsonb) OR added_prefixes @> CAST(:needle AS jsonb))"
+        ), {"since": since, "needle": f'["{prefix}"]'})
+        uses_gin = any("Bitmap Index Scan" in line for line in plan.scalars())
+
+    print(f"  {'Varredura + decodificação em Python':<38} {scanned:>7} linhas {scan_ms:>9.1f} ms")
+    print(f"  {'Contenção JSONB (@>)':<38} {len(rows):>7} linhas {gin_ms:>9.1f} ms")
+    iguais = scan_asns == {row.asn for row in rows}
+    print(f"  {'✅' if iguais else '❌'} mesmos ASNs ({len(scan_asns)}); índice GIN no plano: {'sim' if uses_gin else 'não'}")
+
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def benchmark_instante(asn: int, days: int, amostras: int):
+    """Compara o conjunto de prefixos em instantes aleatórios: faixa GiST (@>) vs predicado em btree"""
+    now = datetime.now()
+    instantes = [now - timedelta(seconds=random.uniform(0, days * 86400)) for _ in range(amostras)]
+    print(f"\n📊 Prefixos de AS{asn} em {amostras} instantes aleatórios (últimos {days} dias)")
+
+    async def btree(session, at):
+        query = select(PrefixInterval.prefix).where(
+            and_(
+                PrefixInterval.asn == asn,
+                PrefixInterval.announced_from <= at,
+                (PrefixInterval.announced_until.is_(None)) | (PrefixInterval.announced_until > at)
+            )
+        )
+        return [str(prefix) for prefix in (await session.execute(query)).scalars()]
+
+    async def gist(session, at):
+        return await fetch_prefixes_at(session, asn, at)
+
+    tempos = {}
+    resultados = {}
+    async with db_manager.get_session() as session:
+        for nome, consulta in (("Predicado btree (asn, announced_from)", btree), ("Faixa tsrange GiST (@>)", gist)):
+            tempos[nome] = []
+            resultados[nome] = []
+            for at in instantes:
+                started = time.perf_counter()
+                prefixes = await consulta(session, at)
+                tempos[nome].append((time.perf_counter() - started) * 1000)
+                resultados[nome].append(frozenset(prefixes))
+
+        plan = await session.execute(text(
+            "EXPLAIN SELECT prefix FROM prefix_intervals WHERE asn = :asn "
+            "AND tsrange(announced_from, announced_until, '[)') @> CAST(:at AS timestamp)"
+        ), {"asn": asn, "at": instantes[0]})
+        uses_gist = any("idx_prefix_intervals_asn_period" in line for line in plan.scalars())
+
+    for nome, valores in tempos.items():
+        media = statistics.mean(valores)
+        print(f"  {nome:<38} média {media:>7.2f} ms   p95 {percentil(valores, 0.95):>7.2f} ms")
+
+    started = time.perf_counter()
+    diff = await bgp_data_service.get_prefix_diff(asn, instantes[0], instantes[-1])
+    diff_ms = (time.perf_counter() - started) * 1000
+    if 'error' not in diff:
+        print(f"  {'Diff entre dois instantes (serviço)':<38} "
+              f"+{len(diff['added_prefixes'])}/-{len(diff['removed_prefixes'])} {diff_ms:>9.1f} ms")
+
+    nomes = list(resultados)
+    iguais = resultados[nomes[0]] == resultados[nomes[1]]
+    print(f"  {'✅' if iguais else '❌'} mesmos conjuntos; índice GiST no plano: {'sim' if uses_gist else 'não'}")
+
+
+# Conjuntos de índices comparados em tabelas temporárias com o layout de asn_snapshots
+CONJUNTOS_INDICES = {
+    "B-trees (antes da revisão 011)": [
+        "CREATE INDEX ON {table} (asn, timestamp)",
+        "CREATE INDEX ON {table} (timestamp, asn)",
+        "CREATE INDEX ON {table} (timestamp)",
+        "CREATE INDEX ON {table} (asn)",
+    ],
+    "(asn, timestamp) + BRIN": [
+        "CREATE INDEX ON {table} (asn, timestamp)",
+        "CREATE INDEX ON {table} USING brin (timestamp) WITH (pages_per_range = 32)",
+    ],
+}
+
+
+async def benchmark_indices_tempo(linhas: int, amostras: int, lote: int = 50000):
+    """
+    Compara vazão de inserção e latência de varredura por faixa de tempo entre os
+    índices B-tree antigos e o BRIN em timestamp (tabelas temporárias, dados em ordem de tempo)
+    """
+    print(f"\n📊 Índices de timestamp: {linhas} inserções em ordem de tempo, {amostras} faixas de 1h")
+    asns = 100
+    inicio = datetime.now() - timedelta(minutes=5 * (linhas // asns))
+
+    async with db_manager.get_session() as session:
+        for k, (nome, indices) in enumerate(CONJUNTOS_INDICES.items()):
+            table = f"bench_indices_{k}"
+            await session.execute(text(
+                f"CREATE TEMP TABLE {table} (LIKE asn_snapshots INCLUDING DEFAULTS) ON COMMIT PRESERVE ROWS"
+            ))
+            for ddl in indices:
+                await session.execute(text(ddl.format(table=table)))
+
+            started = time.perf_counter()
+            for offset in range(0, linhas, lote):
+                await session.execute(text(f"""
+                    INSERT INTO {table} (asn, timestamp, snapshot_type, prefix_count, is_announcing, data_source)
+                    SELECT 64512 + n % {asns}, CAST(:inicio AS timestamp) + make_interval(mins => 5 * (n / {asns})),
+                           'heartbeat', 1000, true, 'benchmark'
+                    FROM generate_series(CAST(:first AS integer), CAST(:last AS integer)) AS n
+                """), {"inicio": inicio, "first": offset, "last": min(offset + lote, linhas) - 1})
+            await session.commit()
+            insert_s = time.perf_counter() - started
+
+            # Autovacuum não processa tabelas temporárias: resume as faixas BRIN explicitamente
+            await session.execute(text(
+                "SELECT brin_summarize_new_values(indexrelid) FROM pg_index "
+                "JOIN pg_class ON pg_class.oid = indexrelid JOIN pg_am ON pg_am.oid = relam "
+                f"WHERE indrelid = '{table}'::regclass AND amname = 'brin'"
+            ))
+            await session.execute(text(f"ANALYZE {table}"))
+            tamanho = (await session.execute(text(
+                f"SELECT pg_indexes_size('{table}')"
+            ))).scalar()
+
+            span = (datetime.now() - inicio).total_seconds() - 3600
+            tempos = []
+            for _ in range(amostras):
+                since = inicio + timedelta(seconds=random.uniform(0, max(span, 0)))
+                started = time.perf_counter()
+                await session.execute(text(
+                    f"SELECT count(*), max(prefix_count) FROM {table} "
+                    f"WHERE timestamp >= :since AND timestamp < :until"
+                ), {"since": since, "until": since + timedelta(hours=1)})
+                tempos.append((time.perf_counter() - started) * 1000)
+
+            print(f"  {nome:<38} {linhas / insert_s:>9.0f} linhas/s   "
+                  f"faixa média {statistics.mean(tempos):>6.2f} ms p95 {percentil(tempos, 0.95):>6.2f} ms   "
+                  f"índices {tamanho / 1024 / 1024:>7.1f} MiB")
+            await session.execute(text(f"DROP TABLE {table}"))
+            await session.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark das consultas do BGP Monitor")
+    parser.add_argument("--asn", type=int, default=SYNTHETIC_ASN, help="ASN analisado")
+    parser.add_argument("--hours", type=int, default=48, help="Janela de tempo (horas)")
+    parser.add_argument("--seed", type=int, default=0, help="Snapshots sintéticos a inserir antes")
+    parser.add_argument("--prefixes", type=int, default=1000, help="Prefixos por snapshot sintético")
+    parser.add_argument("--seed-year", action="store_true", help="Insere 1 ano de coletas sintéticas")
+    parser.add_argument("--days", type=int, default=365, help="Período das estatísticas (dias)")
+    parser.add_argument("--seed-asns", type=int, default=1, help="ASNs sintéticos (prefixos distintos) a popular com --seed")
+    parser.add_argument("--prefix", default="10.0.0.0/24", help="Prefixo da busca por contenção")
+    parser.add_argument("--seed-intervals", type=int, default=0, help="Prefixos com 1 ano de intervalos sintéticos")
+    parser.add_argument("--samples", type=int, default=200, help="Instantes aleatórios consultados")
+    parser.add_argument("--index-rows", type=int, default=0, help="Linhas do comparativo B-tree vs BRIN (0 = não executa)")
+    args = parser.parse_args()
+
+    print("🔍 Benchmark de consultas do BGP Monitor")
+    print("-" * 80)
+    try:
+        if args.seed:
+            for k in range(args.seed_asns):
+                await popular_asn_sintetico(args.asn + k, args.seed, args.prefixes, k * args.prefixes)
+        if args.seed_year:
+            await popular_ano_sintetico(args.asn)
+        if args.seed_intervals:
+            await popular_intervalos_sinteticos(args.asn, args.seed_intervals)
+        if args.seed or args.seed_year or args.seed_intervals:
+            await vacuum_analyze(("asn_snapshots", "prefix_intervals"))
+        await benchmark_projecao(args.asn, args.hours)
+        await benchmark_estatisticas(args.asn, args.days)
+        await benchmark_baseline(args.asn)
+        await benchmark_contencao(args.prefix, min(args.days, 30))
+        await benchmark_instante(args.asn, args.days, args.samples)
+        if args.index_rows:
+            await benchmark_indices_tempo(args.index_rows, args.samples)
+    finally:
+        await db_manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Semeia a tabela prefix_intervals a partir dos timelines da RIPE
+Autor: netovaat
+
+Para cada ASN, usa o payload bruto arquivado mais recente (ou consulta a API
+announced-prefixes) e converte o campo timelines em intervalos de presença.
+
+Uso:
+    python scripts/semear_intervalos.py            # todos os ASNs habilitados
+    python scripts/semear_intervalos.py 13335 15169
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.asn_config import asn_config_manager  # noqa: E402
+from app.database.connection import db_manager  # noqa: E402
+from app.services.bgp_data_service import bgp_data_service  # noqa: E402
+
+
+async def semear(asns):
+    """Semeia os intervalos de cada ASN e imprime o resumo"""
+    print(f"🔍 Semeando intervalos de presença de {len(asns)} ASNs")
+    print("-" * 50)
+
+    total = 0
+    falhas = 0
+    try:
+        await db_manager.initialize()
+        for asn in asns:
+            try:
+                intervalos = await bgp_data_service.seed_prefix_intervals(asn)
+                total += intervalos
+                print(f"✅ AS{asn}: {intervalos} intervalos")
+            except Exception as e:
+                falhas += 1
+                print(f"❌ AS{asn}: {e}")
+    finally:
+        await bgp_data_service.ripe_api.close()
+        await db_manager.close()
+
+    print("-" * 50)
+    print(f"📊 {total} intervalos semeados, {falhas} falhas")
+    return falhas == 0
+
+
+if __name__ == "__main__":
+    asns = [int(arg) for arg in sys.argv[1:]] or asn_config_manager.get_enabled_asns()
+    sys.exit(0 if asyncio.run(semear(asns)) else 1)
@@ -0,0 +1,73 @@
+"""
+Testes do cliente RIPE Stat: coalescência de requisições idênticas (single-flight)
+"""
+import asyncio
+import unittest
+
+import httpx
+
+from app.services.ripe_api import RIPEStatAPI
+
+
+class CoalescedRequestTests(unittest.IsolatedAsyncioTestCase):
+    """Chamadas concorrentes idênticas compartilham uma única requisição HTTP"""
+
+    async def asyncSetUp(self):
+        self.requests = 0
+        self.release = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            self.requests += 1
+            await self.release.wait()
+            return httpx.Response(200, json={"status": "ok", "data": {"routes": []}})
+
+        self.api = RIPEStatAPI()
+        self.api._clients[asyncio.get_running_loop()] = httpx.AsyncClient(
+            transport=httpx.MockTransport(handler)
+        )
+
+    async def asyncTearDown(self):
+        await self.api._clients.pop(asyncio.get_running_loop()).aclose()
+
+    async def _start_calls(self, count: int):
+        calls = [asyncio.create_task(self.api.get_as_path_length("192.0.2.0/24")) for _ in range(count)]
+        while not self.requests:
+            await asyncio.sleep(0)
+        return calls
+
+    async def test_concurrent_calls_share_one_request(self):
+        calls = await self._start_calls(5)
+        self.release.set()
+
+        results = await asyncio.gather(*calls)
+
+        self.assertEqual(self.requests, 1)
+        self.assertEqual(results, [[]] * 5)
+
+    async def test_cancelling_first_caller_does_not_cancel_followers(self):
+        leader, *followers = await self._start_calls(5)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(await asyncio.gather(*followers), [[]] * 4)
+        self.assertEqual(self.requests, 1)
+
+    async def test_request_cancelled_when_all_callers_cancel(self):
+        calls = await self._start_calls(3)
+        inflight = next(iter(self.api._inflight.values()))
+
+        for call in calls:
+            call.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        self.assertTrue(inflight.task.cancelled())
+        self.assertEqual(self.api._inflight, {})
+
+
+if __name__ == "__main__":
+    unittest.main()